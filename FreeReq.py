@@ -3,39 +3,53 @@ The following tables are generated by: https://tableconvert.com/csv-to-ascii
 
 This file includes following class:
 
-+------------------------+------------------------------------------------------------------------------------------+
-| Core Class             | Usage                                                                                    |
-+------------------------+------------------------------------------------------------------------------------------+
-| ReqNode                | The croe data structure for requirement data management.                                 |
-+------------------------+------------------------------------------------------------------------------------------+
-| IReqObserver           | The interface of IReqAgent observer.                                                     |
-+------------------------+------------------------------------------------------------------------------------------+
-| IReqAgent              | The interface to manage requirement data storage and access.                             |
-+------------------------+------------------------------------------------------------------------------------------+
-| ReqSingleJsonFileAgent | The implementation of IReqAgent that supports json file local storage.                   |
-+------------------------+------------------------------------------------------------------------------------------+
-| ReqModel               | The Model for QTreeView. Adapting IReqAgent to QAbstractItemModel.                       |
-+------------------------+------------------------------------------------------------------------------------------+
-| ReqEditorBoard         | The UI for Reqirement data editing.                                                      |
-+------------------------+------------------------------------------------------------------------------------------+
-| ReqMetaBoard           | The UI for Meta data config.                                                             |
-+------------------------+------------------------------------------------------------------------------------------+
-| RequirementUI          | The main UI. Includes the TreeView/ReqEditorBoard/ReqMetaBoard                           |
-+------------------------+------------------------------------------------------------------------------------------+
-
-+------------------------+------------------------------------------------------------------------------------------+
-| Helper Class           | Usage                                                                                    |
-+------------------------+------------------------------------------------------------------------------------------+
-| ObserverNotifier       | The observer notification helper.                                                        |
-+------------------------+------------------------------------------------------------------------------------------+
-| Hookable               | A decorator to make a function can be easily hooked.                                     |
-+------------------------+------------------------------------------------------------------------------------------+
-| MarkdownEditor         | A custom Markdown editor.                                                                |
-+------------------------+------------------------------------------------------------------------------------------+
-| WebViewPrinter         | PDF printing class with QWebEngineView.                                                  |
-+------------------------+------------------------------------------------------------------------------------------+
-| IndexListUI            | A widget that shows Req Index and jump to specified Req on clicking. For search feature. |
-+------------------------+------------------------------------------------------------------------------------------+
++-------------------------+------------------------------------------------------------------------------------------+
+| Core Class              | Usage                                                                                    |
++-------------------------+------------------------------------------------------------------------------------------+
+| ReqNode                 | The croe data structure for requirement data management.                                 |
++-------------------------+------------------------------------------------------------------------------------------+
+| IReqObserver            | The interface of IReqAgent observer.                                                     |
++-------------------------+------------------------------------------------------------------------------------------+
+| IReqAgent               | The interface to manage requirement data storage and access.                             |
++-------------------------+------------------------------------------------------------------------------------------+
+| ReqSingleJsonFileAgent  | The implementation of IReqAgent that supports json file local storage.                   |
++-------------------------+------------------------------------------------------------------------------------------+
+| ReqModel                | The Model for QTreeView. Adapting IReqAgent to QAbstractItemModel.                       |
++-------------------------+------------------------------------------------------------------------------------------+
+| ReqUndoStack            | The undo / redo history of req editing. Keeps the inverse operations only.               |
++-------------------------+------------------------------------------------------------------------------------------+
+| ReqEditorBoard          | The UI for Reqirement data editing.                                                      |
++-------------------------+------------------------------------------------------------------------------------------+
+| ReqMetaBoard            | The UI for Meta data config.                                                             |
++-------------------------+------------------------------------------------------------------------------------------+
+| RequirementUI           | The main UI. Includes the TreeView/ReqEditorBoard/ReqMetaBoard                           |
++-------------------------+------------------------------------------------------------------------------------------+
+
++-------------------------+------------------------------------------------------------------------------------------+
+| Helper Class            | Usage                                                                                    |
++-------------------------+------------------------------------------------------------------------------------------+
+| ObserverNotifier        | The observer notification helper.                                                        |
++-------------------------+------------------------------------------------------------------------------------------+
+| Hookable                | A decorator to make a function can be easily hooked.                                     |
++-------------------------+------------------------------------------------------------------------------------------+
+| MarkdownEditor          | A custom Markdown editor.                                                                |
++-------------------------+------------------------------------------------------------------------------------------+
+| WebViewPrinter          | PDF printing class with a pool of QWebEngineView.                                        |
++-------------------------+------------------------------------------------------------------------------------------+
+| ReqJsonCodec            | The JSON encoder / decoder of req file. Uses orjson or ujson if installed.               |
++-------------------------+------------------------------------------------------------------------------------------+
+| ReqSaveWorker           | The background thread that writes req file.                                              |
++-------------------------+------------------------------------------------------------------------------------------+
+| ReqTextIndex            | The inverted full-text index for searching Req.                                          |
++-------------------------+------------------------------------------------------------------------------------------+
+| ReqQueryEngine          | The structured query (by field value) of Req.                                            |
++-------------------------+------------------------------------------------------------------------------------------+
+| MarkdownRenderCache     | The LRU cache of rendered markdown html.                                                 |
++-------------------------+------------------------------------------------------------------------------------------+
+| MarkdownRenderScheduler | Debounced, worker thread markdown rendering for the preview.                             |
++-------------------------+------------------------------------------------------------------------------------------+
+| IndexListUI             | A widget that shows Req Index and jump to specified Req on clicking. For search feature. |
++-------------------------+------------------------------------------------------------------------------------------+
 
 The reason of putting all classes in one file:
     1. Only one file to run the basic requirement viewer / editor
@@ -46,7 +60,6 @@ The reason of putting all classes in one file:
 from __future__ import annotations
 
 import datetime
-import hashlib
 import os
 import re
 import html
@@ -55,28 +68,60 @@ import sys
 import csv
 import uuid
 import json
+import time
+import zlib
+import hashlib
+import math
+import bisect
+import heapq
+import fnmatch
 import shutil
+import argparse
+import copy
+import contextlib
+import mimetypes
+import urllib.parse
 import platform
 import markdown2
+import threading
 import traceback
+import tempfile
 import subprocess
 from io import StringIO
-from typing import Callable, List, Tuple, Union
+from typing import Callable, Dict, Iterable, Iterator, List, Set, Tuple, Union
 from functools import partial
+from operator import itemgetter
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from bs4 import BeautifulSoup
 from PyPDF2 import PdfMerger
 
+# Optional fast JSON backends. See ReqJsonCodec.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+finally:
+    pass
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+finally:
+    pass
+
 try:
     # Use try catch for running FreeReq without UI
 
-    from PyQt5.QtGui import QFont, QCursor, QPdfWriter, QPagedPaintDevice, QTextCursor, QDesktopServices
+    from PyQt5.QtGui import QFont, QCursor, QPdfWriter, QPagedPaintDevice, QTextCursor, QDesktopServices, QKeySequence
     from PyQt5.QtPrintSupport import QPrintPreviewDialog, QPrinter
     from PyQt5.QtCore import Qt, QAbstractItemModel, QModelIndex, QFileSystemWatcher, \
-        QSize, QPoint, QItemSelection, QFile, QIODevice, QUrl, QTimer, QSettings
+        QSize, QPoint, QItemSelection, QFile, QIODevice, QUrl, QTimer, QSettings, QObject, pyqtSignal
     from PyQt5.QtWidgets import qApp, QApplication, QWidget, QHBoxLayout, QVBoxLayout, QGridLayout, \
         QPushButton, QMessageBox, QLabel, QGroupBox, QTableWidget, QTabWidget, QTextEdit, QMenu, \
         QLineEdit, QCheckBox, QComboBox, QTreeView, QInputDialog, QFileDialog, QSplitter, QTableWidgetItem, \
-        QAbstractItemView, QScrollArea, QAction, QDockWidget, QMainWindow, QDialog
+        QAbstractItemView, QScrollArea, QAction, QDockWidget, QMainWindow, QDialog, QProgressDialog
 except Exception as e:
     print('UI disabled.')
     print(str(e))
@@ -127,6 +172,11 @@ class ObserverNotifier:
     """
     def __init__(self):
         self.__observers = []
+        self.__deferred_actions = set()
+        self.__deferred_thread = None
+        self.__deferred_records = []
+        self.__dispatcher = None
+        self.__dispatcher_thread = None
 
     def add_observer(self, observer):
         if observer not in self.__observers:
@@ -136,11 +186,40 @@ class ObserverNotifier:
         if observer in self.__observers:
             self.__observers.remove(observer)
 
+    def defer(self, actions: Iterable[str] or None) -> List[tuple]:
+        """
+        Record the notifications of the actions (e.g. 'node_data_changed') instead of invoking the observers.
+            Only the notifications from the calling thread are recorded.
+        :param actions: The actions to defer. None to stop deferring.
+        :return: The (action, args, kwargs) recorded since the last call.
+        """
+        records = self.__deferred_records
+        self.__deferred_records = []
+        self.__deferred_actions = set(actions) if actions is not None else set()
+        self.__deferred_thread = threading.current_thread() if actions is not None else None
+        return records
+
+    def set_dispatcher(self, dispatcher: Callable[[Callable], None] or None):
+        """
+        Deliver the notifications from other threads (e.g. the saving thread) to the thread calling this function.
+        :param dispatcher: A function that queues a callable and invokes it later in the calling thread.
+                            Like a queued Qt signal. None to notify in the notifying thread.
+        """
+        self.__dispatcher = dispatcher
+        self.__dispatcher_thread = threading.current_thread() if dispatcher is not None else None
+
     def __getattr__(self, item):
         if item.startswith('notify_'):
             action = item[len('notify_'):]
 
             def dynamic_notify(*args, **kwargs):
+                dispatcher = self.__dispatcher
+                if dispatcher is not None and threading.current_thread() is not self.__dispatcher_thread:
+                    dispatcher(partial(dynamic_notify, *args, **kwargs))
+                    return
+                if action in self.__deferred_actions and threading.current_thread() is self.__deferred_thread:
+                    self.__deferred_records.append((action, args, kwargs))
+                    return
                 method_name = f"on_{action}"
                 for observer in self.__observers:
                     try:
@@ -239,83 +318,283 @@ STATIC_FIELDS = [STATIC_FIELD_ID, STATIC_FIELD_UUID, STATIC_FIELD_TITLE, STATIC_
 
 STATIC_META_ID_PREFIX = 'meta_group'
 
+REQ_JOURNAL_SUFFIX = '.journal'
+REQ_JOURNAL_COMPACTING_SUFFIX = '.journal.compacting'
+
+REQ_DIGEST_READ_CHUNK = 1024 * 1024
+# A file that is stat-ed within this window after it's modified can be modified again without mtime changing
+#   (mtime resolution of FAT and some network shares is 2s). The content should be checked for this case.
+REQ_RACY_MTIME_WINDOW_NS = 2 * 1000 * 1000 * 1000
+
 ABOUT_MESSAGE = """FreeReq by Sleepy
 
 Github : https://github.com/SleepySoft/FreeReq"""
 
 
+# ----------------------------------------------------------------------------------------------------------------------
+
+class ReqJsonCodec:
+    """
+    The JSON codec for req file. Use orjson or ujson if installed, else the stdlib json.
+    Format:
+        Pretty (default): Diff friendly. Exactly the same bytes as json.dumps(indent=4, ensure_ascii=False).
+        Compact: No indent and no space. Smaller and faster, but hard to diff.
+    """
+    BACKENDS = ['orjson', 'ujson', 'json']
+
+    def __init__(self, backend: str = 'auto', compact: bool = False):
+        """
+        :param backend: 'auto', 'orjson', 'ujson' or 'json'. Fall back to the next available one if not installed.
+        :param compact: True for compact format, False for pretty (diff friendly) format.
+        """
+        self.__backend = ReqJsonCodec.__select_backend(backend)
+        self.__compact = compact
+
+    @staticmethod
+    def __select_backend(backend: str) -> str:
+        candidates = ReqJsonCodec.BACKENDS
+        if backend in candidates:
+            candidates = candidates[candidates.index(backend):]
+        for candidate in candidates:
+            if candidate == 'json' or (candidate == 'orjson' and orjson is not None) or \
+                    (candidate == 'ujson' and ujson is not None):
+                if backend not in ('auto', candidate):
+                    print(f'Warning: JSON backend {backend} is not available. Use {candidate} instead.')
+                return candidate
+        return 'json'
+
+    def backend(self) -> str:
+        return self.__backend
+
+    def is_compact(self) -> bool:
+        return self.__compact
+
+    def loads(self, data: bytes or str) -> any:
+        if self.__backend == 'orjson':
+            return orjson.loads(data)
+        if self.__backend == 'ujson':
+            return ujson.loads(data)
+        return json.loads(data)
+
+    def dumps(self, obj: any) -> bytes:
+        """
+        :return: UTF-8 bytes with '\\n' line ending.
+        """
+        try:
+            if self.__backend == 'orjson':
+                return self.__orjson_dumps(obj)
+            if self.__backend == 'ujson' and self.__compact:
+                # ujson's indent format is different from stdlib. Only use it for compact format.
+                return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False).encode('utf-8')
+        except Exception as e:
+            # Something the fast backend does not support (e.g. big int, non-str key). Use stdlib.
+            print(f'Warning: {self.__backend} dumps fail, fall back to json: {str(e)}')
+        finally:
+            pass
+        if self.__compact:
+            return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return json.dumps(obj, indent=4, ensure_ascii=False).encode('utf-8')
+
+    def __orjson_dumps(self, obj: any) -> bytes:
+        if self.__compact:
+            return orjson.dumps(obj)
+        if ReqJsonCodec.__has_float(obj):
+            # orjson formats float differently from stdlib (e.g. 1e16, NaN). Keep the bytes identical.
+            return json.dumps(obj, indent=4, ensure_ascii=False).encode('utf-8')
+        data = orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+        # orjson only supports 2 spaces indent. Double it. Strings never contain raw newline, so all the
+        #   leading spaces of lines are indent.
+        return b'\n'.join([line[:len(line) - len(line.lstrip(b' '))] + line for line in data.split(b'\n')])
+
+    @staticmethod
+    def __has_float(obj: any) -> bool:
+        if not isinstance(obj, (dict, list)):
+            return isinstance(obj, float)
+        containers = [obj]
+        while len(containers) > 0:
+            container = containers.pop()
+            for val in (container.values() if isinstance(container, dict) else container):
+                if type(val) is str:
+                    continue
+                if isinstance(val, (dict, list)):
+                    containers.append(val)
+                elif isinstance(val, float):
+                    return True
+        return False
+
+
+default_json_codec = ReqJsonCodec()
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
 class ReqNode:
+    # Static fields are kept in slots (None means the field is absent). Custom fields go to the meta dict,
+    #   which is only allocated when the node has any.
+    __slots__ = ('__id', '__uuid', '__title', '__content', '__last_editor', '__last_change_time', '__meta',
+                 '__parent', '__children', '__children_loader', '__child_count_hint', '__pending_child_dicts',
+                 '__order', '__order_valid')
+
+    # Private names in __slots__ are mangled.
+    __FIELD_SLOTS = {
+        STATIC_FIELD_ID: '_ReqNode__id',
+        STATIC_FIELD_UUID: '_ReqNode__uuid',
+        STATIC_FIELD_TITLE: '_ReqNode__title',
+        STATIC_FIELD_CONTENT: '_ReqNode__content',
+        STATIC_FIELD_LAST_EDITOR: '_ReqNode__last_editor',
+        STATIC_FIELD_LAST_CHANGE_TIME: '_ReqNode__last_change_time',
+    }
+
     def __call__(self):
         return self
 
     def __init__(self, title: str = 'New Item'):
-        self.__data = {
-            STATIC_FIELD_ID: '',
-            STATIC_FIELD_UUID: str(uuid.uuid4().hex),
-            STATIC_FIELD_TITLE: title,
-            STATIC_FIELD_CHILD: [],  # Special field. Only for serialize/deserialize.
-            STATIC_FIELD_CONTENT: ''
-        }
+        self.__id = ''
+        self.__uuid = str(uuid.uuid4().hex)
+        self.__title = title
+        self.__content = ''
+        self.__last_editor = None
+        self.__last_change_time = None
+        self.__meta = None
+
         self.__parent = None
-        self.__sibling = self.__parent.children() if self.__parent is not None else []
         self.__children = []
+        self.__children_loader = None
+        self.__child_count_hint = 0
+        self.__pending_child_dicts = None
+
+        # The cached position in parent's children, and the count of children whose cached position is up to date.
+        self.__order = 0
+        self.__order_valid = 0
 
     # -------------------------------------- Data ---------------------------------------
 
     def get(self, key: str, default_val: any = None) -> any:
-        return self.__data.get(key, default_val)
+        slot = ReqNode.__FIELD_SLOTS.get(key, None)
+        if slot is not None:
+            val = getattr(self, slot)
+            return default_val if val is None else val
+        return self.__meta.get(key, default_val) if self.__meta is not None else default_val
 
     def set(self, key: str, val: any):
-        if key != STATIC_FIELD_CHILD:
-            self.__data[key] = val
-        else:
+        """
+        Set field value. Set field to None will remove this field.
+        """
+        if key == STATIC_FIELD_CHILD:
             raise ValueError('The key cannot be "%s"' % STATIC_FIELD_CHILD)
+        slot = ReqNode.__FIELD_SLOTS.get(key, None)
+        if slot is not None:
+            setattr(self, slot, val)
+        elif val is None:
+            if self.__meta is not None:
+                self.__meta.pop(key, None)
+        else:
+            if self.__meta is None:
+                self.__meta = {}
+            self.__meta[key] = val
 
     def data(self) -> dict:
-        return self.__data
+        """
+        :return: A new dict of all fields (without children). Modify the returned dict will not affect this node.
+        """
+        dic = {}
+        if self.__id is not None:
+            dic[STATIC_FIELD_ID] = self.__id
+        if self.__uuid is not None:
+            dic[STATIC_FIELD_UUID] = self.__uuid
+        if self.__title is not None:
+            dic[STATIC_FIELD_TITLE] = self.__title
+        if self.__content is not None:
+            dic[STATIC_FIELD_CONTENT] = self.__content
+        if self.__meta is not None:
+            dic.update(self.__meta)
+        if self.__last_editor is not None:
+            dic[STATIC_FIELD_LAST_EDITOR] = self.__last_editor
+        if self.__last_change_time is not None:
+            dic[STATIC_FIELD_LAST_CHANGE_TIME] = self.__last_change_time
+        return dic
 
     def clone(self):
-        new_node = ReqNode()
-        new_node.__data = self.__data.copy()
+        self.__ensure_children()
+        new_node = ReqNode.__new__(ReqNode)
+        new_node.__copy_fields(self)
+        new_node.__uuid = self.__uuid
         new_node.__parent = self.__parent
-        new_node.__sibling = self.__sibling.copy()
         new_node.__children = self.__children.copy()
+        new_node.__children_loader = None
+        new_node.__child_count_hint = 0
+        new_node.__pending_child_dicts = None
+        new_node.__order = self.__order
+        # The children still belong to the original node. Their cached position is not for the clone.
+        new_node.__order_valid = 0
         return new_node
 
     def copy_data(self, ref_node: ReqNode):
-        ref_data = ref_node.__data.copy()
-        ref_data[STATIC_FIELD_UUID] = self.__data[STATIC_FIELD_UUID]
-        self.__data = ref_data
+        self.__copy_fields(ref_node)
+
+    def __copy_fields(self, ref_node: ReqNode):
+        # All fields except uuid.
+        self.__id = ref_node.__id
+        self.__title = ref_node.__title
+        self.__content = ref_node.__content
+        self.__last_editor = ref_node.__last_editor
+        self.__last_change_time = ref_node.__last_change_time
+        self.__meta = ref_node.__meta.copy() if ref_node.__meta is not None else None
 
     def data_equals(self, compare_node: ReqNode):
-        data1 = self.__data.copy()
-        data2 = compare_node.__data.copy()
-        data1.pop(STATIC_FIELD_UUID, None)
-        data2.pop(STATIC_FIELD_UUID, None)
-        return data1 == data2
+        return self.__id == compare_node.__id and \
+            self.__title == compare_node.__title and \
+            self.__content == compare_node.__content and \
+            self.__last_editor == compare_node.__last_editor and \
+            self.__last_change_time == compare_node.__last_change_time and \
+            (self.__meta or {}) == (compare_node.__meta or {})
 
     def get_uuid(self) -> str:
-        return self.__data.get(STATIC_FIELD_UUID, '')
+        return self.__uuid if self.__uuid is not None else ''
 
     def set_title(self, text: str):
-        self.__data[STATIC_FIELD_TITLE] = text
+        self.__title = text
 
     def get_title(self) -> str:
-        return self.__data.get(STATIC_FIELD_TITLE)
+        return self.__title
 
     def re_assign_uuid(self):
-        self.__data[STATIC_FIELD_UUID] = str(uuid.uuid4().hex)
+        self.__uuid = str(uuid.uuid4().hex)
 
     # ------------------------------------ Property ------------------------------------
 
     def order(self) -> int:
-        if self in self.__sibling:
-            return self.__sibling.index(self)
-        else:
+        order = self.__parent.__child_order(self) if self.__parent is not None else -1
+        if order < 0:
             print('Warning: Error sibling. It should be a BUG')
-            return -1
+        return order
+
+    def __child_order(self, node: ReqNode) -> int:
+        self.__ensure_children()
+        children = self.__children
+        order = node.__order
+        if order < len(children) and children[order] is node:
+            return order
+        # Renumber the stale positions until the node is found. Each position is renumbered once between
+        #   two changes of the children, so it's O(1) amortized.
+        for start in (min(self.__order_valid, len(children)), 0):
+            for i in range(start, len(children)):
+                child = children[i]
+                child.__order = i
+                if i >= self.__order_valid:
+                    self.__order_valid = i + 1
+                if child is node:
+                    return i
+        return -1
+
+    def __invalidate_order(self, pos: int):
+        if pos < self.__order_valid:
+            self.__order_valid = pos
 
     def child_count(self) -> int:
+        if self.__children_loader is not None:
+            # Do not load children just for counting.
+            return self.__child_count_hint
         return len(self.__children)
 
     # ------------------------------------ Iteration ------------------------------------
@@ -324,50 +603,112 @@ class ReqNode:
         return self.__parent
 
     def sibling(self) -> [ReqNode]:
-        return self.__sibling
+        return self.__parent.children() if self.__parent is not None else []
 
     def prev(self) -> ReqNode:
         order = self.order()
-        return self.__sibling[order - 1] if order > 0 else None
+        return self.sibling()[order - 1] if order > 0 else None
 
     def next(self) -> ReqNode:
         order = self.order()
-        return self.__sibling[order + 1] if order < len(self.__sibling) else None
+        sibling = self.sibling()
+        return sibling[order + 1] if order + 1 < len(sibling) else None
 
     def child(self, order: int):
+        self.__ensure_children()
         return self.__children[order] if 0 <= order < len(self.__children) else None
 
     def children(self):
+        self.__ensure_children()
         return self.__children
 
     # ---------------------------------- Construction ----------------------------------
 
     def set_parent(self, parent: ReqNode):
         self.__parent = parent
-        self.__sibling = self.__parent.children() if self.__parent is not None else []
+
+    def set_children_loader(self, loader: Callable[[ReqNode], List[ReqNode]] or None, child_count: int = 0):
+        """
+        Let the children be fetched on demand. The loader is invoked once when the children are first accessed.
+        :param loader: Declaration: f(node: ReqNode) -> List[ReqNode]. None to cancel the pending loading.
+        :param child_count: The child count that child_count() reports before the children are loaded.
+        """
+        self.__children_loader = loader
+        self.__child_count_hint = child_count
+
+    def is_children_loaded(self) -> bool:
+        return self.__children_loader is None
+
+    def pending_child_dicts(self) -> List[dict] or None:
+        """
+        :return: The children dicts that are not built to ReqNode yet (see from_dict() lazy_depth).
+                 None if there's no pending children dict. Do not modify the returned dicts.
+        """
+        return self.__pending_child_dicts if self.__children_loader is not None else None
+
+    def __ensure_children(self):
+        if self.__children_loader is not None:
+            loader = self.__children_loader
+            self.__children_loader = None
+            self.__child_count_hint = 0
+            children = loader(self)
+            self.__pending_child_dicts = None
+            for node in children:
+                node.set_parent(self)
+                node.__order = len(self.__children)
+                self.__children.append(node)
+            self.__order_valid = len(self.__children)
 
     def append_child(self, node: ReqNode) -> int:
+        self.__ensure_children()
         node.set_parent(self)
+        node.__order = len(self.__children)
         self.__children.append(node)
-        return len(self.__children) - 1
+        if self.__order_valid == node.__order:
+            self.__order_valid += 1
+        return node.__order
 
     def insert_children(self, node: ReqNode or [ReqNode], pos: int):
+        self.__ensure_children()
         if isinstance(node, ReqNode):
             node = [node]
         for n in node:
             n.set_parent(self)
         self.__children[pos:pos] = node
+        # Same as slice position.
+        self.__invalidate_order(max(0, len(self.__children) - len(node) + pos) if pos < 0 else pos)
+
+    def shift_child(self, node: ReqNode, offset: int) -> int:
+        """
+        Move the child node by offset in children. The target position is limited in the children range.
+        :return: The new position of node. -1 if node is not a child of this node.
+        """
+        order = self.__child_order(node)
+        if order < 0:
+            return -1
+        new_order = max(0, min(order + offset, len(self.__children) - 1))
+        if new_order != order:
+            del self.__children[order]
+            self.__children.insert(new_order, node)
+            self.__invalidate_order(min(order, new_order))
+        return new_order
 
     def remove_child(self, node: ReqNode) -> bool:
-        if node in self.__children:
-            self.__children.remove(node)
+        order = self.__child_order(node)
+        if order >= 0:
+            del self.__children[order]
+            self.__invalidate_order(order)
             node.set_parent(None)
             return True
         else:
             return False
 
     def remove_children(self):
+        self.__children_loader = None
+        self.__child_count_hint = 0
+        self.__pending_child_dicts = None
         self.__children.clear()
+        self.__order_valid = 0
 
     def insert_sibling_left(self, node: ReqNode) -> int:
         if self.__parent is not None:
@@ -388,41 +729,88 @@ class ReqNode:
     # ------------------------------------ Persists ------------------------------------
 
     def to_dict(self) -> dict:
-        dic = self.__data.copy()
-        dic[STATIC_FIELD_CHILD] = [c.to_dict() for c in self.__children]
+        dic = self.data()
+        if self.pending_child_dicts() is not None:
+            # The children that are never touched are kept as they were loaded.
+            dic[STATIC_FIELD_CHILD] = self.__pending_child_dicts
+        else:
+            self.__ensure_children()
+            dic[STATIC_FIELD_CHILD] = [c.to_dict() for c in self.__children]
         return dic
 
-    def from_dict(self, dic: dict):
-        self.__data = dic
-
+    def from_dict(self, dic: dict, lazy_depth: int = -1):
+        """
+        Build node (and its children) from dict. The dic will not be modified.
+        :param dic: The dict of node data and its children.
+        :param lazy_depth: Only build children down to this depth. The deeper children are kept as dict
+                            and built level by level when they are accessed. -1 means build all.
+        """
         for k in STATIC_FIELDS:
-            if k not in self.__data.keys():
+            if k not in dic:
                 print(f'Warning: Static fields missing {k}')
-        if STATIC_FIELD_UUID not in self.__data.keys():
+
+        self.__id = dic.get(STATIC_FIELD_ID, None)
+        self.__uuid = dic.get(STATIC_FIELD_UUID, None)
+        self.__title = dic.get(STATIC_FIELD_TITLE, None)
+        self.__content = dic.get(STATIC_FIELD_CONTENT, None)
+        self.__last_editor = ReqNode.__intern(dic.get(STATIC_FIELD_LAST_EDITOR, None))
+        self.__last_change_time = dic.get(STATIC_FIELD_LAST_CHANGE_TIME, None)
+        meta = {k: ReqNode.__intern(v) for k, v in dic.items()
+                if k not in ReqNode.__FIELD_SLOTS and k != STATIC_FIELD_CHILD}
+        self.__meta = meta if len(meta) > 0 else None
+
+        if self.__uuid is None:
             # Because of old issue, the uuid is missing. Fix it on load phase.
             print('Fix UUID missing issue.')
-            self.__data[STATIC_FIELD_UUID] = str(uuid.uuid4().hex)
+            self.__uuid = str(uuid.uuid4().hex)
 
         self.__children = []
-        if STATIC_FIELD_CHILD in self.__data.keys():
-            for sub_dict in dic[STATIC_FIELD_CHILD]:
-                node = ReqNode()
-                node.from_dict(sub_dict)
-                self.append_child(node)
-            del self.__data[STATIC_FIELD_CHILD]
+        self.__children_loader = None
+        self.__child_count_hint = 0
+        self.__pending_child_dicts = None
+        self.__order_valid = 0
+        child_dicts = dic.get(STATIC_FIELD_CHILD, None)
+        if child_dicts:
+            if lazy_depth == 0:
+                self.set_children_loader(ReqNode.__build_pending_children, len(child_dicts))
+                self.__pending_child_dicts = child_dicts
+            else:
+                child_lazy_depth = lazy_depth - 1 if lazy_depth > 0 else -1
+                for order, sub_dict in enumerate(child_dicts):
+                    child = ReqNode.create_from_dict(sub_dict, child_lazy_depth, self)
+                    child.__order = order
+                    self.__children.append(child)
+                self.__order_valid = len(self.__children)
+
+    @staticmethod
+    def __intern(val: any) -> any:
+        # Editor names and meta values (owner, status, priority...) repeat over nodes. Share them.
+        return sys.intern(val) if isinstance(val, str) and len(val) <= 64 else val
+
+    @staticmethod
+    def create_from_dict(dic: dict, lazy_depth: int = -1, parent: ReqNode = None) -> ReqNode:
+        """
+        Same as ReqNode().from_dict() but without the cost of initializing the node that is overwritten at once.
+        """
+        node = ReqNode.__new__(ReqNode)
+        node.__parent = parent
+        node.__order = 0
+        node.from_dict(dic, lazy_depth)
+        return node
+
+    @staticmethod
+    def __build_pending_children(node: ReqNode) -> List[ReqNode]:
+        return [ReqNode.create_from_dict(sub_dict, 0) for sub_dict in node.__pending_child_dicts]
 
     def serialize(self) -> str:
         req_data_dict = self.to_dict()
-        json_text = json.dumps(req_data_dict, indent=4, ensure_ascii=False)
-        return json_text
+        return default_json_codec.dumps(req_data_dict).decode('utf-8')
 
     @staticmethod
     def deserialize(json_text: str) -> ReqNode:
         try:
-            req_data_dict = json.loads(json_text)
-            req_node = ReqNode()
-            req_node.from_dict(req_data_dict)
-            return req_node
+            req_data_dict = default_json_codec.loads(json_text)
+            return ReqNode.create_from_dict(req_data_dict)
         except Exception as e:
             print(str(e))
             print(traceback.format_exc())
@@ -434,20 +822,20 @@ class ReqNode:
 
     def map(self, func: Callable[[ReqNode], None]):
         func(self)
-        for child in self.__children:
+        for child in self.children():
             child.map(func)
 
     def filter(self, func: Callable[[ReqNode], bool]) -> List[ReqNode]:
         result = []
         if func(self):
             result.append(self)
-        for child in self.__children:
+        for child in self.children():
             result.extend(child.filter(func))
         return result
 
     def for_each(self, func: Callable[[ReqNode], None]):
         func(self)
-        for child in self.__children:
+        for child in self.children():
             child.for_each(func)
 
 
@@ -488,12 +876,23 @@ class IReqObserver:
 
 
 class IReqAgent:
+    # The notifications that are deferred and coalesced in batch().
+    BATCH_DEFERRED_NOTIFICATIONS = ('req_saved', 'meta_data_changed', 'node_data_changed', 'node_structure_changed')
+
     def __init__(self):
         self.ob_notifier = ObserverNotifier()
+        self.__batch_depth = 0
 
     def init(self, *args, **kwargs) -> bool:
         raise ValueError('Not implemented')
 
+    def set_notify_dispatcher(self, dispatcher: Callable[[Callable], None] or None):
+        """
+        The agent may notify from its background thread. Set a dispatcher to deliver all notifications
+            to the thread calling this function. See ObserverNotifier.set_dispatcher().
+        """
+        self.ob_notifier.set_dispatcher(dispatcher)
+
     # ------------------------ Override: Req management -----------------------
 
     def list_req(self) -> [str]:
@@ -514,6 +913,19 @@ class IReqAgent:
     def check_req_consistency(self) -> bool:
         raise NotImplementedError('Not implemented: check_req_consistency')
 
+    def get_req_consistency_token(self) -> str:
+        """
+        :return: A token that identifies the req content this agent loaded or saved last.
+                 It changes when the req is saved. Compare it to know whether the req has been saved since.
+        """
+        raise NotImplementedError('Not implemented: get_req_consistency_token')
+
+    def get_req_file_filter(self) -> str:
+        """
+        :return: The file dialog filter of the req files that this agent opens. E.g. 'Requirement File (*.req)'.
+        """
+        return 'Requirement File (*.req)'
+
     # -------------------- Override: After select_op_req() --------------------
 
     def get_req_name(self) -> str:
@@ -534,6 +946,17 @@ class IReqAgent:
     def get_req_node(self, req_uuid: str) -> ReqNode:
         raise NotImplementedError('Not implemented: get_req_node')
 
+    def get_req_node_by_id(self, req_id: str) -> ReqNode or None:
+        """
+        Find the node by its Req ID. The Req ID is matched exactly (case-sensitive).
+        The agent can override it with an index. This default implementation walks the whole tree.
+        """
+        root_node = self.get_req_root()
+        if root_node is None or req_id == '':
+            return None
+        id_nodes = root_node.filter(lambda n: n.get(STATIC_FIELD_ID, '').strip() == req_id)
+        return id_nodes[0] if len(id_nodes) > 0 else None
+
     # ----------------------- Override: Node  Operation -----------------------
 
     def insert_node(self, parent_uuid: str, insert_pos: int, insert_nodes: Union[ReqNode, List[ReqNode]]):
@@ -553,6 +976,137 @@ class IReqAgent:
     def new_req_id(self, id_prefix: str, digit_count: int = 5) -> str:
         raise NotImplementedError('Not implemented: new_req_id')
 
+    # ---------------------------- Override: Batch ----------------------------
+
+    def on_batch_begin(self):
+        """
+        Invoked when the outermost batch() begins. The agent can defer persisting until on_batch_commit().
+        """
+        pass
+
+    def on_batch_commit(self):
+        """
+        Invoked when the outermost batch() exits. Persist the deferred changes at once.
+        """
+        pass
+
+    # --------------------------------- Batch ---------------------------------
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Group node and meta operations. They're persisted once and observed once:
+            with agent.batch():
+                for node in nodes:
+                    agent.update_node(node)
+        The persisting and the notifications are deferred until the outermost batch exits (even by exception,
+            the done operations are kept). Then the notifications are coalesced: the structure changes in a row
+            with the same parent and operation are merged, and each changed node is notified once.
+        Batches can be nested.
+        """
+        self.__batch_depth += 1
+        if self.__batch_depth == 1:
+            self.ob_notifier.defer(IReqAgent.BATCH_DEFERRED_NOTIFICATIONS)
+            self.on_batch_begin()
+        try:
+            yield self
+        finally:
+            self.__batch_depth -= 1
+            if self.__batch_depth == 0:
+                try:
+                    self.on_batch_commit()
+                finally:
+                    self.__notify_coalesced(self.ob_notifier.defer(None))
+
+    def in_batch(self) -> bool:
+        return self.__batch_depth > 0
+
+    # ----------------------------- Bulk Operation ----------------------------
+
+    def remove_nodes(self, node_uuids: List[str]):
+        """
+        Remove the nodes in one batch.
+        """
+        with self.batch():
+            for node_uuid in node_uuids:
+                self.remove_node(node_uuid)
+
+    def move_nodes(self, node_uuids: List[str], parent_uuid: str, insert_pos: int) -> bool:
+        """
+        Move the nodes (with their sub trees) under the parent node in one batch. The order of nodes is kept.
+        :param insert_pos: The position in the children of parent before moving. -1 to append.
+        :return: False if any node is not found, or the parent is one of the nodes or their descendants.
+        """
+        parent_node = self.get_req_node(parent_uuid)
+        move_nodes = [self.get_req_node(node_uuid) for node_uuid in node_uuids]
+        if parent_node is None or None in move_nodes:
+            print('Warning: Cannot find move node or parent node.')
+            return False
+        ancestor = parent_node
+        while ancestor is not None:
+            if ancestor in move_nodes:
+                print('Warning: Cannot move node into itself.')
+                return False
+            ancestor = ancestor.parent()
+        move_nodes = top_level_nodes(move_nodes)
+
+        if insert_pos >= 0:
+            # The moving nodes before the position are removed first.
+            insert_pos -= len([node for node in move_nodes if node.parent() is parent_node and node.order() < insert_pos])
+        with self.batch():
+            for node in move_nodes:
+                self.remove_node(node.get_uuid())
+            insert_pos = min(insert_pos, parent_node.child_count()) if insert_pos >= 0 else parent_node.child_count()
+            self.insert_node(parent_uuid, insert_pos, move_nodes)
+        return True
+
+    def update_nodes_field(self, node_uuids: List[str], key: str, value: any):
+        """
+        Set the field of the nodes to the same value in one batch. E.g. set 'Status' to 'Approved'.
+        """
+        with self.batch():
+            for node_uuid in node_uuids:
+                node = self.get_req_node(node_uuid)
+                if node is None:
+                    print(f'Warning: Cannot find update node: {node_uuid}')
+                    continue
+                update_node = node.clone()
+                update_node.set(key, value)
+                self.update_node(update_node)
+
+    def __notify_coalesced(self, records: List[tuple]):
+        # The agents notify with positional arguments.
+        req_saved = None
+        meta_data_changed = None
+        structure_changes = []
+        data_changes = OrderedDict()
+
+        for action, args, _ in records:
+            if action == 'node_structure_changed':
+                req_name, parent_node, child_node, operation = args
+                last = structure_changes[-1] if len(structure_changes) > 0 else None
+                if last is not None and last[1] is parent_node and last[3] == operation:
+                    last[2].extend(child_node)
+                else:
+                    structure_changes.append((req_name, parent_node, list(child_node), operation))
+            elif action == 'node_data_changed':
+                data_changes[args[1].get_uuid()] = args
+            elif action == 'meta_data_changed':
+                meta_data_changed = args
+            elif action == 'req_saved':
+                req_saved = args
+
+        if meta_data_changed is not None:
+            self.ob_notifier.notify_meta_data_changed(*meta_data_changed)
+        for structure_change in structure_changes:
+            self.ob_notifier.notify_node_structure_changed(*structure_change)
+        for node_uuid, args in data_changes.items():
+            # Skip the nodes that are removed later in the batch.
+            if self.get_req_node(node_uuid) is not None:
+                self.ob_notifier.notify_node_data_changed(*args)
+        if req_saved is not None:
+            self.ob_notifier.notify_req_saved(*req_saved)
+
     # -------------------------------- Observer -------------------------------
 
     def add_observer(self, ob: IReqObserver):
@@ -564,10 +1118,8 @@ class IReqAgent:
     # -------------------------------- Assistant -------------------------------
 
     @staticmethod
-    def req_dict_to_nodes(req_dict: dict) -> ReqNode:
-        req_node_root = ReqNode()
-        req_node_root.from_dict(req_dict)
-        return req_node_root
+    def req_dict_to_nodes(req_dict: dict, lazy_depth: int = -1) -> ReqNode:
+        return ReqNode.create_from_dict(req_dict, lazy_depth)
 
     @staticmethod
     def req_map(root_node: ReqNode, map_operation) -> dict:
@@ -652,6 +1204,74 @@ class IReqAgent:
         return req_id_max
 
 
+# ----------------------------------------------------------------------------------------------------------------------
+
+class ReqSaveWorker:
+    """
+    Run the save function in a dedicated thread. The jobs that are submitted before the thread picks them up
+        are coalesced, only the latest one (merged by merge_func if provided) is saved.
+    The thread quits when idle. It's not a daemon thread, so the pending saving will be finished on exit.
+    """
+    def __init__(self, save_func: Callable[[any], bool], merge_func: Callable[[any, any], any] = None,
+                 name: str = 'ReqSaveWorker'):
+        """
+        :param save_func: Declaration: f(job) -> bool. Invoked in the save thread.
+        :param merge_func: Declaration: f(pending_job, new_job) -> job. None to simply take the new job.
+        """
+        self.__save_func = save_func
+        self.__merge_func = merge_func
+        self.__name = name
+        self.__condition = threading.Condition()
+        self.__pending_job = None
+        self.__has_pending = False
+        self.__busy = False
+        self.__thread: threading.Thread = None
+        self.__last_result = True
+
+    def submit(self, job: any):
+        with self.__condition:
+            if self.__has_pending and self.__merge_func is not None:
+                job = self.__merge_func(self.__pending_job, job)
+            self.__pending_job = job
+            self.__has_pending = True
+            if not self.__busy:
+                self.__busy = True
+                self.__thread = threading.Thread(target=self.__run, name=self.__name)
+                self.__thread.start()
+
+    def wait(self) -> bool:
+        """
+        Wait until all submitted jobs are saved.
+        :return: The result of the last saving.
+        """
+        with self.__condition:
+            if threading.current_thread() is not self.__thread:
+                while self.__busy:
+                    self.__condition.wait()
+            return self.__last_result
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                if not self.__has_pending:
+                    self.__busy = False
+                    self.__condition.notify_all()
+                    return
+                job = self.__pending_job
+                self.__pending_job = None
+                self.__has_pending = False
+            try:
+                result = self.__save_func(job)
+            except Exception as e:
+                print(str(e))
+                print(traceback.format_exc())
+                result = False
+            finally:
+                pass
+            with self.__condition:
+                self.__last_result = result
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 
 class ReqSingleJsonFileAgent(IReqAgent):
@@ -659,6 +1279,8 @@ class ReqSingleJsonFileAgent(IReqAgent):
         super(ReqSingleJsonFileAgent, self).__init__()
         self.__req_path = req_path
         self.__req_file_name = ''
+        # The saving thread may switch the req file name. See __switch_to_conflict_file().
+        self.__req_file_lock = threading.Lock()
         self.__req_meta_dict = {}
         self.__req_data_dict = {}
         self.__req_node_root: ReqNode = None
@@ -667,15 +1289,45 @@ class ReqSingleJsonFileAgent(IReqAgent):
         self.__req_id_max = {}
         self.__uuid_node_index = {}
         self.__req_id_node_index = {}
-        self.__collected_information = {}
+        # uuid -> the Req ID that the node is indexed by. The Req ID may be changed in the node instance.
+        self.__uuid_req_id_index = {}
+        # uuid -> parent uuid, for the nodes that are not built yet in lazy loading mode
+        self.__pending_parent_index = {}
+        # Req ID -> uuid, for the nodes that are not built yet in lazy loading mode
+        self.__pending_req_id_index = {}
+
+        # Lazy loading
+        self.__lazy_depth = -1
+
+        # Read only. See set_read_only().
+        self.__read_only = False
+
+        self.__json_codec = default_json_codec
+
+        # Journal
+        self.__journal_enabled = False
+        self.__journal_compact_threshold = 1000
+        self.__journal_fsync = True
+        self.__journal_seq = 0
+        self.__journal_count = 0
+        self.__journal_file = None
+
+        # Saving. The job is (req json snapshot, compacting journal path or None).
+        self.__save_worker = ReqSaveWorker(self.__write_snapshot,
+                                           lambda pending, job: (job[0], job[1] or pending[1]), 'ReqJsonSaving')
 
-        self.req_hash = None
+        # (stat key, content digest, racy) of the req file that loaded or saved last. None if file not exists.
+        self.__req_token = None
+
+        # The persist records deferred by batch(). None if not in batch.
+        self.__batch_records: List[dict] or None = None
 
     def init(self) -> bool:
         return True
 
     def req_full_path(self) -> str:
-        return os.path.join(self.__req_path, self.__req_file_name)
+        with self.__req_file_lock:
+            return os.path.join(self.__req_path, self.__req_file_name)
 
     # ----------------------- Req management -----------------------
 
@@ -687,7 +1339,11 @@ class ReqSingleJsonFileAgent(IReqAgent):
         return req_names
 
     def new_req(self, req_name: str, overwrite: bool = False) -> bool:
+        # The req may be overwritten. Do not let the pending saving write it after.
+        self.__save_worker.wait()
         self.__do_touch(req_name)
+        # The journal of the overwritten req should not be replayed to the new one.
+        self.__remove_journal_files(req_name if req_name.lower().endswith('.req') else req_name + '.req')
         return self.open_req(req_name)
 
     def open_req(self, req_name: str) -> bool:
@@ -715,7 +1371,13 @@ class ReqSingleJsonFileAgent(IReqAgent):
         return False
 
     def check_req_consistency(self) -> bool:
-        return self.__check_req_hash()
+        self.__save_worker.wait()
+        return self.__check_req_token()
+
+    def get_req_consistency_token(self) -> str:
+        self.__save_worker.wait()
+        req_token = self.__req_token
+        return f'{req_token[1]:08x}' if req_token is not None and req_token[1] is not None else ''
 
     # --------------------- After select_op_req() ---------------------
 
@@ -734,76 +1396,155 @@ class ReqSingleJsonFileAgent(IReqAgent):
 
     def set_req_meta(self, req_meta: dict) -> bool:
         self.__req_meta_dict = req_meta
-        self.ob_notifier.notify('meta_data_changed')
-        self.ob_notifier.notify_meta_data_changed()
-        return self.__do_save()
+        self.ob_notifier.notify_meta_data_changed(self.get_req_name())
+        return self.__do_persist({'op': 'meta', 'meta': req_meta})
 
     def get_req_root(self) -> ReqNode:
         return self.__req_node_root
 
     def get_req_node(self, req_uuid: str) -> ReqNode:
-        return self.__uuid_node_index.get(req_uuid, None)
+        node = self.__uuid_node_index.get(req_uuid, None)
+        if node is None and req_uuid in self.__pending_parent_index:
+            node = self.__build_pending_node(req_uuid)
+        return node
+
+    def get_req_node_by_id(self, req_id: str) -> ReqNode or None:
+        node = self.__req_id_node_index.get(req_id, None)
+        if node is None and req_id in self.__pending_req_id_index:
+            node = self.get_req_node(self.__pending_req_id_index[req_id])
+            # The node may be removed or its Req ID may be changed after it's indexed as pending.
+            if node is None or node.get(STATIC_FIELD_ID, '').strip() != req_id:
+                node = None
+        return node
 
     # ----------------------- Override: Node  Operation -----------------------
 
     def insert_node(self, parent_uuid: str, insert_pos: int, insert_nodes: Union[ReqNode, List[ReqNode]]):
         insert_nodes = [insert_nodes] if isinstance(insert_nodes, ReqNode) else insert_nodes
-        parent_node = self.__req_node_root.filter(lambda x: x.get_uuid() == parent_uuid)
-        if len(parent_node) != 1:
-            print('Warning: Cannot find parent node or multiple node has the same uuid.')
+        parent_node = self.get_req_node(parent_uuid)
+        if parent_node is None:
+            print('Warning: Cannot find parent node.')
         else:
-            parent_node[0].insert_children(insert_nodes, insert_pos)
+            parent_node.insert_children(insert_nodes, insert_pos)
+            self.__index_nodes(insert_nodes)
 
-            self.__do_save()
-            self.ob_notifier.notify_node_structure_changed(self.get_req_name(), parent_node[0], insert_nodes, 'add')
+            self.__do_persist({'op': 'insert', 'parent': parent_uuid, 'pos': insert_pos,
+                               'nodes': [node.to_dict() for node in insert_nodes]})
+            self.ob_notifier.notify_node_structure_changed(self.get_req_name(), parent_node, insert_nodes, 'add')
 
     def remove_node(self, node_uuid: str):
-        remove_node = self.__req_node_root.filter(lambda x: x.get_uuid() == node_uuid)
-        if len(remove_node) != 1:
+        remove_node = self.get_req_node(node_uuid)
+        if remove_node is None:
             print('Cannot find remove node.')
             return
-        parent_node = remove_node[0].parent()
+        parent_node = remove_node.parent()
         if parent_node is not None:
-            parent_node.remove_child(remove_node[0])
+            parent_node.remove_child(remove_node)
+            self.__unindex_nodes([remove_node])
 
-            self.__do_save()
-            self.ob_notifier.notify_node_structure_changed(self.get_req_name(), parent_node, remove_node, 'remove')
+            self.__do_persist({'op': 'remove', 'uuid': node_uuid})
+            self.ob_notifier.notify_node_structure_changed(self.get_req_name(), parent_node, [remove_node], 'remove')
 
     def update_node(self, node: ReqNode):
-        update_node = self.__req_node_root.filter(lambda x: x.get_uuid() == node.get_uuid())
-        if len(update_node) == 0:
+        update_node = self.get_req_node(node.get_uuid())
+        if update_node is None:
             print('Warning: Cannot find update node.')
             return
-        if len(update_node) > 1:
-            print('Warning: Find multiple nodes, the uuid may have issue.')
-            return
-        if update_node[0] is not node:
+        if update_node is not node:
             # If they are not the same instance
-            update_node[0].copy_data(node)
+            self.__unindex_node(update_node)
+            update_node.copy_data(node)
+            self.__index_node(update_node)
         else:
             print("Warning: You'd better using a node copy to update target node.")
-        self.__do_save()
-        self.ob_notifier.notify_node_data_changed(update_node[0])
+            # Re-indexing drops the old Req ID if it's changed in place.
+            self.__index_node(update_node)
+        self.__do_persist({'op': 'update', 'uuid': update_node.get_uuid(), 'data': update_node.data()})
+        self.ob_notifier.notify_node_data_changed(self.get_req_name(), update_node)
 
     def shift_node(self, node_uuid: str, shift_offset: int):
-        shift_node = self.__req_node_root.filter(lambda x: x.get_uuid() == node_uuid)
-        if len(shift_node) != 1:
+        shift_node = self.get_req_node(node_uuid)
+        if shift_node is None or shift_node.parent() is None:
             return
-        shift_node = shift_node[0]
-        parent_node = shift_node.parent()
-        children = parent_node.children()
+        shift_node.parent().shift_child(shift_node, shift_offset)
+        self.__do_persist({'op': 'shift', 'uuid': node_uuid, 'offset': shift_offset})
+
+    # ---------------------------- Lazy Loading ----------------------------
+
+    def set_lazy_loading(self, lazy_depth: int):
+        """
+        In lazy loading mode, only the nodes down to lazy_depth are built when the req is opened.
+            The deeper nodes are kept as dict and built level by level when they are accessed (e.g. expanded
+            in tree view). The untouched dicts are saved as they were, without building nodes.
+        Takes effect on next open_req().
+        :param lazy_depth: The depth of nodes that are built on open. -1 to disable lazy loading.
+        """
+        self.__lazy_depth = lazy_depth
+
+    # ------------------------------ Read Only -----------------------------
+
+    def set_read_only(self, read_only: bool):
+        """
+        In read only mode, the req file and its journal files are never written or removed (e.g. for exporting).
+            The journal is replayed in memory only when opening. The changes are kept in memory and not saved.
+        Takes effect on next open_req().
+        """
+        self.__read_only = read_only
+
+    def is_read_only(self) -> bool:
+        return self.__read_only
+
+    # ----------------------------- JSON Codec -----------------------------
+
+    def set_json_codec(self, json_codec: ReqJsonCodec):
+        """
+        Select the JSON backend and file format. The format (pretty or compact) takes effect on next saving.
+            Both formats can be loaded.
+        """
+        self.__save_worker.wait()
+        self.__json_codec = json_codec
+
+    # ------------------------------- Journal ------------------------------
+
+    def enable_journal(self, enable: bool, compact_threshold: int = 1000, fsync: bool = True):
+        """
+        In journal mode, each insert / remove / update / shift / meta change is appended to a journal file
+            next to the req file, instead of re-writing the whole req file on every edit.
+        The journal is folded back to the req file (compaction) in background when its record count
+            exceeds compact_threshold, on save_req() and when the req is closed.
+        :param enable: Enable or disable journal mode. Disabling will fold the journal immediately.
+        :param compact_threshold: The journal record count that triggers compaction.
+        :param fsync: Sync the journal to disk after each append (a batch is appended at once).
+                        Without it, the last edits may be lost on power failure or OS crash,
+                        but appending is much faster on slow disks.
+        """
+        if not enable and self.__journal_enabled and self.__req_file_name != '' and not self.__read_only:
+            self.__compact_journal(background=False)
+        self.__journal_enabled = enable
+        self.__journal_compact_threshold = max(1, compact_threshold)
+        self.__journal_fsync = fsync
+
+    def is_journal_enabled(self) -> bool:
+        return self.__journal_enabled
+
+    def journal_full_path(self) -> str:
+        return self.req_full_path() + REQ_JOURNAL_SUFFIX
 
-        # 获取当前节点在子节点列表中的索引
-        current_index = children.index(shift_node)
-        # 计算新的索引
-        new_index = current_index + shift_offset
-        # 确保新的索引不越界
-        new_index = max(0, min(new_index, len(children) - 1))
+    # ------------------------------- Batch ------------------------------
 
-        # 移除当前节点
-        children.remove(shift_node)
-        # 在新的位置插入当前节点
-        children.insert(new_index, shift_node)
+    def on_batch_begin(self):
+        self.__batch_records = []
+
+    def on_batch_commit(self):
+        records, self.__batch_records = self.__batch_records, None
+        if records is None or len(records) == 0 or self.__req_file_name == '':
+            return
+        if self.__journal_enabled:
+            # All records in one write.
+            if self.__append_journal(records) and self.__journal_count >= self.__journal_compact_threshold:
+                self.__compact_journal(background=True)
+        else:
+            self.__do_save()
 
     # -------------------------- Other Functions -------------------------
 
@@ -829,8 +1570,8 @@ class ReqSingleJsonFileAgent(IReqAgent):
         self.__do_save()
 
     def __do_load(self, req_file) -> bool:
-        self.__req_file_name = req_file
-        self.__update_req_hash()
+        with self.__req_file_lock:
+            self.__req_file_name = req_file
 
         ret = self.__load_req_json()
         issues = self.__check_correct_req_data()
@@ -840,6 +1581,11 @@ class ReqSingleJsonFileAgent(IReqAgent):
             for issue in issues:
                 print(issue)
             print('------------------------------------------------------------')
+            # UUID may be re-assigned by the checker
+            self.__indexing()
+
+        if ret:
+            self.__recover_journal()
 
         self.ob_notifier.notify_req_loaded(self.req_full_path())
 
@@ -847,11 +1593,17 @@ class ReqSingleJsonFileAgent(IReqAgent):
 
     def __do_close(self):
         if self.__req_file_name != '':
+            if self.__journal_count > 0:
+                self.__compact_journal(background=False)
+            self.__save_worker.wait()
+            self.__close_journal_file()
+
             editing_file = self.req_full_path()
 
             # Keeping self.__req_path
 
-            self.__req_file_name = ''
+            with self.__req_file_lock:
+                self.__req_file_name = ''
             self.__req_meta_dict = {}
             self.__req_data_dict = {}
             self.__req_node_root = None
@@ -859,24 +1611,75 @@ class ReqSingleJsonFileAgent(IReqAgent):
             self.__req_id_max = {}
             self.__uuid_node_index = {}
             self.__req_id_node_index = {}
-            self.__collected_information = {}
+            self.__uuid_req_id_index = {}
+            self.__pending_parent_index = {}
+            self.__pending_req_id_index = {}
 
-            self.req_hash = None
+            self.__journal_seq = 0
+            self.__journal_count = 0
+
+            self.__req_token = None
 
             self.ob_notifier.notify_req_closed(editing_file)
 
+    def __do_persist(self, record: dict) -> bool:
+        if self.__read_only:
+            return False
+        if self.__batch_records is not None:
+            self.__batch_records.append(record)
+            return True
+        if self.__journal_enabled:
+            if not self.__append_journal([record]):
+                return False
+            if self.__journal_count >= self.__journal_compact_threshold:
+                self.__compact_journal(background=True)
+            return True
+        else:
+            return self.__do_save()
+
     def __do_save(self) -> bool:
-        if not self.check_req_consistency():
-            timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S_%f')[:-3]
-            backup_file_name = self.__req_file_name + f'.{timestamp}.conflict'
-            print(f'Warning: Detect file changed outside. Save as a conflict file: {backup_file_name}')
-            self.ob_notifier.notify_req_exception('conflict', oringle_file=self.__req_file_name, backup_file=backup_file_name)
+        """
+        The snapshot is taken here and written by the save thread. The result is notified by on_req_saved() or
+            on_req_exception('save_fail') from the save thread.
+        """
+        if self.__read_only:
+            print('Warning: Req is opened read only. Not saved.')
+            return False
+        if self.__journal_enabled:
+            return self.__compact_journal(background=True)
+        if self.__req_node_root is None:
+            return False
+        self.__save_worker.submit((self.__req_json_snapshot(), None))
+        return True
+
+    def __write_snapshot(self, job: tuple) -> bool:
+        # Run in the save thread.
+        json_dict, compacting_path = job
+        if not self.__check_req_token():
+            self.__switch_to_conflict_file()
+
+        req_file = self.req_full_path()
+        digest = self.__write_req_json(req_file, json_dict, self.__json_codec)
+        if digest is None:
+            if compacting_path is not None:
+                print('Error: Journal compaction fail. The journal is kept for recovery.')
+            self.ob_notifier.notify_req_exception('save_fail', req_file=req_file)
+            return False
+
+        self.__update_req_token(digest, req_file)
+        if compacting_path is not None and os.path.exists(compacting_path):
+            os.remove(compacting_path)
+        self.ob_notifier.notify_req_saved(req_file)
+        return True
+
+    def __switch_to_conflict_file(self):
+        timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S_%f')[:-3]
+        with self.__req_file_lock:
+            origin_file_name = self.__req_file_name
+            backup_file_name = origin_file_name + f'.{timestamp}.conflict'
             self.__req_file_name = backup_file_name
-        result = self.__save_req_json()
-        if result:
-            self.__update_req_hash()
-            self.ob_notifier.notify_req_saved(self.req_full_path())
-        return result
+        print(f'Warning: Detect file changed outside. Save as a conflict file: {backup_file_name}')
+        self.ob_notifier.notify_req_exception('conflict', oringle_file=origin_file_name, backup_file=backup_file_name)
 
     def __do_touch(self, req_file) -> bool:
         try:
@@ -889,16 +1692,25 @@ class ReqSingleJsonFileAgent(IReqAgent):
             return False
 
     def __load_req_json(self) -> bool:
+        req_file = self.req_full_path()
+        # Stat before reading. If the file is changed in between, the next check will find the content different.
+        stat_key = self.__stat_req_file(req_file)
         try:
-            with open(self.req_full_path(), 'rt', encoding='utf-8') as f:
-                json_dict = json.load(f)
+            with open(req_file, 'rb') as f:
+                json_bytes = f.read()
+                self.__req_token = self.__make_req_token(stat_key, zlib.crc32(json_bytes))
+                json_dict = self.__json_codec.loads(json_bytes)
                 self.__req_meta_dict = json_dict.get('req_meta', {})
                 self.__req_data_dict = json_dict.get('req_data', {})
-                self.__req_node_root = self.req_dict_to_nodes(self.__req_data_dict)
+                self.__journal_seq = json_dict.get('req_journal_seq', 0)
+                self.__req_node_root = self.req_dict_to_nodes(self.__req_data_dict, self.__lazy_depth)
                 self.__indexing()
         except Exception as e:
             print(str(e))
             print(traceback.format_exc())
+            if self.__req_token is None and stat_key is not None:
+                # Read fail. Let the content be checked on next saving.
+                self.__req_token = self.__make_req_token(stat_key, None)
             self.__req_meta_dict = {}
             self.__req_data_dict = {}
             self.__req_node_root = ReqNode('New Requirement')
@@ -907,18 +1719,84 @@ class ReqSingleJsonFileAgent(IReqAgent):
             pass
         return True
 
-    def __save_req_json(self) -> bool:
+    def __req_json_snapshot(self) -> dict:
+        self.__req_data_dict = self.__req_node_root.to_dict()
+        json_dict = {
+            'req_meta': self.__req_meta_dict,
+            'req_data': self.__req_data_dict
+        }
+        if self.__journal_enabled or self.__journal_seq > 0:
+            # The journal records that have been folded into this snapshot.
+            json_dict['req_journal_seq'] = self.__journal_seq
+        return json_dict
+
+    @staticmethod
+    def __write_req_json(file_path: str, json_dict: dict, json_codec: ReqJsonCodec) -> int or None:
+        """
+        Write to a temp file, fsync it, then rename it over the target. So the req file is never half written.
+        :return: The digest of the written content. None if fail.
+        """
+        temp_path = ''
         try:
-            self.__req_data_dict = self.__req_node_root.to_dict()
-            json_dict = {
-                'req_meta': self.__req_meta_dict,
-                'req_data': self.__req_data_dict
-            }
+            json_bytes = json_codec.dumps(json_dict)
+            if os.linesep != '\n':
+                # Same as text mode writing, but the digest can be calculated from the bytes without reading back.
+                json_bytes = json_bytes.replace(b'\n', os.linesep.encode('ascii'))
+
+            file_dir = os.path.dirname(os.path.abspath(file_path))
+            fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(file_path) + '.', suffix='.tmp', dir=file_dir)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json_bytes)
+                f.flush()
+                os.fsync(f.fileno())
+            if os.path.exists(file_path):
+                # mkstemp() creates file that only the owner can access.
+                shutil.copymode(file_path, temp_path)
+            os.replace(temp_path, file_path)
+            temp_path = ''
+            ReqSingleJsonFileAgent.__fsync_dir(file_dir)
+            return zlib.crc32(json_bytes)
+        except Exception as e:
+            print(str(e))
+            print(traceback.format_exc())
+            return None
+        finally:
+            if temp_path != '' and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    @staticmethod
+    def __fsync_dir(dir_path: str):
+        # Make the rename durable. Not supported on Windows.
+        if hasattr(os, 'O_DIRECTORY'):
+            try:
+                fd = os.open(dir_path, os.O_RDONLY | os.O_DIRECTORY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except Exception as e:
+                print(f'Warning: Sync dir fail: {str(e)}')
+            finally:
+                pass
+
+    # ------------------------------------------------------------------------------
 
-            json_text = json.dumps(json_dict, indent=4, ensure_ascii=False)
-            with open(self.req_full_path(), 'wt', encoding='utf-8') as f:
-                f.write(json_text)
+    def __append_journal(self, records: List[dict]) -> bool:
+        try:
+            if self.__journal_file is None:
+                self.__journal_file = open(self.journal_full_path(), 'at', encoding='utf-8')
+            lines = []
+            for offset, record in enumerate(records):
+                record['seq'] = self.__journal_seq + offset + 1
+                lines.append(json.dumps(record, ensure_ascii=False) + '\n')
+            self.__journal_file.write(''.join(lines))
+            self.__journal_file.flush()
+            if self.__journal_fsync:
+                os.fsync(self.__journal_file.fileno())
+            self.__journal_seq += len(records)
+            self.__journal_count += len(records)
         except Exception as e:
+            print('Error: Append journal fail.')
             print(str(e))
             print(traceback.format_exc())
             return False
@@ -926,49 +1804,345 @@ class ReqSingleJsonFileAgent(IReqAgent):
             pass
         return True
 
-    def __hash_req(self):
-        sha256_hash = hashlib.sha256()
+    def __close_journal_file(self):
+        if self.__journal_file is not None:
+            self.__journal_file.close()
+            self.__journal_file = None
+
+    def __rotate_journal(self) -> str:
+        """
+        Move the records of current journal into the compacting journal, so the new records during compaction
+            go to a fresh journal file. The compacting journal will be removed after the snapshot written.
+        :return: The compacting journal path
+        """
+        self.__close_journal_file()
+        journal_path = self.journal_full_path()
+        compacting_path = self.req_full_path() + REQ_JOURNAL_COMPACTING_SUFFIX
+        if os.path.exists(journal_path):
+            if os.path.exists(compacting_path):
+                # The last compaction failed. Keep its records.
+                with open(journal_path, 'rb') as f_journal, open(compacting_path, 'ab') as f_compacting:
+                    shutil.copyfileobj(f_journal, f_compacting)
+                os.remove(journal_path)
+            else:
+                os.replace(journal_path, compacting_path)
+        self.__journal_count = 0
+        return compacting_path
+
+    def __compact_journal(self, background: bool) -> bool:
+        # The rotation cannot run during the last compaction is writing, which removes compacting journal after.
+        self.__save_worker.wait()
+        if self.__req_node_root is None:
+            return False
+
         try:
-            with open(self.req_full_path(), "rb") as f:
-                for byte_block in iter(lambda: f.read(4096), b""):
-                    sha256_hash.update(byte_block)
-        except FileNotFoundError:
-            # The first save may cause file not found fail.
-            return ''
+            compacting_path = self.__rotate_journal()
         except Exception as e:
-            print('Error: Hash req file fail.')
-            print(e)
-            return ''
-        return sha256_hash.hexdigest()
+            print('Error: Rotate journal fail.')
+            print(str(e))
+            return False
+        finally:
+            pass
 
-    def __check_req_hash(self) -> bool:
-        current_req_hash = self.__hash_req()
-        return current_req_hash == self.req_hash
+        self.__save_worker.submit((self.__req_json_snapshot(), compacting_path))
+        return True if background else self.__save_worker.wait()
+
+    def __recover_journal(self):
+        records = []
+        for journal_path in [self.req_full_path() + REQ_JOURNAL_COMPACTING_SUFFIX, self.journal_full_path()]:
+            records.extend(ReqSingleJsonFileAgent.__read_journal(journal_path))
+        records = [record for record in records if record.get('seq', 0) > self.__journal_seq]
+        if len(records) == 0:
+            if not self.__read_only:
+                self.__remove_journal_files(self.req_full_path())
+            return
 
-    def __update_req_hash(self):
-        current_req_hash = self.__hash_req()
-        self.req_hash = current_req_hash
+        print(f'Recover {len(records)} journal records.')
+        for record in records:
+            try:
+                self.__apply_journal_record(record)
+            except Exception as e:
+                print(f'Warning: Replay journal record fail: {record.get("seq")} - {str(e)}')
+            finally:
+                pass
+            self.__journal_seq = max(self.__journal_seq, record.get('seq', 0))
 
-    def __indexing(self):
-        self.__collected_information = IReqAgent.collect_node_information(self.__req_node_root)
-        self.__req_id_node_index = self.__collected_information.get('req_id_instance_table', {})
-        self.__uuid_node_index = self.__collected_information.get('uuid_instance_table', {})
+        # Fold the recovered records into the req file. Keep them in memory only if read only.
+        if not self.__read_only:
+            self.__compact_journal(background=False)
 
-        id_prefixes = self.__req_meta_dict.get(STATIC_META_ID_PREFIX, [])
-        self.__req_id_max = IReqAgent.calculate_max_req_id(id_prefixes, list(self.__req_id_node_index.keys()))
+    @staticmethod
+    def __read_journal(journal_path: str) -> List[dict]:
+        records = []
+        if not os.path.exists(journal_path):
+            return records
+        with open(journal_path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except Exception:
+                    # The last record may be incomplete if crashed while writing.
+                    print('Warning: Broken journal record. Ignore the rest.')
+                    break
+                finally:
+                    pass
+        return records
 
-    def __check_correct_req_data(self) -> List:
-        uuids = {}
-        issues = []
+    def __apply_journal_record(self, record: dict):
+        def record_node(key: str) -> ReqNode:
+            req_node = self.get_req_node(record[key])
+            if req_node is None:
+                raise KeyError(f'Node not found: {record[key]}')
+            return req_node
+
+        op = record.get('op')
+        if op == 'insert':
+            parent_node = record_node('parent')
+            nodes = [IReqAgent.req_dict_to_nodes(node_dict) for node_dict in record['nodes']]
+            parent_node.insert_children(nodes, record['pos'])
+            self.__index_nodes(nodes)
+        elif op == 'remove':
+            node = record_node('uuid')
+            node.parent().remove_child(node)
+            self.__unindex_nodes([node])
+        elif op == 'update':
+            node = record_node('uuid')
+            ref_node = ReqNode.create_from_dict(record['data'])
+            self.__unindex_node(node)
+            node.copy_data(ref_node)
+            self.__index_node(node)
+        elif op == 'shift':
+            node = record_node('uuid')
+            node.parent().shift_child(node, record['offset'])
+        elif op == 'meta':
+            self.__req_meta_dict = record['meta']
+        else:
+            raise ValueError(f'Unknown journal operation: {op}')
+
+    @staticmethod
+    def __remove_journal_files(req_file: str):
+        for journal_path in [req_file + REQ_JOURNAL_SUFFIX, req_file + REQ_JOURNAL_COMPACTING_SUFFIX]:
+            try:
+                if os.path.exists(journal_path):
+                    os.remove(journal_path)
+            except Exception as e:
+                print(f'Warning: Remove journal fail: {str(e)}')
+            finally:
+                pass
+
+    # The consistency check compares the file stat first. The content is read and hashed only if the stat
+    #   is ambiguous: the stat changed but the size did not, or the mtime is too close to the last check.
+
+    @staticmethod
+    def __stat_req_file(file_path: str) -> tuple or None:
+        try:
+            st = os.stat(file_path)
+            return st.st_mtime_ns, st.st_size, st.st_ino
+        except FileNotFoundError:
+            # The first save may cause file not found fail.
+            return None
+        except Exception as e:
+            print('Error: Stat req file fail.')
+            print(e)
+            return None
+
+    @staticmethod
+    def __digest_req_file(file_path: str) -> int or None:
+        digest = 0
+        try:
+            with open(file_path, 'rb') as f:
+                for byte_block in iter(lambda: f.read(REQ_DIGEST_READ_CHUNK), b''):
+                    digest = zlib.crc32(byte_block, digest)
+        except Exception as e:
+            print('Error: Hash req file fail.')
+            print(e)
+            return None
+        return digest
+
+    @staticmethod
+    def __make_req_token(stat_key: tuple or None, digest: int or None) -> tuple or None:
+        if stat_key is None:
+            return None
+        racy = time.time_ns() - stat_key[0] < REQ_RACY_MTIME_WINDOW_NS
+        return stat_key, digest, racy
+
+    def __update_req_token(self, digest: int, req_file: str = ''):
+        stat_key = self.__stat_req_file(req_file if req_file != '' else self.req_full_path())
+        self.__req_token = self.__make_req_token(stat_key, digest)
+
+    def __check_req_token(self) -> bool:
+        req_token = self.__req_token
+        req_file = self.req_full_path()
+        stat_key = self.__stat_req_file(req_file)
+
+        if req_token is None or stat_key is None:
+            return req_token is None and stat_key is None
+        if stat_key == req_token[0] and not req_token[2]:
+            return True
+        if stat_key[1] != req_token[0][1] or req_token[1] is None:
+            return False
+
+        digest = self.__digest_req_file(req_file)
+        if digest != req_token[1]:
+            return False
+        # Same content (e.g. touched, or copied back). Take the new stat so the next check can be done by stat.
+        self.__req_token = self.__make_req_token(stat_key, digest)
+        return True
+
+    def __indexing(self):
+        self.__uuid_node_index = {}
+        self.__req_id_node_index = {}
+        self.__uuid_req_id_index = {}
+        self.__pending_parent_index = {}
+        self.__pending_req_id_index = {}
+        req_ids = []
+
+        def index_node(node: ReqNode):
+            _uuid = node.get_uuid().strip()
+            req_id = node.get(STATIC_FIELD_ID, '').strip()
+            if _uuid != '':
+                self.__uuid_node_index[_uuid] = node
+            if req_id != '':
+                if req_id in self.__req_id_node_index.keys():
+                    print(f'Warning: Duplicated Req ID detected: {req_id}')
+                self.__req_id_node_index[req_id] = node
+                if _uuid != '':
+                    self.__uuid_req_id_index[_uuid] = req_id
+                req_ids.append(req_id)
+
+        def index_pending_dict(node_dict: dict, parent_uuid: str):
+            self.__index_pending_dict(node_dict, parent_uuid)
+            req_id = node_dict.get(STATIC_FIELD_ID, '').strip()
+            if req_id != '':
+                req_ids.append(req_id)
+
+        self.__walk_req_data(self.__req_node_root, index_node, index_pending_dict)
+
+        id_prefixes = self.__req_meta_dict.get(STATIC_META_ID_PREFIX, [])
+        self.__req_id_max = IReqAgent.calculate_max_req_id(id_prefixes, req_ids)
+
+    @staticmethod
+    def __walk_req_data(root_node: ReqNode, on_node: Callable[[ReqNode], None],
+                        on_pending_dict: Callable[[dict, str], None]):
+        """
+        Walk the built nodes and the pending child dicts (lazy loading) without building them.
+        :param root_node: The node that walks from.
+        :param on_node: Declaration: f(node: ReqNode)
+        :param on_pending_dict: Declaration: f(node_dict: dict, parent_uuid: str)
+        """
+        node_stack = [root_node]
+        while len(node_stack) > 0:
+            node = node_stack.pop()
+            on_node(node)
+            pending_dicts = node.pending_child_dicts()
+            if pending_dicts is None:
+                node_stack.extend(node.children())
+                continue
+            dict_stack = [(node_dict, node.get_uuid()) for node_dict in pending_dicts]
+            while len(dict_stack) > 0:
+                node_dict, parent_uuid = dict_stack.pop()
+                on_pending_dict(node_dict, parent_uuid)
+                dict_stack.extend((child_dict, node_dict.get(STATIC_FIELD_UUID, ''))
+                                  for child_dict in node_dict.get(STATIC_FIELD_CHILD, []))
+
+    def __build_pending_node(self, req_uuid: str) -> ReqNode or None:
+        # Find the nearest built ancestor, then build the nodes on the path down to the target.
+        path = [req_uuid]
+        parent_uuid = self.__pending_parent_index.get(req_uuid)
+        while parent_uuid not in self.__uuid_node_index:
+            if parent_uuid not in self.__pending_parent_index:
+                return None
+            path.append(parent_uuid)
+            parent_uuid = self.__pending_parent_index[parent_uuid]
+
+        node = self.__uuid_node_index[parent_uuid]
+        for _uuid in reversed(path):
+            for child in node.children():
+                child_uuid = child.get_uuid()
+                if self.__pending_parent_index.pop(child_uuid, None) is not None:
+                    self.__index_node(child)
+            node = self.__uuid_node_index.get(_uuid, None)
+            if node is None:
+                return None
+        return node
+
+    # The full indexing above is only for loading. After that the indexes are maintained incrementally
+    # on every structural change, so node lookup never needs to traverse the whole tree.
+
+    def __index_nodes(self, nodes: List[ReqNode]):
+        for node in nodes:
+            self.__walk_req_data(node, self.__index_node, self.__index_pending_dict)
+
+    def __index_pending_dict(self, node_dict: dict, parent_uuid: str):
+        _uuid = node_dict.get(STATIC_FIELD_UUID, '').strip()
+        req_id = node_dict.get(STATIC_FIELD_ID, '').strip()
+        self.__pending_parent_index[_uuid] = parent_uuid
+        if req_id != '':
+            self.__pending_req_id_index[req_id] = _uuid
+
+    def __unindex_nodes(self, nodes: List[ReqNode]):
+        # The pending nodes under removed nodes are unreachable since their ancestor is not indexed.
+        for node in nodes:
+            self.__walk_req_data(node, self.__unindex_node, lambda node_dict, parent_uuid: None)
+
+    def __index_node(self, node: ReqNode):
+        _uuid = node.get_uuid().strip()
+        req_id = node.get(STATIC_FIELD_ID, '').strip()
+
+        if _uuid != '':
+            self.__uuid_node_index[_uuid] = node
+
+            # The Req ID may be changed in this node instance. Drop the index of the old one.
+            indexed_id = self.__uuid_req_id_index.get(_uuid, '')
+            if indexed_id != req_id:
+                if self.__req_id_node_index.get(indexed_id, None) is node:
+                    del self.__req_id_node_index[indexed_id]
+                if req_id != '':
+                    self.__uuid_req_id_index[_uuid] = req_id
+                else:
+                    self.__uuid_req_id_index.pop(_uuid, None)
+
+        if req_id != '':
+            exists_node = self.__req_id_node_index.get(req_id, None)
+            if exists_node is not None and exists_node is not node:
+                print(f'Warning: Duplicated Req ID detected: {req_id}')
+            self.__req_id_node_index[req_id] = node
+
+            id_prefixes = self.__req_meta_dict.get(STATIC_META_ID_PREFIX, [])
+            for prefix, id_num in IReqAgent.calculate_max_req_id(id_prefixes, [req_id]).items():
+                self.__req_id_max[prefix] = max(id_num, self.__req_id_max.get(prefix, 0))
+
+    def __unindex_node(self, node: ReqNode):
+        _uuid = node.get_uuid().strip()
+        req_id = node.get(STATIC_FIELD_ID, '').strip()
+
+        # Only remove the index that points to this node instance.
+        if self.__uuid_node_index.get(_uuid, None) is node:
+            del self.__uuid_node_index[_uuid]
+            req_id = self.__uuid_req_id_index.pop(_uuid, req_id)
+        if self.__req_id_node_index.get(req_id, None) is node:
+            del self.__req_id_node_index[req_id]
+
+    def __check_correct_req_data(self) -> List:
+        uuids = {}
+        issues = []
 
         def node_checker(node: ReqNode):
             node_uuid = node.get_uuid()
             if node_uuid in uuids.keys():
-                issues.append(f'Detect UUID duplicate: ${node.get_title()}, ${uuids[node_uuid].get_title()}')
+                issues.append(f'Detect UUID duplicate: ${node.get_title()}, ${uuids[node_uuid]}')
                 node.re_assign_uuid()
-            uuids[node.get_uuid()] = node
+            uuids[node.get_uuid()] = node.get_title()
+
+        def dict_checker(node_dict: dict, parent_uuid: str):
+            node_uuid = node_dict.get(STATIC_FIELD_UUID, '')
+            if node_uuid == '' or node_uuid in uuids.keys():
+                issues.append(f'Detect UUID duplicate or missing: ${node_dict.get(STATIC_FIELD_TITLE)}')
+                # Fix the pending dict directly. It's not shared with anything on loading.
+                node_dict[STATIC_FIELD_UUID] = str(uuid.uuid4().hex)
+            uuids[node_dict[STATIC_FIELD_UUID]] = node_dict.get(STATIC_FIELD_TITLE)
 
-        self.__req_node_root.for_each(node_checker)
+        self.__walk_req_data(self.__req_node_root, node_checker, dict_checker)
         return issues
 
     # -------------------------------------------------------------------------------
@@ -982,35 +2156,1130 @@ class ReqSingleJsonFileAgent(IReqAgent):
 
 # ----------------------------------------------------------------------------------------------------------------------
 
-class ReqModel(QAbstractItemModel):
+def iterate_req_tree(root_node: ReqNode) -> Iterator[ReqNode or dict]:
+    """
+    Iterate the node and its descendants in pre-order, including the children dicts that are not built yet
+        (lazy loading). So the whole tree can be visited without materializing it.
+    :return: Iterator of ReqNode, or node dict for the unbuilt ones. Both support get(key, default_val).
+             Do not modify the dict.
+    """
+    stack = [root_node]
+    while len(stack) > 0:
+        item = stack.pop()
+        if isinstance(item, ReqNode):
+            yield item
+            pending_dicts = item.pending_child_dicts()
+            children = item.children() if pending_dicts is None else pending_dicts
+        else:
+            yield item
+            children = item.get(STATIC_FIELD_CHILD, [])
+        stack.extend(reversed(children))
+
+
+def top_level_nodes(nodes: Iterable[ReqNode]) -> List[ReqNode]:
+    """
+    Drop the nodes whose ancestor is in the nodes too. The order is kept.
+        The operation on a node (remove, move...) takes its sub tree. Its descendants should not be operated again.
+    """
+    nodes = list(nodes)
+    node_set = set(nodes)
+    top_nodes = []
+    for node in nodes:
+        ancestor = node.parent()
+        while ancestor is not None and ancestor not in node_set:
+            ancestor = ancestor.parent()
+        if ancestor is None:
+            top_nodes.append(node)
+    return top_nodes
+
+
+def iterate_req_data(root_node: ReqNode) -> Iterator[Tuple[str, dict]]:
+    """
+    Same as iterate_req_tree() but gets the data dict of each node.
+    :return: Iterator of (uuid, node data dict). Do not modify the dict.
+    """
+    for item in iterate_req_tree(root_node):
+        node_data = item.data() if isinstance(item, ReqNode) else item
+        yield node_data.get(STATIC_FIELD_UUID, ''), node_data
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class ReqTextIndex(IReqObserver):
+    """
+    Inverted full-text index of req nodes, for search_tree().
+    Latin words are tokenized by word. CJK text is tokenized as overlapped bigrams, plus the last char of each run
+        (so a single char query can be matched by prefix).
+    The index is built on the first search and then maintained incrementally by the agent notifications.
+
+    Query syntax:
+        word        - Match the words start with it (prefix). Exact match ranks higher.
+        "a phrase"  - Match the exact phrase (case-insensitive).
+        CJK text    - Same as phrase.
+        All terms must be matched. The results are ranked by BM25.
+    """
+
+    CJK_CHARS = '぀-ヿ㐀-䶿一-鿿豈-﫿가-힯'
+
+    # Field weights. The fields not listed here are meta fields, which use the default weight.
+    FIELD_WEIGHT = {
+        STATIC_FIELD_ID: 3.0,
+        STATIC_FIELD_TITLE: 3.0,
+        STATIC_FIELD_CONTENT: 1.0,
+        STATIC_FIELD_LAST_EDITOR: 0.5,
+    }
+    DEFAULT_FIELD_WEIGHT = 1.0
+    NOT_INDEXED_FIELDS = {STATIC_FIELD_UUID, STATIC_FIELD_CHILD, STATIC_FIELD_LAST_CHANGE_TIME}
+
+    # A term shorter than this only matches exactly, or it expands to too many tokens to rank.
+    PREFIX_MIN_LENGTH = 3
+    # The max tokens that a prefix term expands to, and their weight comparing to the exact match.
+    PREFIX_EXPANSION_LIMIT = 128
+    PREFIX_MATCH_WEIGHT = 0.7
+
+    BM25_K1 = 1.2
+    BM25_B = 0.75
+    # Recalculate the cached length normalization when the average doc length changes more than this ratio.
+    DOC_NORM_DRIFT = 0.05
+
+    __TOKEN_RE = re.compile(f'([{CJK_CHARS}]+)|([^\\W{CJK_CHARS}]+)')
+    __WORD_RE = re.compile(f'[^\\W{CJK_CHARS}]+')
+    __CJK_RE = re.compile(f'[{CJK_CHARS}]+')
+    __PHRASE_RE = re.compile(r'"([^"]*)"|“([^”]*)”')
+
+    def __init__(self, req_agent: IReqAgent):
+        super(ReqTextIndex, self).__init__()
+        self.__req_agent = req_agent
+        self.__built = False
+        # token -> {uuid: weighted term frequency}
+        self.__postings: Dict[str, Dict[str, float]] = {}
+        # uuid -> the tokens of this doc, for removing
+        self.__doc_tokens: Dict[str, Tuple[str, ...]] = {}
+        self.__doc_length: Dict[str, float] = {}
+        self.__total_length = 0.0
+        # The cached BM25 length normalization of each doc, and the average doc length it based on.
+        self.__doc_norm: Dict[str, float] = {}
+        self.__norm_avg_length = 0.0
+        # Sorted tokens for prefix lookup
+        self.__sorted_tokens: List[str] = []
+
+    # ---------------------------------------- Search ----------------------------------------
+
+    def search(self, text: str, top_k: int = 0) -> List[Tuple[float, str]]:
+        """
+        :param text: The query text. See class document for the syntax.
+        :param top_k: The max result count. 0 for all.
+        :return: List of (score, node uuid), in descending order of score.
+        """
+        self.__ensure_built()
+
+        phrases = [(a or b).strip() for a, b in ReqTextIndex.__PHRASE_RE.findall(text)]
+        # Each group is the tokens that one term or phrase token can match: [(token, weight)]
+        groups = []
+        for cjk, word in ReqTextIndex.__TOKEN_RE.findall(ReqTextIndex.__PHRASE_RE.sub(' ', text).casefold()):
+            if word != '':
+                groups.append(self.__expand_prefix(word))
+            elif len(cjk) == 1:
+                # A CJK char is specific enough to expand.
+                groups.append(self.__expand_prefix(cjk, 1))
+            else:
+                phrases.append(cjk)
+        phrases = [phrase for phrase in phrases if phrase != '']
+
+        for phrase in phrases:
+            groups.extend([[(token, 1.0)] for token in set(self.tokenize(phrase, True))])
+        if len(groups) == 0:
+            return []
+
+        candidates = self.__match_all(groups)
+        if len(candidates) == 0:
+            return []
+
+        scores = self.__score(candidates, groups)
+        if top_k <= 0:
+            top_k = len(scores)
+
+        # The phrase checking may drop some of the top results. Take more if not enough.
+        take = top_k if len(phrases) == 0 else top_k * 2
+        while True:
+            if take >= len(scores):
+                ranked = sorted(scores.items(), key=itemgetter(1), reverse=True)
+            else:
+                ranked = heapq.nlargest(take, scores.items(), key=itemgetter(1))
+            result = [(score, node_uuid) for node_uuid, score in ranked
+                      if len(phrases) == 0 or self.__contains_phrases(node_uuid, phrases)]
+            if len(result) >= top_k or take >= len(scores):
+                return result[:top_k]
+            take *= 4
+
+    @staticmethod
+    def tokenize(text: str, query: bool = False) -> List[str]:
+        """
+        Split text into index tokens. The order of tokens is not kept.
+        :param text: The text to tokenize.
+        :param query: If True, the last char of a CJK run is not included unless the run is a single char.
+                      Because the indexed doc only has the unigram at the end of its CJK run.
+        """
+        text = text.casefold()
+        tokens = ReqTextIndex.__WORD_RE.findall(text)
+        for cjk in ReqTextIndex.__CJK_RE.findall(text):
+            tokens.extend([cjk[i:i + 2] for i in range(len(cjk) - 1)])
+            if not query or len(cjk) == 1:
+                tokens.append(cjk[-1])
+        return tokens
+
+    def __expand_prefix(self, term: str, min_length: int = PREFIX_MIN_LENGTH) -> List[Tuple[str, float]]:
+        group = [(term, 1.0)] if term in self.__postings else []
+        if len(term) < min_length:
+            return group
+        pos = bisect.bisect_right(self.__sorted_tokens, term)
+        end = min(pos + ReqTextIndex.PREFIX_EXPANSION_LIMIT, len(self.__sorted_tokens))
+        while pos < end and self.__sorted_tokens[pos].startswith(term):
+            group.append((self.__sorted_tokens[pos], ReqTextIndex.PREFIX_MATCH_WEIGHT))
+            pos += 1
+        return group
+
+    def __match_all(self, groups: List[List[Tuple[str, float]]]) -> Set[str]:
+        group_docs = []
+        for group in groups:
+            if len(group) == 1:
+                docs = self.__postings.get(group[0][0], {}).keys()
+            else:
+                docs = set()
+                for token, _ in group:
+                    docs.update(self.__postings.get(token, {}).keys())
+            if len(docs) == 0:
+                return set()
+            group_docs.append(docs)
+        group_docs.sort(key=len)
+        candidates = set(group_docs[0])
+        for docs in group_docs[1:]:
+            candidates.intersection_update(docs)
+            if len(candidates) == 0:
+                break
+        return candidates
+
+    def __score(self, candidates: Set[str], groups: List[List[Tuple[str, float]]]) -> Dict[str, float]:
+        """
+        BM25 score of the candidates. A group scores the best of its tokens.
+        Every candidate has at least one token of each group, so all the group scores have the same keys.
+        """
+        self.__refresh_doc_norm()
+        doc_count = len(self.__doc_length)
+        doc_norm = self.__doc_norm
+
+        scores = None
+        for group in groups:
+            group_scores = {}
+            for token, weight in group:
+                posting = self.__postings.get(token, {})
+                idf = math.log(1 + (doc_count - len(posting) + 0.5) / (len(posting) + 0.5))
+                factor = weight * idf * (ReqTextIndex.BM25_K1 + 1)
+                if len(group) == 1:
+                    if len(posting) == len(candidates):
+                        group_scores = {doc: factor * tf / (tf + doc_norm[doc]) for doc, tf in posting.items()}
+                    else:
+                        group_scores = {doc: factor * posting[doc] / (posting[doc] + doc_norm[doc])
+                                        for doc in candidates}
+                    break
+                for doc, tf in posting.items():
+                    if doc in candidates:
+                        score = factor * tf / (tf + doc_norm[doc])
+                        if score > group_scores.get(doc, 0.0):
+                            group_scores[doc] = score
+            if scores is None:
+                scores = group_scores
+            else:
+                scores = {doc: score + group_scores[doc] for doc, score in scores.items()}
+        return scores
+
+    def __calc_doc_norm(self, length: float) -> float:
+        avg_length = self.__norm_avg_length if self.__norm_avg_length > 0 else 1.0
+        return ReqTextIndex.BM25_K1 * (1 - ReqTextIndex.BM25_B + ReqTextIndex.BM25_B * length / avg_length)
+
+    def __refresh_doc_norm(self):
+        """
+        The length normalization of BM25 depends on the average doc length, which changes with every update.
+        Cache it per doc and only recalculate all when the average length drifts noticeably.
+        """
+        doc_count = len(self.__doc_length)
+        avg_length = self.__total_length / doc_count if doc_count > 0 else 0.0
+        if abs(avg_length - self.__norm_avg_length) <= self.__norm_avg_length * ReqTextIndex.DOC_NORM_DRIFT:
+            return
+        self.__norm_avg_length = avg_length
+        self.__doc_norm = {doc: self.__calc_doc_norm(length) for doc, length in self.__doc_length.items()}
+
+    def __contains_phrases(self, node_uuid: str, phrases: List[str]) -> bool:
+        node = self.__req_agent.get_req_node(node_uuid)
+        if node is None:
+            return False
+        texts = [v.casefold() for k, v in node.data().items()
+                 if isinstance(v, str) and k not in ReqTextIndex.NOT_INDEXED_FIELDS]
+        return all(any(phrase.casefold() in text for text in texts) for phrase in phrases)
+
+    # ---------------------------------------- Indexing ----------------------------------------
+
+    def __ensure_built(self):
+        if self.__built:
+            return
+        self.__clear()
+        root_node = self.__req_agent.get_req_root()
+        if root_node is not None:
+            for node_uuid, node_data in iterate_req_data(root_node):
+                self.__add_doc(node_uuid, node_data.items(), True)
+            self.__sorted_tokens = sorted(self.__postings.keys())
+        self.__built = True
+
+    def __clear(self):
+        self.__postings = {}
+        self.__doc_tokens = {}
+        self.__doc_length = {}
+        self.__total_length = 0.0
+        self.__doc_norm = {}
+        self.__norm_avg_length = 0.0
+        self.__sorted_tokens = []
+
+    def __add_doc(self, node_uuid: str, fields: Iterable[Tuple[str, any]], build: bool = False):
+        if node_uuid in self.__doc_tokens:
+            self.__remove_doc(node_uuid)
+
+        # Join the fields with the same weight, so each weight only needs one tokenizing.
+        weight_texts = {}
+        for key, val in fields:
+            if not isinstance(val, str) or key in ReqTextIndex.NOT_INDEXED_FIELDS:
+                continue
+            weight = ReqTextIndex.FIELD_WEIGHT.get(key, ReqTextIndex.DEFAULT_FIELD_WEIGHT)
+            weight_texts.setdefault(weight, []).append(val)
+
+        term_freq = {}
+        length = 0.0
+        for weight, texts in weight_texts.items():
+            tokens = self.tokenize('\n'.join(texts))
+            for token, count in Counter(tokens).items():
+                term_freq[token] = term_freq.get(token, 0.0) + count * weight
+            length += len(tokens) * weight
+
+        postings = self.__postings
+        for token, freq in term_freq.items():
+            posting = postings.get(token)
+            if posting is None:
+                posting = postings[token] = {}
+                if not build:
+                    bisect.insort(self.__sorted_tokens, token)
+            posting[node_uuid] = freq
+        self.__doc_tokens[node_uuid] = tuple(term_freq.keys())
+        self.__doc_length[node_uuid] = length
+        self.__doc_norm[node_uuid] = self.__calc_doc_norm(length)
+        self.__total_length += length
+
+    def __remove_doc(self, node_uuid: str):
+        for token in self.__doc_tokens.pop(node_uuid, ()):
+            posting = self.__postings.get(token, None)
+            if posting is None:
+                continue
+            posting.pop(node_uuid, None)
+            if len(posting) == 0:
+                del self.__postings[token]
+                pos = bisect.bisect_left(self.__sorted_tokens, token)
+                if pos < len(self.__sorted_tokens) and self.__sorted_tokens[pos] == token:
+                    del self.__sorted_tokens[pos]
+        self.__total_length -= self.__doc_length.pop(node_uuid, 0.0)
+        self.__doc_norm.pop(node_uuid, None)
+
+    # ---------------------------------------- Observer ----------------------------------------
+
+    def on_req_loaded(self, req_uri: str):
+        # Rebuild on next search
+        self.__built = False
+        self.__clear()
+
+    def on_req_closed(self, req_uri: str):
+        self.__built = False
+        self.__clear()
+
+    def on_node_data_changed(self, req_name: str, req_node: ReqNode):
+        if self.__built:
+            self.__add_doc(req_node.get_uuid(), req_node.data().items())
+
+    def on_node_structure_changed(self, req_name: str, parent_node: ReqNode, child_node: List[ReqNode], operation: str):
+        if not self.__built:
+            return
+        if operation == 'add':
+            for node in child_node:
+                for node_uuid, node_data in iterate_req_data(node):
+                    self.__add_doc(node_uuid, node_data.items())
+        elif operation == 'remove':
+            for node in child_node:
+                for item in iterate_req_tree(node):
+                    self.__remove_doc(item.get(STATIC_FIELD_UUID, ''))
+        else:
+            pass
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class ReqQueryEngine(IReqObserver):
+    """
+    Structured query of req nodes by field value. Example:
+        Status=Approved AND Priority~"Must" AND id:WHAT* AND last_change_time>2024-06-01
+
+    Conditions: <field><operator><value>. The field and the value can be quoted. Both are case-insensitive.
+        =   Equal.                          !=  Not equal.
+        ~   Contains.                       :   Wildcard match (* and ?).
+        >   >=  <   <=  Compare. As number if both sides are numbers, else as text (works for the date time text).
+    Conditions can be combined by AND, OR, NOT and parentheses. Adjacent conditions without operator are AND.
+
+    The meta fields (defined by get_req_meta()) and the fields in INDEXED_STATIC_FIELDS are indexed by value.
+        Other fields (like title and content) are checked by scanning all nodes.
+    The index is built on the first query and then maintained incrementally by the agent notifications.
+    """
+
+    INDEXED_STATIC_FIELDS = [STATIC_FIELD_ID, STATIC_FIELD_LAST_EDITOR, STATIC_FIELD_LAST_CHANGE_TIME]
+
+    __TOKEN_RE = re.compile(r'\s*(?:(\()|(\))|(!=|>=|<=|=|~|:|>|<)|"([^"]*)"|\'([^\']*)\'|([^\s()=!~:<>"\']+))')
+
+    def __init__(self, req_agent: IReqAgent):
+        super(ReqQueryEngine, self).__init__()
+        self.__req_agent = req_agent
+        self.__built = False
+        # field -> {normalized value: {uuid}}
+        self.__value_index: Dict[str, Dict[str, Set[str]]] = {}
+        # uuid -> {field: normalized value}, for removing
+        self.__doc_values: Dict[str, Dict[str, str]] = {}
+
+    # ---------------------------------------- Query ----------------------------------------
+
+    def query(self, text: str) -> List[str]:
+        """
+        :param text: The query expression. See class document for the syntax.
+        :return: The uuids of matched nodes, in tree order (pre-order).
+        :raise ValueError: The query expression is invalid.
+        """
+        expr = self.parse(text)
+        self.__ensure_built()
+        matched = self.__evaluate(expr)
+        root_node = self.__req_agent.get_req_root()
+        if len(matched) == 0 or root_node is None:
+            return []
+        return [node_uuid for node_uuid in (item.get(STATIC_FIELD_UUID, '') for item in iterate_req_tree(root_node))
+                if node_uuid in matched]
+
+    @staticmethod
+    def parse(text: str) -> tuple:
+        """
+        Parse the query expression to a syntax tree of tuples:
+            ('and', left, right), ('or', left, right), ('not', expr), ('cond', field, operator, value)
+        :raise ValueError: The query expression is invalid.
+        """
+        tokens = ReqQueryEngine.__tokenize(text)
+        if len(tokens) == 0:
+            raise ValueError('Empty query.')
+        expr, pos = ReqQueryEngine.__parse_or(tokens, 0)
+        if pos < len(tokens):
+            raise ValueError(f'Unexpected "{tokens[pos][1]}".')
+        return expr
+
+    @staticmethod
+    def __tokenize(text: str) -> List[Tuple[str, str]]:
+        """
+        :return: List of (kind, text). Kind: '(', ')', 'op', 'word' (keywords are words too), 'quoted'.
+        """
+        tokens = []
+        pos = 0
+        text = text.rstrip()
+        while pos < len(text):
+            m = ReqQueryEngine.__TOKEN_RE.match(text, pos)
+            if m is None or m.end() == pos:
+                raise ValueError(f'Invalid query at: {text[pos:]}')
+            pos = m.end()
+            left, right, op, double_quoted, single_quoted, word = m.groups()
+            if left is not None:
+                tokens.append(('(', left))
+            elif right is not None:
+                tokens.append((')', right))
+            elif op is not None:
+                tokens.append(('op', op))
+            elif word is not None:
+                tokens.append(('word', word))
+            else:
+                tokens.append(('quoted', double_quoted if double_quoted is not None else single_quoted))
+        return tokens
+
+    @staticmethod
+    def __is_keyword(tokens: List[Tuple[str, str]], pos: int, keyword: str) -> bool:
+        return pos < len(tokens) and tokens[pos][0] == 'word' and tokens[pos][1].upper() == keyword
+
+    @staticmethod
+    def __parse_or(tokens: List[Tuple[str, str]], pos: int) -> Tuple[tuple, int]:
+        left, pos = ReqQueryEngine.__parse_and(tokens, pos)
+        while ReqQueryEngine.__is_keyword(tokens, pos, 'OR'):
+            right, pos = ReqQueryEngine.__parse_and(tokens, pos + 1)
+            left = ('or', left, right)
+        return left, pos
+
+    @staticmethod
+    def __parse_and(tokens: List[Tuple[str, str]], pos: int) -> Tuple[tuple, int]:
+        left, pos = ReqQueryEngine.__parse_not(tokens, pos)
+        while pos < len(tokens) and tokens[pos][0] != ')' and not ReqQueryEngine.__is_keyword(tokens, pos, 'OR'):
+            if ReqQueryEngine.__is_keyword(tokens, pos, 'AND'):
+                pos += 1
+            right, pos = ReqQueryEngine.__parse_not(tokens, pos)
+            left = ('and', left, right)
+        return left, pos
+
+    @staticmethod
+    def __parse_not(tokens: List[Tuple[str, str]], pos: int) -> Tuple[tuple, int]:
+        if ReqQueryEngine.__is_keyword(tokens, pos, 'NOT'):
+            expr, pos = ReqQueryEngine.__parse_not(tokens, pos + 1)
+            return ('not', expr), pos
+        if pos < len(tokens) and tokens[pos][0] == '(':
+            expr, pos = ReqQueryEngine.__parse_or(tokens, pos + 1)
+            if pos >= len(tokens) or tokens[pos][0] != ')':
+                raise ValueError('Missing ")".')
+            return expr, pos + 1
+        return ReqQueryEngine.__parse_condition(tokens, pos)
+
+    @staticmethod
+    def __parse_condition(tokens: List[Tuple[str, str]], pos: int) -> Tuple[tuple, int]:
+        if pos >= len(tokens):
+            raise ValueError('Missing condition at the end of query.')
+        if len(tokens) - pos < 3:
+            raise ValueError(f'Incomplete condition: {" ".join(t[1] for t in tokens[pos:])}')
+        (field_kind, field), (op_kind, op), (value_kind, value) = tokens[pos:pos + 3]
+        if field_kind not in ('word', 'quoted') or op_kind != 'op' or value_kind not in ('word', 'quoted'):
+            raise ValueError(f'Invalid condition: {field} {op} {value}. Expect <field><operator><value>.')
+        return ('cond', field, op, value), pos + 3
+
+    # ---------------------------------------- Evaluate ----------------------------------------
+
+    def __evaluate(self, expr: tuple) -> Set[str]:
+        kind = expr[0]
+        if kind == 'and':
+            left = self.__evaluate(expr[1])
+            return left & self.__evaluate(expr[2]) if len(left) > 0 else left
+        elif kind == 'or':
+            return self.__evaluate(expr[1]) | self.__evaluate(expr[2])
+        elif kind == 'not':
+            return set(self.__doc_values.keys()) - self.__evaluate(expr[1])
+        else:
+            return self.__evaluate_condition(expr[1], expr[2], expr[3])
+
+    def __evaluate_condition(self, field: str, op: str, value: str) -> Set[str]:
+        field = self.__resolve_field(field)
+        value = self.__normalize(value)
+        match = self.__value_matcher(op, value)
+        value_index = self.__value_index.get(field, None)
+
+        if value_index is not None:
+            if op == '=':
+                return set(value_index.get(value, set()))
+            if op == '!=':
+                # Includes the nodes that do not have this field.
+                return set(self.__doc_values.keys()) - value_index.get(value, set())
+            matched = set()
+            for field_value, docs in value_index.items():
+                if match(field_value):
+                    matched.update(docs)
+            return matched
+
+        # Not indexed field, scan all nodes.
+        matched = set()
+        root_node = self.__req_agent.get_req_root()
+        if root_node is None:
+            return matched
+        for item in iterate_req_tree(root_node):
+            node_uuid = item.get(STATIC_FIELD_UUID, '')
+            if node_uuid not in self.__doc_values:
+                continue
+            field_value = item.get(field, None)
+            if field_value is None:
+                if op == '!=':
+                    matched.add(node_uuid)
+            elif match(self.__normalize(field_value)):
+                matched.add(node_uuid)
+        return matched
+
+    def __resolve_field(self, field: str) -> str:
+        """
+        Field names are case-insensitive. Prefer the exact one.
+        """
+        if field in self.__value_index or field in STATIC_FIELDS:
+            return field
+        for known_field in list(self.__value_index.keys()) + STATIC_FIELDS:
+            if known_field.casefold() == field.casefold():
+                return known_field
+        return field
+
+    @staticmethod
+    def __value_matcher(op: str, value: str) -> Callable[[str], bool]:
+        if op == '=':
+            return lambda v: v == value
+        elif op == '!=':
+            return lambda v: v != value
+        elif op == '~':
+            return lambda v: value in v
+        elif op == ':':
+            pattern = re.compile(fnmatch.translate(value), re.DOTALL)
+            return lambda v: pattern.match(v) is not None
+        else:
+            compare = {
+                '>': lambda a, b: a > b,
+                '>=': lambda a, b: a >= b,
+                '<': lambda a, b: a < b,
+                '<=': lambda a, b: a <= b,
+            }[op]
+            number = ReqQueryEngine.__to_number(value)
+            if number is None:
+                return lambda v: compare(v, value)
+            else:
+                return lambda v: (ReqQueryEngine.__to_number(v) is not None and
+                                  compare(ReqQueryEngine.__to_number(v), number))
+
+    @staticmethod
+    def __to_number(text: str) -> float or None:
+        try:
+            return float(text)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def __normalize(value: any) -> str:
+        return (value if isinstance(value, str) else str(value)).strip().casefold()
+
+    # ---------------------------------------- Indexing ----------------------------------------
+
+    def __ensure_built(self):
+        if self.__built:
+            return
+        req_meta = self.__req_agent.get_req_meta()
+        indexed_fields = list(ReqQueryEngine.INDEXED_STATIC_FIELDS)
+        if isinstance(req_meta, dict):
+            indexed_fields.extend([field for field in req_meta.keys() if field not in indexed_fields])
+        self.__value_index = {field: {} for field in indexed_fields}
+        self.__doc_values = {}
+
+        root_node = self.__req_agent.get_req_root()
+        if root_node is not None:
+            root_uuid = root_node.get_uuid()
+            for node_uuid, node_data in iterate_req_data(root_node):
+                # The root node is a container, not a req item.
+                if node_uuid != root_uuid:
+                    self.__add_doc(node_uuid, node_data)
+        self.__built = True
+
+    def __add_doc(self, node_uuid: str, node_data: dict):
+        if node_uuid in self.__doc_values:
+            self.__remove_doc(node_uuid)
+        doc_values = {}
+        for field, value_index in self.__value_index.items():
+            value = node_data.get(field, None)
+            if value is None:
+                continue
+            value = self.__normalize(value)
+            value_index.setdefault(value, set()).add(node_uuid)
+            doc_values[field] = value
+        self.__doc_values[node_uuid] = doc_values
+
+    def __remove_doc(self, node_uuid: str):
+        for field, value in self.__doc_values.pop(node_uuid, {}).items():
+            docs = self.__value_index[field].get(value, None)
+            if docs is not None:
+                docs.discard(node_uuid)
+                if len(docs) == 0:
+                    del self.__value_index[field][value]
+
+    def __reset(self):
+        self.__built = False
+        self.__value_index = {}
+        self.__doc_values = {}
+
+    # ---------------------------------------- Observer ----------------------------------------
+
+    def on_req_loaded(self, req_uri: str):
+        self.__reset()
+
+    def on_req_closed(self, req_uri: str):
+        self.__reset()
+
+    def on_meta_data_changed(self, req_name: str):
+        # The indexed fields are changed. Rebuild on next query.
+        self.__reset()
+
+    def on_node_data_changed(self, req_name: str, req_node: ReqNode):
+        if self.__built:
+            self.__add_doc(req_node.get_uuid(), req_node.data())
+
+    def on_node_structure_changed(self, req_name: str, parent_node: ReqNode, child_node: List[ReqNode], operation: str):
+        if not self.__built:
+            return
+        if operation == 'add':
+            for node in child_node:
+                for node_uuid, node_data in iterate_req_data(node):
+                    self.__add_doc(node_uuid, node_data)
+        elif operation == 'remove':
+            for node in child_node:
+                for item in iterate_req_tree(node):
+                    self.__remove_doc(item.get(STATIC_FIELD_UUID, ''))
+        else:
+            pass
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class ReqUndoStack(IReqObserver):
+    """
+    The undo / redo history of req editing. A command keeps the inverse of its operations only, not a copy of the req:
+        insert / remove / move  - The nodes with their parents and positions. The removed sub tree is kept by reference.
+        shift                   - The actual offset.
+        update                  - The changed fields. A text field keeps only the changed middle part (the common
+                                    prefix and suffix stripped), so editing one line of a long content costs one line.
+        meta                    - The meta dict before and after. It's small.
+    The node operations are recorded by ReqModel and executed back by ReqModel, so the view is updated as editing.
+        The meta changes are recorded by observing the agent.
+    The oldest commands are dropped when the estimated memory usage exceeds the budget.
+    """
+
+    # The content edits of the same node within the merge interval are merged into one command.
+    MERGE_FIELDS = (STATIC_FIELD_CONTENT, STATIC_FIELD_LAST_EDITOR, STATIC_FIELD_LAST_CHANGE_TIME)
+
+    DEFAULT_MEMORY_BUDGET = 16 * 1024 * 1024
+    DEFAULT_MERGE_INTERVAL = 2.0
+
+    # The estimated memory of an operation besides its text and values.
+    OPERATION_OVERHEAD = 64
+
+    def __init__(self, req_data_agent: IReqAgent, req_model: ReqModel,
+                 memory_budget: int = DEFAULT_MEMORY_BUDGET, merge_interval: float = DEFAULT_MERGE_INTERVAL):
+        super(ReqUndoStack, self).__init__()
+        self.__req_data_agent = req_data_agent
+        self.__req_model = req_model
+        self.__memory_budget = memory_budget
+        self.__merge_interval = merge_interval
+
+        # Command: {'name': str, 'ops': [operation tuple], 'size': estimated bytes, 'time': last record time}
+        self.__undo_commands = deque()
+        self.__redo_commands = []
+        self.__memory_usage = 0
+
+        self.__compound_depth = 0
+        self.__compound_ops = []
+        # The operations executed by undo / redo are not recorded.
+        self.__replaying = False
+        self.__meta_snapshot = None
+
+    # ------------------------------------- Method -------------------------------------
+
+    def set_memory_budget(self, memory_budget: int):
+        self.__memory_budget = memory_budget
+        self.__trim()
+
+    def set_merge_interval(self, merge_interval: float):
+        """
+        :param merge_interval: In seconds. 0 to disable merging.
+        """
+        self.__merge_interval = merge_interval
+
+    def can_undo(self) -> bool:
+        return len(self.__undo_commands) > 0
+
+    def can_redo(self) -> bool:
+        return len(self.__redo_commands) > 0
+
+    def undo_text(self) -> str:
+        return self.__undo_commands[-1]['name'] if self.can_undo() else ''
+
+    def redo_text(self) -> str:
+        return self.__redo_commands[-1]['name'] if self.can_redo() else ''
+
+    def memory_usage(self) -> int:
+        return self.__memory_usage
+
+    def clear(self):
+        self.__undo_commands.clear()
+        self.__redo_commands.clear()
+        self.__memory_usage = 0
+
+    def undo(self) -> str:
+        """
+        :return: The name of the undone command. Empty if nothing to undo.
+        """
+        if not self.can_undo():
+            return ''
+        command = self.__undo_commands.pop()
+        if not self.__execute(command, True):
+            return ''
+        self.__redo_commands.append(command)
+        return command['name']
+
+    def redo(self) -> str:
+        """
+        :return: The name of the redone command. Empty if nothing to redo.
+        """
+        if not self.can_redo():
+            return ''
+        command = self.__redo_commands.pop()
+        if not self.__execute(command, False):
+            return ''
+        self.__undo_commands.append(command)
+        return command['name']
+
+    @contextlib.contextmanager
+    def compound(self, name: str):
+        """
+        The operations recorded in this context are undone and redone as one command. Can be nested.
+        """
+        self.__compound_depth += 1
+        try:
+            yield
+        finally:
+            self.__compound_depth -= 1
+            if self.__compound_depth == 0:
+                ops, self.__compound_ops = self.__compound_ops, []
+                if len(ops) > 0:
+                    self.__push(name, ops)
+
+    # ------------------------------------- Record -------------------------------------
+
+    def record_insert(self, parent_node: ReqNode, pos: int, nodes: List[ReqNode]):
+        self.__record('Insert', ('insert', parent_node, pos, list(nodes)))
+
+    def record_remove(self, positions: List[Tuple[ReqNode, int, ReqNode]]):
+        """
+        :param positions: [(parent node, position before removing, removed node)]
+        """
+        self.__record('Remove', ('remove', list(positions)))
+
+    def record_move(self, positions: List[Tuple[ReqNode, int, ReqNode]], parent_node: ReqNode, pos: int):
+        """
+        :param positions: [(parent node, position before moving, moved node)]
+        :param parent_node: The parameters of the moving. For redo.
+        """
+        self.__record('Move', ('move', list(positions), parent_node, pos))
+
+    def record_shift(self, node: ReqNode, offset: int):
+        if offset != 0:
+            self.__record('Shift', ('shift', node, offset))
+
+    def record_update(self, node: ReqNode, changes: Dict[str, tuple]):
+        """
+        :param changes: The field changes from diff_node(). Call after the node is updated.
+        """
+        if len(changes) == 0 or self.__replaying:
+            return
+        if self.__compound_depth == 0 and self.__merge_update(node, changes):
+            return
+        self.__record('Edit', ('update', node, changes))
+
+    def record_field(self, key: str, value: any, old_values: List[Tuple[ReqNode, any]]):
+        """
+        :param old_values: [(node, field value before setting)]
+        """
+        self.__record(f'Set {key}', ('field', key, value, list(old_values)))
+
+    @staticmethod
+    def diff_node(old_node: ReqNode, new_node: ReqNode) -> Dict[str, tuple]:
+        """
+        :return: {field: change} of the fields that differ. See __make_change().
+        """
+        old_data = old_node.data()
+        new_data = new_node.data()
+        changes = {}
+        for key in old_data.keys() | new_data.keys():
+            change = ReqUndoStack.__make_change(old_data.get(key, None), new_data.get(key, None))
+            if change is not None:
+                changes[key] = change
+        return changes
+
+    # ------------------------------------ Observer ------------------------------------
+
+    def on_req_loaded(self, req_uri: str):
+        self.clear()
+        self.__meta_snapshot = copy.deepcopy(self.__req_data_agent.get_req_meta())
+
+    def on_req_closed(self, req_uri: str):
+        self.clear()
+        self.__meta_snapshot = None
+
+    def on_meta_data_changed(self, req_name: str):
+        if self.__replaying:
+            return
+        old_meta = self.__meta_snapshot
+        self.__meta_snapshot = copy.deepcopy(self.__req_data_agent.get_req_meta())
+        if old_meta is not None and old_meta != self.__meta_snapshot:
+            self.__record('Edit Meta', ('meta', old_meta, self.__meta_snapshot))
+
+    # ------------------------------------ Execute -------------------------------------
+
+    def __execute(self, command: dict, undo: bool) -> bool:
+        self.__replaying = True
+        try:
+            # Saved once for the whole command.
+            with self.__req_data_agent.batch():
+                for op in (reversed(command['ops']) if undo else command['ops']):
+                    self.__execute_operation(op, undo)
+            return True
+        except Exception as e:
+            # The req is not the state that the history expects (e.g. changed by a plugin directly).
+            print(str(e))
+            print(traceback.format_exc())
+            print('Warning: Undo history is not consistent with the req. Clear the history.')
+            self.clear()
+            return False
+        finally:
+            self.__replaying = False
+
+    def __execute_operation(self, op: tuple, undo: bool):
+        op_type = op[0]
+        if op_type == 'insert':
+            _, parent_node, pos, nodes = op
+            if undo:
+                self.__req_model.remove_nodes(nodes)
+            else:
+                self.__req_model.insert_node_children(parent_node, nodes, pos)
+        elif op_type == 'remove':
+            _, positions = op
+            if undo:
+                self.__insert_at_positions(positions)
+            else:
+                self.__req_model.remove_nodes([node for _, _, node in positions])
+        elif op_type == 'move':
+            _, positions, parent_node, pos = op
+            if undo:
+                # Take them out and put them back. Simpler than reverting the moves one by one.
+                self.__req_model.remove_nodes([node for _, _, node in positions])
+                self.__insert_at_positions(positions)
+            else:
+                self.__req_model.move_nodes([node for _, _, node in positions], parent_node, pos)
+        elif op_type == 'shift':
+            _, node, offset = op
+            self.__req_model.shift_node(node, -offset if undo else offset)
+        elif op_type == 'update':
+            _, node, changes = op
+            update_node = node.clone()
+            for key, change in changes.items():
+                update_node.set(key, ReqUndoStack.__apply_change(node.get(key, None), change, undo))
+            self.__req_model.update_node(update_node)
+        elif op_type == 'field':
+            _, key, value, old_values = op
+            if undo:
+                for node, old_value in old_values:
+                    update_node = node.clone()
+                    update_node.set(key, old_value)
+                    self.__req_model.update_node(update_node)
+            else:
+                self.__req_model.update_nodes_field([node for node, _ in old_values], key, value)
+        elif op_type == 'meta':
+            _, old_meta, new_meta = op
+            self.__meta_snapshot = copy.deepcopy(old_meta if undo else new_meta)
+            self.__req_data_agent.set_req_meta(copy.deepcopy(self.__meta_snapshot))
+
+    def __insert_at_positions(self, positions: List[Tuple[ReqNode, int, ReqNode]]):
+        # The positions are before the nodes were taken out. From the front, so each position is right when inserting.
+        for parent_node, pos, node in sorted(positions, key=itemgetter(1)):
+            self.__req_model.insert_node_children(parent_node, [node], min(pos, parent_node.child_count()))
+
+    # ------------------------------------- History ------------------------------------
+
+    def __record(self, name: str, op: tuple):
+        if self.__replaying:
+            return
+        if self.__compound_depth > 0:
+            self.__compound_ops.append(op)
+        else:
+            self.__push(name, [op])
+
+    def __push(self, name: str, ops: List[tuple]):
+        size = sum(ReqUndoStack.__estimate_size(op) for op in ops)
+        self.__undo_commands.append({'name': name, 'ops': ops, 'size': size, 'time': time.monotonic()})
+        self.__memory_usage += size
+        # A new edit ends the redo branch.
+        for command in self.__redo_commands:
+            self.__memory_usage -= command['size']
+        self.__redo_commands.clear()
+        self.__trim()
+
+    def __trim(self):
+        # Keep the latest command even if it's over budget.
+        while self.__memory_usage > self.__memory_budget and len(self.__undo_commands) > 1:
+            self.__memory_usage -= self.__undo_commands.popleft()['size']
+
+    def __merge_update(self, node: ReqNode, changes: Dict[str, tuple]) -> bool:
+        if self.__merge_interval <= 0 or not self.can_undo() or self.can_redo():
+            return False
+        command = self.__undo_commands[-1]
+        now = time.monotonic()
+        if now - command['time'] > self.__merge_interval or len(command['ops']) != 1:
+            return False
+        op = command['ops'][0]
+        if op[0] != 'update' or op[1] is not node:
+            return False
+        prev_changes = op[2]
+        if any(key not in ReqUndoStack.MERGE_FIELDS for key in prev_changes.keys() | changes.keys()):
+            return False
+
+        merged = {}
+        for key in prev_changes.keys() | changes.keys():
+            # Rebuild the value before the previous edit from the current value, then diff it again.
+            current = node.get(key, None)
+            original = current
+            if key in changes:
+                original = ReqUndoStack.__apply_change(original, changes[key], True)
+            if key in prev_changes:
+                original = ReqUndoStack.__apply_change(original, prev_changes[key], True)
+            change = ReqUndoStack.__make_change(original, current)
+            if change is not None:
+                merged[key] = change
+
+        merged_op = ('update', node, merged)
+        size = ReqUndoStack.__estimate_size(merged_op)
+        self.__memory_usage += size - command['size']
+        command.update({'ops': [merged_op], 'size': size, 'time': now})
+        self.__trim()
+        return True
+
+    # ------------------------------------- Change -------------------------------------
+
+    @staticmethod
+    def __make_change(old_val: any, new_val: any) -> tuple or None:
+        """
+        :return: ('text', prefix length, old middle, new middle) for strings. ('value', old, new) for others.
+                 None if not changed.
+        """
+        if old_val == new_val:
+            return None
+        if not isinstance(old_val, str) or not isinstance(new_val, str):
+            return 'value', old_val, new_val
+        limit = min(len(old_val), len(new_val))
+        prefix = 0
+        while prefix < limit and old_val[prefix] == new_val[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < limit - prefix and old_val[-1 - suffix] == new_val[-1 - suffix]:
+            suffix += 1
+        return 'text', prefix, old_val[prefix:len(old_val) - suffix], new_val[prefix:len(new_val) - suffix]
+
+    @staticmethod
+    def __apply_change(value: any, change: tuple, undo: bool) -> any:
+        if change[0] == 'value':
+            return change[1] if undo else change[2]
+        _, prefix, old_mid, new_mid = change
+        from_mid, to_mid = (new_mid, old_mid) if undo else (old_mid, new_mid)
+        value = value if isinstance(value, str) else ''
+        return value[:prefix] + to_mid + value[prefix + len(from_mid):]
+
+    @staticmethod
+    def __estimate_size(op: tuple) -> int:
+        op_type = op[0]
+        if op_type == 'insert' or op_type == 'remove' or op_type == 'move':
+            nodes = op[3] if op_type == 'insert' else [node for _, _, node in op[1]]
+            if op_type == 'move':
+                # The moved nodes are still in the tree.
+                return ReqUndoStack.OPERATION_OVERHEAD * (len(nodes) + 1)
+            # The nodes may be taken out of the tree and kept by the history only.
+            return sum(sys.getsizeof(val) for node in nodes
+                       for _, node_data in iterate_req_data(node) for val in node_data.values())
+        elif op_type == 'update':
+            return ReqUndoStack.OPERATION_OVERHEAD + \
+                sum(sys.getsizeof(val) for change in op[2].values() for val in change[1:])
+        elif op_type == 'field':
+            return ReqUndoStack.OPERATION_OVERHEAD * (len(op[3]) + 1) + \
+                sum(sys.getsizeof(val) for _, val in op[3])
+        elif op_type == 'meta':
+            return ReqUndoStack.OPERATION_OVERHEAD + sys.getsizeof(str(op[1])) + sys.getsizeof(str(op[2]))
+        return ReqUndoStack.OPERATION_OVERHEAD
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class ReqModel(QAbstractItemModel, IReqObserver):
+    # The children of a node are exposed to the view by fetchMore() in batches of this size.
+    FETCH_BATCH_SIZE = 256
+
     def __init__(self, req_data_agent: IReqAgent):
         super(ReqModel, self).__init__()
         self.__req_data_agent = req_data_agent
         self.__show_meta = False
         self.__meta_full_columns = []
         self.__meta_selected_columns = []
+        # The column titles are built from req meta. Rebuild only when the meta changed.
+        self.__column_titles: List[str] or None = None
+        # uuid -> The display text tuple of the row. Built on the first paint and dropped when the node changed.
+        self.__row_display: Dict[str, tuple] = {}
+        # uuid -> The count of the tail children that are not exposed to the view yet.
+        # A node that is not in this dict has no child exposed.
+        self.__unfetched_rows: Dict[str, int] = {}
+        self.__fetching = False
+        # The node operations are recorded here if set. See ReqUndoStack.
+        self.__undo_stack: ReqUndoStack or None = None
 
     # ------------------------------------- Method -------------------------------------
 
+    def set_undo_stack(self, undo_stack: ReqUndoStack or None):
+        self.__undo_stack = undo_stack
+
+    @contextlib.contextmanager
+    def batch(self, name: str):
+        """
+        The node operations in this context are saved once and undone as one command named by name.
+        """
+        with self.__req_data_agent.batch():
+            if self.__undo_stack is None:
+                yield
+            else:
+                with self.__undo_stack.compound(name):
+                    yield
+
     def show_meta(self, show_meta: bool):
         if self.__show_meta != show_meta:
             self.beginResetModel()
             self.__show_meta = show_meta
+            # The rows are built with or without meta columns.
+            self.__row_display.clear()
             self.endResetModel()
 
     def begin_edit(self):
         self.layoutAboutToBeChanged.emit()
 
     def end_edit(self):
+        # The rows may be moved or removed. Point the persistent indexes (selection, expanded items) to them.
+        from_indexes = self.persistentIndexList()
+        to_indexes = [self.__current_index(index.internalPointer(), index.column()) for index in from_indexes]
+        self.changePersistentIndexList(from_indexes, to_indexes)
         self.layoutChanged.emit()
 
+    def begin_reset(self):
+        self.beginResetModel()
+
+    def end_reset(self):
+        # The req is replaced. Nothing is exposed until the view fetches again.
+        self.__unfetched_rows.clear()
+        self.clear_display_cache()
+        self.endResetModel()
+
+    def clear_display_cache(self):
+        self.__column_titles = None
+        self.__row_display.clear()
+
     def index_of_node(self, node: ReqNode) -> QModelIndex:
         if node is None or self.__req_data_agent is None or self.__req_data_agent.get_req_root() is None:
             return QModelIndex()
         if node == self.__req_data_agent.get_req_root():
             return self.createIndex(-1, 0, node)
+        # The node may be in a branch that the view has not fetched yet.
+        self.__expose_node(node)
         return self.createIndex(node.order(), 0, node) if node is not None else QModelIndex()
 
+    def fetch_all_children(self, node: ReqNode):
+        """
+        Expose all children of the node to the view at once. It's required before changing the children.
+        """
+        if node is None:
+            return
+        if self.__fetched_count(node) < node.child_count():
+            self.__fetch_rows(node, node.child_count())
+        else:
+            # A node without children. Mark it as fetched, so the rows inserted later are counted by rowCount().
+            self.__unfetched_rows.setdefault(node.get_uuid(), 0)
+
     @staticmethod
     def get_node_from_index(index: QModelIndex) -> ReqNode:
         return index.internalPointer() if index is not None and index.isValid() else None
@@ -1021,18 +3290,14 @@ class ReqModel(QAbstractItemModel):
         if index is None or not index.isValid() or not index.internalPointer():
             return None
 
-        req_node: ReqNode = index.internalPointer()
-
         if role == Qt.DisplayRole:
+            req_node: ReqNode = index.internalPointer()
+            row_display = self.__row_display.get(req_node.get_uuid(), None)
+            if row_display is None:
+                row_display = self.__build_row_display(req_node)
+                self.__row_display[req_node.get_uuid()] = row_display
             column_index = index.column()
-            if column_index == 0:
-                return req_node.get_title()
-            elif column_index == 1:
-                return req_node.get(STATIC_FIELD_ID, '')
-            elif self.__show_meta:
-                column_titles = self.column_titles()
-                meta_data_key = column_titles[column_index] if column_index < len(column_titles) else ''
-                return req_node.data().get(meta_data_key, '')
+            return row_display[column_index] if column_index < len(row_display) else ''
         return None
 
     def index(self, row, column, parent: QModelIndex = None, *args, **kwargs):
@@ -1066,7 +3331,8 @@ class ReqModel(QAbstractItemModel):
             return QModelIndex()
 
         if parent_item == self.__req_data_agent.get_req_root():
-            return QAbstractItemModel.createIndex(self, 0, 0, parent_item)
+            # The root is represented by the invalid index, the same as what index() and rowCount() expect.
+            return QModelIndex()
         row = parent_item.order()
 
         return QAbstractItemModel.createIndex(self, row, 0, parent_item)
@@ -1079,10 +3345,27 @@ class ReqModel(QAbstractItemModel):
             parent_item = self.__req_data_agent.get_req_root()
         else:
             parent_item: ReqNode = parent.internalPointer()
-        row_count = parent_item.child_count()
+        row_count = self.__fetched_count(parent_item)
 
         return row_count
 
+    def hasChildren(self, parent: QModelIndex = None, *args, **kwargs):
+        # Before fetching the rowCount() is 0. Report the real children so the view shows the expand mark.
+        parent_item = self.__node_of_index(parent)
+        return parent_item is not None and parent_item.child_count() > 0
+
+    def canFetchMore(self, parent: QModelIndex):
+        if self.__fetching:
+            # The view (or anyone connected to rowsAboutToBeInserted) may query during fetching. Do not re-enter.
+            return False
+        parent_item = self.__node_of_index(parent)
+        return parent_item is not None and self.__fetched_count(parent_item) < parent_item.child_count()
+
+    def fetchMore(self, parent: QModelIndex):
+        parent_item = self.__node_of_index(parent)
+        if parent_item is not None:
+            self.__fetch_rows(parent_item, self.__fetched_count(parent_item) + ReqModel.FETCH_BATCH_SIZE, parent)
+
     def columnCount(self, parent: QModelIndex = None, *args, **kwargs):
         return 1 if not self.__show_meta else len(self.column_titles())
 
@@ -1130,10 +3413,12 @@ class ReqModel(QAbstractItemModel):
         else:
             parent = self.index_of_node(parent_node)
 
+        # Rows can only be inserted among the rows that the view knows.
+        self.fetch_all_children(parent_node)
+
         if pos < 0:
             pos = parent_node.child_count()
 
-        self.begin_edit()
         self.beginInsertRows(parent, pos, pos + len(insert_nodes) - 1)
 
         # All operation by agent
@@ -1141,7 +3426,222 @@ class ReqModel(QAbstractItemModel):
         self.__req_data_agent.insert_node(parent_node.get_uuid(), pos, insert_nodes)
 
         self.endInsertRows()
-        self.end_edit()
+
+        if self.__undo_stack is not None:
+            self.__undo_stack.record_insert(parent_node, pos, insert_nodes)
+
+    def remove_nodes(self, nodes: List[ReqNode]):
+        """
+        Remove the nodes in one agent batch (one saving). The rows are removed range by range.
+        """
+        nodes = top_level_nodes(node for node in nodes if node.parent() is not None)
+        orders_of_parent = {}
+        positions = []
+        for node in nodes:
+            self.__expose_node(node)
+            orders_of_parent.setdefault(node.parent(), []).append(node.order())
+            positions.append((node.parent(), node.order(), node))
+
+        with self.__req_data_agent.batch():
+            for parent_node, orders in orders_of_parent.items():
+                parent = self.__parent_index(parent_node)
+                # From bottom to top. So the rows of the upper ranges are not changed.
+                orders.sort(reverse=True)
+                while len(orders) > 0:
+                    last = first = orders.pop(0)
+                    while len(orders) > 0 and orders[0] == first - 1:
+                        first = orders.pop(0)
+                    remove_uuids = [node.get_uuid() for node in parent_node.children()[first:last + 1]]
+                    self.beginRemoveRows(parent, first, last)
+                    self.__req_data_agent.remove_nodes(remove_uuids)
+                    self.endRemoveRows()
+
+        if self.__undo_stack is not None and len(positions) > 0:
+            self.__undo_stack.record_remove(positions)
+
+    def move_nodes(self, nodes: List[ReqNode], parent_node: ReqNode, pos: int) -> bool:
+        """
+        Move the nodes in one agent batch (one saving). Each row is moved by beginMoveRows(), so the view keeps
+            its expanded state and selection.
+        :param pos: The position in the children of parent before moving. -1 to append.
+        """
+        ancestor = parent_node
+        while ancestor is not None:
+            if ancestor in nodes:
+                return False
+            ancestor = ancestor.parent()
+
+        nodes = top_level_nodes(nodes)
+        self.index_of_node(parent_node)
+        self.fetch_all_children(parent_node)
+        for node in nodes:
+            self.__expose_node(node)
+
+        # Insert before the anchor node, which is not moved. Its row is the destination of each move.
+        moving_nodes = set(nodes)
+        children = parent_node.children()
+        anchor = next((node for node in children[pos:] if node not in moving_nodes), None) if pos >= 0 else None
+        parent = self.__parent_index(parent_node)
+        positions = [(node.parent(), node.order(), node) for node in nodes]
+
+        moved = False
+        try:
+            with self.__req_data_agent.batch():
+                for node in nodes:
+                    dest_row = anchor.order() if anchor is not None else parent_node.child_count()
+                    if node.parent() is parent_node and dest_row in (node.order(), node.order() + 1):
+                        # Already there.
+                        continue
+                    node_row = node.order()
+                    self.beginMoveRows(self.__parent_index(node.parent()), node_row, node_row, parent, dest_row)
+                    ret = self.__req_data_agent.move_nodes([node.get_uuid()], parent_node.get_uuid(), dest_row)
+                    self.endMoveRows()
+                    if not ret:
+                        return False
+                    moved = True
+            return True
+        finally:
+            if moved and self.__undo_stack is not None:
+                self.__undo_stack.record_move(positions, parent_node, pos)
+
+    def shift_node(self, node: ReqNode, offset: int):
+        parent_node = node.parent() if node is not None else None
+        if parent_node is None:
+            return
+        self.__expose_node(node)
+        order = node.order()
+        new_order = max(0, min(order + offset, parent_node.child_count() - 1))
+        if new_order == order:
+            return
+        if self.__fetched_count(parent_node) <= new_order:
+            self.__fetch_rows(parent_node, new_order + 1)
+
+        parent = self.__parent_index(parent_node)
+        # The destination row of beginMoveRows() is the position before moving.
+        self.beginMoveRows(parent, order, order, parent, new_order + 1 if new_order > order else new_order)
+        self.__req_data_agent.shift_node(node.get_uuid(), offset)
+        self.endMoveRows()
+
+        if self.__undo_stack is not None:
+            # The offset may be clamped. Record the actual one.
+            self.__undo_stack.record_shift(node, new_order - order)
+
+    def update_node(self, node: ReqNode):
+        """
+        Update the node in tree by its copy.
+        """
+        # The row is refreshed by on_node_data_changed().
+        update_node = self.__req_data_agent.get_req_node(node.get_uuid())
+        changes = ReqUndoStack.diff_node(update_node, node) \
+            if self.__undo_stack is not None and update_node is not None and update_node is not node else {}
+        self.__req_data_agent.update_node(node)
+        if len(changes) > 0:
+            self.__undo_stack.record_update(update_node, changes)
+
+    def update_nodes_field(self, nodes: List[ReqNode], key: str, value: any):
+        # The rows are refreshed by on_node_data_changed().
+        old_values = [(node, node.get(key, None)) for node in nodes]
+        self.__req_data_agent.update_nodes_field([node.get_uuid() for node in nodes], key, value)
+        if self.__undo_stack is not None and len(old_values) > 0:
+            self.__undo_stack.record_field(key, value, old_values)
+
+    # ------------------------------------ Observer ------------------------------------
+
+    def on_req_loaded(self, req_uri: str):
+        self.clear_display_cache()
+
+    def on_meta_data_changed(self, req_name: str):
+        self.clear_display_cache()
+        if self.__show_meta:
+            # The meta columns may be added or removed.
+            self.begin_edit()
+            self.end_edit()
+
+    def on_node_data_changed(self, req_name: str, req_node: ReqNode):
+        self.__row_display.pop(req_node.get_uuid(), None)
+        if req_node is self.__req_data_agent.get_req_root():
+            # The req name is shown as header.
+            self.headerDataChanged.emit(Qt.Horizontal, 0, self.columnCount() - 1)
+            return
+        # Repaint this row only. Nothing to do if the view has not fetched it.
+        index = self.__current_index(req_node, 0)
+        if index.isValid():
+            self.dataChanged.emit(index, index.sibling(index.row(), self.columnCount() - 1))
+
+    def on_node_structure_changed(self, req_name: str, parent_node: ReqNode, child_node: [ReqNode], operation: str):
+        if operation == 'remove':
+            for node in child_node:
+                for item in iterate_req_tree(node):
+                    self.__row_display.pop(item.get(STATIC_FIELD_UUID, ''), None)
+
+    def __build_row_display(self, req_node: ReqNode) -> tuple:
+        if not self.__show_meta:
+            return req_node.get_title(), req_node.get(STATIC_FIELD_ID, '')
+        # The first 2 columns are tree (title) and Req ID. See column_titles().
+        return (req_node.get_title(), req_node.get(STATIC_FIELD_ID, '')) + \
+            tuple(req_node.get(key, '') for key in self.column_titles()[2:])
+
+    # ------------------------------------ Fetching ------------------------------------
+
+    def __node_of_index(self, index: QModelIndex) -> ReqNode or None:
+        if self.__req_data_agent is None:
+            return None
+        if index is None or not index.isValid():
+            return self.__req_data_agent.get_req_root()
+        return index.internalPointer()
+
+    def __current_index(self, node: ReqNode, column: int) -> QModelIndex:
+        # The index of node after edit. Invalid if the node is no longer in the tree.
+        root_node = self.__req_data_agent.get_req_root()
+        parent = node.parent() if node is not None else None
+        if parent is None:
+            return QModelIndex()
+        ancestor = parent
+        while ancestor.parent() is not None:
+            ancestor = ancestor.parent()
+        if ancestor is not root_node or node.order() >= self.__fetched_count(parent):
+            return QModelIndex()
+        return self.createIndex(node.order(), column, node)
+
+    def __fetched_count(self, node: ReqNode) -> int:
+        child_count = node.child_count()
+        return max(child_count - self.__unfetched_rows.get(node.get_uuid(), child_count), 0)
+
+    def __fetch_rows(self, node: ReqNode, rows: int, parent: QModelIndex = None):
+        """
+        Expose the children of node to the view until there're at least rows of them.
+        :param parent: The index of node. It's calculated if not provided.
+        """
+        fetched = self.__fetched_count(node)
+        child_count = node.child_count()
+        rows = min(rows, child_count)
+        if self.__fetching or rows <= fetched:
+            return
+        if parent is None:
+            parent = self.__parent_index(node)
+        self.__fetching = True
+        try:
+            self.beginInsertRows(parent, fetched, rows - 1)
+            self.__unfetched_rows[node.get_uuid()] = child_count - rows
+            self.endInsertRows()
+        finally:
+            self.__fetching = False
+
+    def __parent_index(self, node: ReqNode) -> QModelIndex:
+        # The index of node as a parent. The root is the invalid index.
+        return QModelIndex() if node.parent() is None else self.createIndex(node.order(), 0, node)
+
+    def __expose_node(self, node: ReqNode):
+        path = []
+        parent = node.parent()
+        while parent is not None:
+            path.append((parent, node))
+            node, parent = parent, parent.parent()
+        # From top to bottom. A child can only be exposed after its parent.
+        for parent, child in reversed(path):
+            order = child.order()
+            if self.__fetched_count(parent) <= order:
+                self.__fetch_rows(parent, order + 1)
 
     # -------------------------------------------------------------------------------------
 
@@ -1151,16 +3651,16 @@ class ReqModel(QAbstractItemModel):
         self.__meta_selected_columns = self.__meta_full_columns
 
     def column_titles(self) -> List[str]:
-        # TODO: Optimise - Just update when MetaData updated
-        # Why +2 : Reserve the 1st column for tree structure and the 2nd column for Req ID
-        # Why -1 : Ignore STATIC_META_ID_PREFIX column
-        meta_data = self.__req_data_agent.get_req_meta()
-        meta_title = list(meta_data.keys())
-        if STATIC_META_ID_PREFIX in meta_title:
-            meta_title.remove(STATIC_META_ID_PREFIX)
-        meta_title.insert(0, 'Req ID')
-        meta_title.insert(0, 'Tree')
-        return meta_title
+        """
+        The cached column titles. Do not modify the returned list.
+        """
+        if self.__column_titles is None:
+            # Reserve the 1st column for tree structure and the 2nd column for Req ID
+            # Ignore STATIC_META_ID_PREFIX column
+            meta_data = self.__req_data_agent.get_req_meta()
+            self.__column_titles = ['Tree', 'Req ID'] + [key for key in meta_data.keys()
+                                                         if key != STATIC_META_ID_PREFIX]
+        return self.__column_titles
 
 
 # https://gist.github.com/xiaolai/aa190255b7dde302d10208ae247fc9f2
@@ -1556,23 +4056,207 @@ class MarkdownEditor(QTextEdit):
                 if not os.path.exists(new_file_path):
                     return new_file_path, file_name
             else:
-                return '', ''
+                return '', ''
+
+
+class MarkdownRenderCache:
+    """
+    LRU cache of the html rendered by render_markdown(). Shared by the editor preview, html export and pdf printing.
+    The key is (content hash, css hash, extras). The memory of cached html is limited by memory_cap (bytes).
+    Thread safe. The markdown is rendered in worker thread (MarkdownRenderScheduler).
+    """
+
+    DEFAULT_MEMORY_CAP = 32 * 1024 * 1024
+
+    def __init__(self, memory_cap: int = DEFAULT_MEMORY_CAP):
+        self.__lock = threading.Lock()
+        self.__entries: OrderedDict = OrderedDict()
+        self.__memory = 0
+        self.__memory_cap = memory_cap
+        # The css text is big and rarely changes. Cache its hash by the identity of the str object.
+        self.__css_text = None
+        self.__css_digest = b''
+        self.__hits = 0
+        self.__misses = 0
+
+    def set_memory_cap(self, memory_cap: int):
+        """
+        :param memory_cap: The max bytes of cached html. 0 to disable cache.
+        """
+        with self.__lock:
+            self.__memory_cap = max(0, memory_cap)
+            self.__evict()
+
+    def make_key(self, md_text: str, css: str, extras: List[str]) -> tuple:
+        content_digest = hashlib.blake2b(md_text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+        with self.__lock:
+            if css is not self.__css_text:
+                self.__css_digest = hashlib.blake2b(css.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+                self.__css_text = css
+            css_digest = self.__css_digest
+        return content_digest, css_digest, tuple(extras)
+
+    def get(self, key: tuple) -> str or None:
+        with self.__lock:
+            html_text = self.__entries.get(key, None)
+            if html_text is None:
+                self.__misses += 1
+            else:
+                self.__hits += 1
+                self.__entries.move_to_end(key)
+            return html_text
+
+    def put(self, key: tuple, html_text: str):
+        size = sys.getsizeof(html_text)
+        with self.__lock:
+            if size > self.__memory_cap:
+                return
+            old_html = self.__entries.pop(key, None)
+            if old_html is not None:
+                self.__memory -= sys.getsizeof(old_html)
+            self.__entries[key] = html_text
+            self.__memory += size
+            self.__evict()
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__memory = 0
+
+    def get_stats(self) -> dict:
+        with self.__lock:
+            return {
+                'entries': len(self.__entries),
+                'memory': self.__memory,
+                'memory_cap': self.__memory_cap,
+                'hits': self.__hits,
+                'misses': self.__misses,
+            }
+
+    def __evict(self):
+        while self.__memory > self.__memory_cap and len(self.__entries) > 0:
+            _, html_text = self.__entries.popitem(last=False)
+            self.__memory -= sys.getsizeof(html_text)
+
+
+markdown_render_cache = MarkdownRenderCache()
+
+
+# https://github.com/trentm/python-markdown2/blob/master/lib/markdown2.py
+MARKDOWN_EXTRAS = ['strike', 'underline', 'tg-spoiler', 'smarty-pants', 'break-on-newline',
+                   'code-friendly', 'fenced-code-blocks', 'footnotes', 'tables', 'code-color', 'pyshell', 'nofollow',
+                   'cuddled-lists', 'header ids', 'nofollow']
 
 
 def render_markdown(md_text: str) -> str:
     """
     https://zhuanlan.zhihu.com/p/34549578
+    The rendered html is cached in markdown_render_cache.
     :param md_text:
     :return:
     """
 
-    # https://github.com/trentm/python-markdown2/blob/master/lib/markdown2.py
-    extras = ['strike', 'underline', 'tg-spoiler', 'smarty-pants', 'break-on-newline',
-              'code-friendly', 'fenced-code-blocks', 'footnotes', 'tables', 'code-color', 'pyshell', 'nofollow',
-              'cuddled-lists', 'header ids', 'nofollow']
+    # Read the global once. The css may be changed by plugin (MarkdownStyle) at any time.
+    css = MARK_DOWN_CSS_TABLE
+    cache_key = markdown_render_cache.make_key(md_text, css, MARKDOWN_EXTRAS)
+    html_text = markdown_render_cache.get(cache_key)
+    if html_text is None:
+        ret = markdown2.markdown(md_text, extras=MARKDOWN_EXTRAS)
+        html_text = HTML_TEMPLATE.format(css=css, content=ret)
+        markdown_render_cache.put(cache_key, html_text)
+    return html_text
+
+
+MARKDOWN_FENCE_RE = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+MARKDOWN_HEADER_RE = re.compile(r'^ {0,3}#')
+MARKDOWN_LIST_ITEM_RE = re.compile(r'^ {0,3}(?:[*+-]|\d+[.)])\s')
+# Reference links and footnotes refer to the definition in other block. Such text cannot be rendered by block.
+MARKDOWN_REFERENCE_RE = re.compile(r'^ {0,3}\[[^\]]+\]:', re.MULTILINE)
+# A raw html block (<table>, <details>, <div>...) may have blank lines inside. Such text is not rendered by block.
+MARKDOWN_HTML_BLOCK_RE = re.compile(r'^ {0,3}<[A-Za-z/!?]')
+MARKDOWN_QUOTE_RE = re.compile(r'^ {0,3}>')
+
+
+def split_markdown_blocks(md_text: str) -> List[str] or None:
+    """
+    Split markdown text into top-level blocks (header, fenced code, table, paragraph, list) that can be rendered
+        separately. Joining the blocks with '\\n\\n' gets the same content.
+    :return: The block texts. None if the text cannot be rendered by block (has reference links, footnotes or
+             raw html blocks).
+    """
+    if MARKDOWN_REFERENCE_RE.search(md_text) is not None:
+        return None
+
+    blocks = []
+    current = []
+    fence = None
+
+    def flush():
+        if len(current) > 0:
+            blocks.append('\n'.join(current))
+            current.clear()
+
+    for line in md_text.split('\n'):
+        if fence is not None:
+            current.append(line)
+            if line.strip().startswith(fence):
+                fence = None
+                flush()
+            continue
+        m = MARKDOWN_FENCE_RE.match(line)
+        if m is not None:
+            flush()
+            fence = m.group(1)
+            current.append(line)
+        elif line.strip() == '':
+            flush()
+        elif MARKDOWN_HTML_BLOCK_RE.match(line) is not None:
+            return None
+        elif MARKDOWN_HEADER_RE.match(line) is not None:
+            flush()
+            current.append(line)
+            flush()
+        else:
+            current.append(line)
+    flush()
+
+    # A list (and the indented content of its items), an indented code and a blockquote may be divided by blank
+    #   lines. Keep each of them in one block.
+    merged_blocks = []
+    for block in blocks:
+        if len(merged_blocks) > 0 and __continues_markdown_block(merged_blocks[-1], block):
+            merged_blocks[-1] += '\n\n' + block
+        else:
+            merged_blocks.append(block)
+    return merged_blocks
+
+
+def __continues_markdown_block(prev_block: str, block: str) -> bool:
+    if MARKDOWN_LIST_ITEM_RE.match(prev_block) is not None:
+        return block[0] in ' \t' or MARKDOWN_LIST_ITEM_RE.match(block) is not None
+    if prev_block[0] in ' \t' and MARKDOWN_FENCE_RE.match(prev_block) is None:
+        # Indented code
+        return block[0] in ' \t' and MARKDOWN_FENCE_RE.match(block) is None
+    if MARKDOWN_QUOTE_RE.match(prev_block) is not None:
+        return MARKDOWN_QUOTE_RE.match(block) is not None
+    return False
 
-    ret = markdown2.markdown(md_text, extras=extras)
-    return HTML_TEMPLATE.format(css=MARK_DOWN_CSS_TABLE, content=ret)
+
+def render_markdown_blocks(md_blocks: List[str]) -> List[Tuple[bytes, str]]:
+    """
+    Render each markdown block to html fragment (without HTML_TEMPLATE). The fragments are cached in
+        markdown_render_cache, so only the changed blocks are converted.
+    :return: List of (block digest, html fragment)
+    """
+    result = []
+    for md_block in md_blocks:
+        cache_key = markdown_render_cache.make_key(md_block, '', MARKDOWN_EXTRAS)
+        html_text = markdown_render_cache.get(cache_key)
+        if html_text is None:
+            html_text = markdown2.markdown(md_block, extras=MARKDOWN_EXTRAS).replace('strike>', 'del>')
+            markdown_render_cache.put(cache_key, html_text)
+        result.append((cache_key[0], html_text))
+    return result
 
 
 def html_to_view(html_text: str, view, root_path: str = ''):
@@ -1601,21 +4285,371 @@ def markdown_to_view(md_text: str, view, root_path: str = ''):
     html_to_view(html_text, view, root_path)
 
 
+class MarkdownRenderScheduler(QObject):
+    """
+    Render markdown to a view without blocking the UI thread when typing.
+    The render requests are debounced. The markdown conversion runs in a worker thread, and only the html of the
+        newest request is pushed to the view. The stale requests and results are dropped.
+    Metrics (see get_metrics()):
+        requested / converted / rendered / dropped: The counts.
+        last_convert_ms: The time of markdown conversion.
+        last_latency_ms / max_latency_ms / avg_latency_ms: The time from the first request that was not shown
+            (e.g. the first key stroke) to the html being pushed to the view.
+        patched_blocks: The block count of the last incremental update.
+
+    Incremental rendering: For the large text in QWebEngineView, the text is split into top-level blocks and only
+        the changed blocks are converted (the others hit markdown_render_cache). The page DOM is patched by
+        runJavaScript() instead of reloading the whole html, so the latency does not grow with the document size
+        and the scroll position is kept.
+    """
+
+    DEFAULT_DEBOUNCE_MS = 150
+    # The text size (chars) to use incremental rendering. The small text is rendered as a whole for fidelity.
+    DEFAULT_INCREMENTAL_MIN_SIZE = 32 * 1024
+
+    BLOCKS_CONTAINER_ID = 'md-blocks'
+    BLOCK_CLASS = 'md-block'
+    # Parameters: start, the count of blocks to remove, the html of blocks to insert.
+    PATCH_BLOCKS_JS = """(function(start, removeCount, htmls) {
+    var root = document.getElementById('%s');
+    for (var i = 0; i < removeCount; i++) { root.removeChild(root.children[start]); }
+    var ref = root.children[start] || null;
+    for (var j = 0; j < htmls.length; j++) {
+        var block = document.createElement('div');
+        block.className = '%s';
+        block.innerHTML = htmls[j];
+        root.insertBefore(block, ref);
+    }
+})(%d, %d, %s);"""
+
+    # Emitted from the worker thread. Queued to the UI thread.
+    # Parameters: generation, html or (css, [(block digest, html fragment)]), convert time (ms)
+    converted = pyqtSignal(int, object, float)
+
+    def __init__(self, view, root_path_getter: Callable[[], str], debounce_ms: int = DEFAULT_DEBOUNCE_MS):
+        super(MarkdownRenderScheduler, self).__init__()
+        self.__view = view
+        self.__root_path_getter = root_path_getter
+
+        self.__debounce_timer = QTimer(self)
+        self.__debounce_timer.setSingleShot(True)
+        self.__debounce_timer.setInterval(debounce_ms)
+        self.__debounce_timer.timeout.connect(self.__submit)
+        self.converted.connect(self.__on_converted)
+
+        # The incremental rendering only works with QWebEngineView
+        self.__incremental_min_size = MarkdownRenderScheduler.DEFAULT_INCREMENTAL_MIN_SIZE \
+            if is_web_engine_view(view) else -1
+        # What's shown by block: (css, root path, [block digest]). None if the view is not in block mode.
+        self.__shown_blocks = None
+        # The page is loading after setHtml(). The DOM is not ready for patching.
+        self.__page_ready = False
+        if is_web_engine_view(view):
+            view.loadFinished.connect(self.__on_load_finished)
+
+        # The newest request, accessed in UI thread only.
+        self.__md_text = ''
+        self.__generation = 0
+        # The newest request asks a full reload (e.g. the editing req is switched).
+        self.__reload = False
+        # The time of the first request that is not shown yet. 0 if the view is up to date.
+        self.__first_request_time = 0.0
+
+        # The job waiting for worker thread: (generation, md_text, by block)
+        self.__condition = threading.Condition()
+        self.__pending_job = None
+        self.__thread = None
+
+        self.__metrics = {
+            'requested': 0,
+            'converted': 0,
+            'rendered': 0,
+            'dropped': 0,
+            'last_convert_ms': 0.0,
+            'last_latency_ms': 0.0,
+            'max_latency_ms': 0.0,
+            'total_latency_ms': 0.0,
+            'patched_blocks': 0,
+        }
+
+    def set_debounce(self, debounce_ms: int):
+        self.__debounce_timer.setInterval(max(0, debounce_ms))
+
+    def set_incremental_min_size(self, min_size: int):
+        """
+        :param min_size: The text size (chars) to use incremental rendering. -1 to disable.
+                         Not work if the view is not QWebEngineView.
+        """
+        if is_web_engine_view(self.__view):
+            self.__incremental_min_size = min_size
+
+    def request(self, md_text: str, immediate: bool = False):
+        """
+        Request rendering the markdown. Call in UI thread.
+        :param md_text: The markdown text.
+        :param immediate: Skip the debounce. For the case that is not typing, like switching the editing req.
+        """
+        self.__md_text = md_text
+        self.__generation += 1
+        self.__reload = immediate
+        self.__metrics['requested'] += 1
+        if self.__first_request_time == 0.0:
+            self.__first_request_time = time.perf_counter()
+        if immediate:
+            self.__debounce_timer.stop()
+            self.__submit()
+        else:
+            # Restart the timer, so the rendering starts after the typing pauses.
+            self.__debounce_timer.start()
+
+    def get_metrics(self) -> dict:
+        metrics = self.__metrics.copy()
+        total_latency = metrics.pop('total_latency_ms')
+        metrics['avg_latency_ms'] = total_latency / metrics['rendered'] if metrics['rendered'] > 0 else 0.0
+        return metrics
+
+    # ---------------------------------------------------------------------------
+
+    def __submit(self):
+        with self.__condition:
+            if self.__pending_job is not None:
+                # The worker has not picked the previous one yet. It's stale now.
+                self.__metrics['dropped'] += 1
+            by_block = 0 <= self.__incremental_min_size <= len(self.__md_text)
+            self.__pending_job = (self.__generation, self.__md_text, by_block)
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__render_thread, name='MarkdownRender', daemon=True)
+                self.__thread.start()
+            self.__condition.notify()
+
+    def __render_thread(self):
+        while True:
+            with self.__condition:
+                while self.__pending_job is None:
+                    self.__condition.wait()
+                generation, md_text, by_block = self.__pending_job
+                self.__pending_job = None
+            try:
+                start = time.perf_counter()
+                md_blocks = split_markdown_blocks(md_text) if by_block else None
+                if md_blocks is not None:
+                    result = (MARK_DOWN_CSS_TABLE, render_markdown_blocks(md_blocks))
+                else:
+                    result = render_markdown(md_text)
+                self.converted.emit(generation, result, (time.perf_counter() - start) * 1000)
+            except Exception as e:
+                print('Render markdown fail.')
+                print(e)
+                print(traceback.format_exc())
+            finally:
+                pass
+
+    def __on_converted(self, generation: int, result: str or tuple, convert_ms: float):
+        self.__metrics['converted'] += 1
+        self.__metrics['last_convert_ms'] = convert_ms
+        if generation != self.__generation:
+            # A newer request is in the way.
+            self.__metrics['dropped'] += 1
+            return
+
+        if isinstance(result, str):
+            self.__shown_blocks = None
+            self.__set_html(result, self.__root_path_getter())
+        else:
+            self.__show_blocks(result[0], result[1])
+
+        latency_ms = (time.perf_counter() - self.__first_request_time) * 1000
+        self.__first_request_time = 0.0
+        self.__metrics['rendered'] += 1
+        self.__metrics['last_latency_ms'] = latency_ms
+        self.__metrics['max_latency_ms'] = max(self.__metrics['max_latency_ms'], latency_ms)
+        self.__metrics['total_latency_ms'] += latency_ms
+
+    def __show_blocks(self, css: str, blocks: List[Tuple[bytes, str]]):
+        root_path = self.__root_path_getter()
+        digests = [digest for digest, _ in blocks]
+
+        shown = self.__shown_blocks
+        self.__shown_blocks = (css, root_path, digests)
+        if self.__reload or not self.__page_ready or shown is None or shown[0] is not css or shown[1] != root_path:
+            block_htmls = [f'<div class="{MarkdownRenderScheduler.BLOCK_CLASS}">{html_text}</div>'
+                           for _, html_text in blocks]
+            content = f'<div id="{MarkdownRenderScheduler.BLOCKS_CONTAINER_ID}">' + ''.join(block_htmls) + '</div>'
+            self.__set_html(HTML_TEMPLATE.format(css=css, content=content), root_path)
+            return
+
+        # Only replace the blocks between the common head and the common tail.
+        shown_digests = shown[2]
+        head = 0
+        max_head = min(len(digests), len(shown_digests))
+        while head < max_head and digests[head] == shown_digests[head]:
+            head += 1
+        tail = 0
+        max_tail = max_head - head
+        while tail < max_tail and digests[-1 - tail] == shown_digests[-1 - tail]:
+            tail += 1
+        remove_count = len(shown_digests) - head - tail
+        insert_htmls = [html_text for _, html_text in blocks[head:len(blocks) - tail]]
+        if remove_count == 0 and len(insert_htmls) == 0:
+            return
+
+        self.__metrics['patched_blocks'] = len(insert_htmls)
+        self.__view.page().runJavaScript(MarkdownRenderScheduler.PATCH_BLOCKS_JS % (
+            MarkdownRenderScheduler.BLOCKS_CONTAINER_ID, MarkdownRenderScheduler.BLOCK_CLASS,
+            head, remove_count, json.dumps(insert_htmls)))
+
+    def __set_html(self, html_text: str, root_path: str):
+        self.__page_ready = False
+        html_to_view(html_text, self.__view, root_path)
+
+    def __on_load_finished(self, ok: bool):
+        self.__page_ready = ok
+
+
 def image_to_base64(image_path):
     with open(image_path, 'rb') as f:
         return base64.b64encode(f.read()).decode()
 
 
-def embed_html_images(html_content):
-    soup = BeautifulSoup(html_content, 'html.parser')
+# (magic bytes offset, magic bytes, mime type)
+IMAGE_MAGIC_MIME = [
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (8, b'WEBP', 'image/webp'),
+    (0, b'BM', 'image/bmp'),
+    (0, b'\x00\x00\x01\x00', 'image/x-icon'),
+    (0, b'II*\x00', 'image/tiff'),
+    (0, b'MM\x00*', 'image/tiff'),
+]
+
+
+def guess_image_mime(data: bytes, file_path: str = '') -> str:
+    """
+    Get the mime type of image by its content. Fallback to the file extension.
+    """
+    for offset, magic, mime in IMAGE_MAGIC_MIME:
+        if data[offset:offset + len(magic)] == magic:
+            return mime
+    head = data[:256].lstrip().lower()
+    if head.startswith(b'<svg') or (head.startswith(b'<?xml') and b'<svg' in data[:1024].lower()):
+        return 'image/svg+xml'
+    mime, _ = mimetypes.guess_type(file_path)
+    return mime if mime is not None else 'application/octet-stream'
+
+
+class HtmlImageEmbedder:
+    """
+    Replace the local image src of html with base64 data uri, so the html file can be viewed anywhere.
+    The html is rewritten by a regex of <img> tag, instead of parsing and rebuilding the whole document.
+    The distinct images are encoded in a thread pool. The encoded data uri is cached by (path, mtime, size).
+    """
+
+    MAX_CACHE_ENTRIES = 1024
+    DEFAULT_WORKERS = 8
+
+    # The src attribute follows a whitespace. Not the "src" in "data-src".
+    __IMG_SRC_RE = re.compile(r'(<img\b[^>]*?\ssrc\s*=\s*)(?:"([^"]*)"|\'([^\']*)\'|([^\s>"\']+))',
+                              re.IGNORECASE | re.DOTALL)
+
+    def __init__(self, workers: int = DEFAULT_WORKERS):
+        self.__workers = workers
+        self.__lock = threading.Lock()
+        # (abs path, mtime_ns, size) -> data uri
+        self.__cache: OrderedDict = OrderedDict()
+
+    def embed(self, html_content: str, base_path: str = '') -> str:
+        """
+        :param html_content: The html text.
+        :param base_path: The base path of relative image path. Empty for current path.
+        :return: The html that local images are embedded. The image that cannot be read is kept as it was.
+        """
+        matches = list(HtmlImageEmbedder.__IMG_SRC_RE.finditer(html_content))
+        if len(matches) == 0:
+            return html_content
+
+        src_paths = {}
+        for m in matches:
+            src = self.__match_src(m)
+            if src not in src_paths:
+                src_paths[src] = self.__local_path(src, base_path)
+        data_uris = self.__encode_all([path for path in set(src_paths.values()) if path is not None])
+
+        parts = []
+        pos = 0
+        for m in matches:
+            data_uri = data_uris.get(src_paths[self.__match_src(m)], None)
+            if data_uri is None:
+                continue
+            parts.append(html_content[pos:m.start()])
+            parts.append(f'{m.group(1)}"{data_uri}"')
+            pos = m.end()
+        parts.append(html_content[pos:])
+        return ''.join(parts)
+
+    def clear_cache(self):
+        with self.__lock:
+            self.__cache.clear()
+
+    # ---------------------------------------------------------------------------
+
+    @staticmethod
+    def __match_src(m) -> str:
+        return next(group for group in m.groups()[1:] if group is not None)
+
+    @staticmethod
+    def __local_path(src: str, base_path: str) -> str or None:
+        src = html.unescape(src.strip())
+        lower_src = src.lower()
+        if lower_src.startswith('file:'):
+            src = urllib.parse.unquote(urllib.parse.urlparse(src).path)
+            # file:///C:/xxx
+            if re.match(r'^/[a-zA-Z]:', src):
+                src = src[1:]
+        elif src == '' or lower_src.startswith(('data:', 'http:', 'https:', '//')):
+            return None
+        path = os.path.join(base_path, src) if base_path != '' else src
+        if not os.path.isfile(path):
+            path = urllib.parse.unquote(path)
+        return os.path.abspath(path)
+
+    def __encode_all(self, paths: List[str]) -> Dict[str, str]:
+        if len(paths) <= 1 or self.__workers <= 1:
+            return {path: self.__encode(path) for path in paths}
+        with ThreadPoolExecutor(max_workers=min(self.__workers, len(paths))) as executor:
+            return dict(zip(paths, executor.map(self.__encode, paths)))
+
+    def __encode(self, path: str) -> str or None:
+        try:
+            stat = os.stat(path)
+            key = (path, stat.st_mtime_ns, stat.st_size)
+            with self.__lock:
+                data_uri = self.__cache.get(key, None)
+                if data_uri is not None:
+                    self.__cache.move_to_end(key)
+                    return data_uri
+            with open(path, 'rb') as f:
+                data = f.read()
+            data_uri = f'data:{guess_image_mime(data, path)};base64,{base64.b64encode(data).decode()}'
+            with self.__lock:
+                self.__cache[key] = data_uri
+                while len(self.__cache) > HtmlImageEmbedder.MAX_CACHE_ENTRIES:
+                    self.__cache.popitem(last=False)
+            return data_uri
+        except Exception as e:
+            print(f'Embed image fail: {path}')
+            print(e)
+            return None
+        finally:
+            pass
+
+
+html_image_embedder = HtmlImageEmbedder()
 
-    for img in soup.find_all('img'):
-        if img.has_attr('src'):
-            image_path = img['src']
-            base64_image = image_to_base64(image_path)
-            img['src'] = f'data:image/png;base64,{base64_image}'
 
-    return str(soup)
+def embed_html_images(html_content, base_path: str = ''):
+    return html_image_embedder.embed(html_content, base_path)
 
 
 def save_view_html(view, file_name, img_embedding: bool):
@@ -1661,68 +4695,136 @@ def print_web_view(web_view, file_name: str = 'export.pdf'):
 
 
 class WebViewPrinter:
-    TEMP_PATH = 'temp-pdf'
+    """
+    Print markdown pages to one PDF file.
+    The pages are loaded and printed by a pool of hidden QWebEngineView concurrently. The printed pages are
+        appended to the merger in page order as soon as they are ready. The temp files are removed at the end.
+    The result passed to cb_on_finish_or_error: 'finished', 'fail' or 'cancelled'.
+    The progress is reported by cb_on_progress(printed page count, total page count).
+    """
 
-    def __init__(self, filename: str, markdowns: List[str], root_path: str = '', cb_on_finish_or_error=None):
+    DEFAULT_POOL_SIZE = 4
+
+    def __init__(self, filename: str, markdowns: List[str], root_path: str = '', cb_on_finish_or_error=None,
+                 pool_size: int = DEFAULT_POOL_SIZE, cb_on_progress=None):
         self.filename = filename
         self.root_path = root_path
         self.markdowns = markdowns
         self.callback = cb_on_finish_or_error
-        self.current_index = 0
-        self.web_view = QWebEngineView()
-        self.web_view.setHidden(True)  # Hide the web view
-        self.web_view.loadFinished.connect(self.__handle_load_finished)
-        self.web_view.page().pdfPrintingFinished.connect(self.__handle_print_finished)
-        self.temp_file_name = ''
+        self.progress_callback = cb_on_progress
+        self.pool_size = max(1, min(pool_size, len(markdowns)))
+
+        self.temp_path = ''
         self.merger = PdfMerger()
+        self.web_views = []
+
+        # The index of next page to load
+        self.next_index = 0
+        # The index of next page to append to merger
+        self.merge_index = 0
+        # Printed pages that are waiting for the previous pages: {page index: temp file or None (load fail)}
+        self.printed = {}
+        self.finished = False
 
     def print(self):
-        self.__ensure_temp_path()
-        self.__print_next()
-
-    def __print_next(self):
-        print('> Print Next')
-        if self.current_index < len(self.markdowns):
-            md_text = self.markdowns[self.current_index]
-            markdown_to_view(md_text, self.web_view, self.root_path)
-            print(f'Printing ({self.current_index}/{len(self.markdowns)})......')
+        if len(self.markdowns) == 0:
+            self.__finish('finished')
+            return
+        self.temp_path = tempfile.mkdtemp(prefix='freereq-pdf-')
+        for _ in range(self.pool_size):
+            web_view = QWebEngineView()
+            web_view.setHidden(True)  # Hide the web view
+            web_view.loadFinished.connect(partial(self.__handle_load_finished, web_view))
+            web_view.page().pdfPrintingFinished.connect(partial(self.__handle_print_finished, web_view))
+            self.web_views.append(web_view)
+            self.__print_next(web_view)
+
+    def cancel(self):
+        if not self.finished:
+            for web_view in self.web_views:
+                web_view.stop()
+            self.__finish('cancelled')
+
+    def __print_next(self, web_view):
+        if self.finished or self.next_index >= len(self.markdowns):
+            return
+        page_index = self.next_index
+        self.next_index += 1
+        # Remember the page of this view. The page index is also the temp file name.
+        web_view.setProperty('page_index', page_index)
+        markdown_to_view(self.markdowns[page_index], web_view, self.root_path)
+        print(f'Printing ({page_index}/{len(self.markdowns)})......')
+
+    def __handle_load_finished(self, web_view, ok: bool):
+        if self.finished:
+            return
+        page_index = web_view.property('page_index')
+        if ok:  # The page was loaded successfully
+            temp_file_name = os.path.join(self.temp_path, f'temp_{page_index}.pdf')
+            web_view.page().printToPdf(temp_file_name)
+        else:
+            print(f'Load page {page_index} fail and ignore.')
+            self.__page_done(web_view, page_index, None)
+
+    def __handle_print_finished(self, web_view, file_path: str, ok: bool):
+        if self.finished:
+            return
+        if ok:
+            self.__page_done(web_view, web_view.property('page_index'), file_path)
         else:
+            print(f'Print page {web_view.property("page_index")} fail.')
+            self.__finish('fail')
+
+    def __page_done(self, web_view, page_index: int, file_path: str or None):
+        self.printed[page_index] = file_path
+        try:
+            while self.merge_index in self.printed:
+                file_path = self.printed.pop(self.merge_index)
+                if file_path is not None:
+                    self.merger.append(file_path)
+                self.merge_index += 1
+        except Exception as e:
+            print(e)
+            print(traceback.format_exc())
+            self.__finish('fail')
+            return
+        finally:
+            pass
+
+        if self.progress_callback is not None:
+            self.progress_callback(self.merge_index, len(self.markdowns))
+
+        if self.merge_index >= len(self.markdowns):
             try:
                 self.merger.write(self.filename)
-                self.merger.close()
                 result = 'finished'
             except Exception as e:
                 print(e)
                 result = 'fail'
             finally:
-                if self.callback is not None:
-                    self.callback(result)
-                print("Print finished")
-
-    def __handle_load_finished(self, ok):
-        print('> Load finished')
-        if ok:  # The page was loaded successfully
-            self.temp_file_name = os.path.join(WebViewPrinter.TEMP_PATH, f'temp_{self.current_index}.pdf')
-            print(f'Print to file: {self.temp_file_name}')
-            self.web_view.page().printToPdf(self.temp_file_name)
-        else:
-            print('Load fail and ignore.')
-
-    def __handle_print_finished(self, ok: bool):
-        print('> Print finished')
-        print('\r\n')
-        if ok:
-            self.merger.append(self.temp_file_name)
-            self.current_index += 1
-            self.__print_next()  # Start loading the next page
+                pass
+            self.__finish(result)
         else:
-            print('Fail.')
-            if self.callback is not None:
-                self.callback('fail')
+            self.__print_next(web_view)
 
-    def __ensure_temp_path(self):
-        if not os.path.exists(WebViewPrinter.TEMP_PATH):
-            os.makedirs(WebViewPrinter.TEMP_PATH)
+    def __finish(self, result: str):
+        if self.finished:
+            return
+        self.finished = True
+        try:
+            self.merger.close()
+        except Exception as e:
+            print(e)
+        finally:
+            pass
+        for web_view in self.web_views:
+            web_view.deleteLater()
+        self.web_views.clear()
+        if self.temp_path != '':
+            shutil.rmtree(self.temp_path, ignore_errors=True)
+        print(f'Print {result}')
+        if self.callback is not None:
+            self.callback(result)
 
 
 def __collect_req_content_r(req_node: ReqNode, markdowns: List[str], node_stack: List[ReqNode], recursive: bool):
@@ -1763,7 +4865,8 @@ printing_web_view: WebViewPrinter = None
 
 def print_req_nodes(req_nodes: ReqNode or List[ReqNode], filename: str,
                     recursive: bool = True, root_path: str = '',
-                    dense: bool = False, on_finished=None):
+                    dense: bool = False, on_finished=None, on_progress=None,
+                    pool_size: int = WebViewPrinter.DEFAULT_POOL_SIZE):
     global printing_web_view
     if printing_web_view is not None:
         print('** Printing is on progress. **')
@@ -1784,7 +4887,7 @@ def print_req_nodes(req_nodes: ReqNode or List[ReqNode], filename: str,
             if on_finished is not None:
                 on_finished(result)
 
-        printing_web_view = WebViewPrinter(filename, markdowns, root_path, on_print_done)
+        printing_web_view = WebViewPrinter(filename, markdowns, root_path, on_print_done, pool_size, on_progress)
         printing_web_view.print()
     except Exception as e:
         print(e)
@@ -1794,6 +4897,11 @@ def print_req_nodes(req_nodes: ReqNode or List[ReqNode], filename: str,
         pass
 
 
+def cancel_printing():
+    if printing_web_view is not None:
+        printing_web_view.cancel()
+
+
 class ReqEditorBoard(QWidget):
     def __init__(self, req_data_agent: IReqAgent, req_model: ReqModel):
         super(ReqEditorBoard, self).__init__()
@@ -1830,6 +4938,8 @@ class ReqEditorBoard(QWidget):
         finally:
             pass
 
+        self.__render_scheduler = MarkdownRenderScheduler(self.text_md_viewer, self.__req_data_agent.get_req_path)
+
         self.__group_meta_data = QGroupBox()
 
         # self.__check_editor = QCheckBox('Editor')
@@ -2036,15 +5146,23 @@ class ReqEditorBoard(QWidget):
         self.update_content_edited_status(False)
 
     def on_text_content_edit(self):
-        self.render_markdown()
+        self.__render_scheduler.request(self.text_md_editor.toPlainText())
         self.on_content_changed()
 
     def on_content_changed(self, *args):
         self.update_content_edited_status(True)
 
     def render_markdown(self):
-        md_text = self.text_md_editor.toPlainText()
-        markdown_to_view(md_text, self.text_md_viewer, self.__req_data_agent.get_req_path())
+        self.__render_scheduler.request(self.text_md_editor.toPlainText(), immediate=True)
+
+    def set_render_debounce(self, debounce_ms: int):
+        self.__render_scheduler.set_debounce(debounce_ms)
+
+    def set_render_incremental_min_size(self, min_size: int):
+        self.__render_scheduler.set_incremental_min_size(min_size)
+
+    def get_render_metrics(self) -> dict:
+        return self.__render_scheduler.get_metrics()
 
     # ---------------------------------------------------------------------------
 
@@ -2123,7 +5241,6 @@ class ReqEditorBoard(QWidget):
         self.__group_meta_data.setTitle(title)
 
     def __ui_to_req_node_data(self, req_node: ReqNode):
-        self.__req_model.begin_edit()
         req_node.set(STATIC_FIELD_ID, self.__line_id.text())
         req_node.set(STATIC_FIELD_TITLE, self.__line_title.text())
 
@@ -2139,8 +5256,8 @@ class ReqEditorBoard(QWidget):
         self.__req_node_data_to_ui_title(req_node)
 
         req_node.set(STATIC_FIELD_CONTENT, self.text_md_editor.toPlainText())
-        self.__req_data_agent.update_node(req_node)
-        self.__req_model.end_edit()
+        # The row is refreshed by ReqModel.on_node_data_changed()
+        self.__req_model.update_node(req_node)
         # self.__req_data_agent.inform_node_data_updated(req_node)
 
     def __reset_ui_content(self):
@@ -2168,6 +5285,8 @@ class ReqEditorBoard(QWidget):
         else:
             self.__editing_node = None
             self.__reset_ui_content()
+        # Not typing. Show the new content without debounce.
+        self.render_markdown()
         self.update_content_edited_status(False)
 
     # def set_data_agent(self, req_data_agent: IReqAgent):
@@ -2395,17 +5514,39 @@ class IndexListUI(QWidget):
 # ----------------------------------------------------------------------------------------------------------------------
 
 class RequirementUI(QMainWindow, IReqObserver):
+    # The agent may notify from its saving thread. The notifications are queued by this signal to run in UI thread.
+    ui_thread_call = pyqtSignal(object)
+
     def __init__(self, req_data_agent: IReqAgent):
         super().__init__()
+        self.ui_thread_call.connect(self.__on_ui_thread_call)
 
         self.__req_data_agent = req_data_agent
+        # All observers (the plugins included) are notified in UI thread.
+        self.__req_data_agent.set_notify_dispatcher(self.ui_thread_call.emit)
         self.__req_data_agent.add_observer(self)
         self.__req_model = ReqModel(self.__req_data_agent)
+        self.__req_data_agent.add_observer(self.__req_model)
+        self.__text_index = ReqTextIndex(self.__req_data_agent)
+        self.__req_data_agent.add_observer(self.__text_index)
+        self.__query_engine = ReqQueryEngine(self.__req_data_agent)
+        self.__req_data_agent.add_observer(self.__query_engine)
+        self.undo_stack = ReqUndoStack(self.__req_data_agent, self.__req_model)
+        self.__req_data_agent.add_observer(self.undo_stack)
+        self.__req_model.set_undo_stack(self.undo_stack)
 
         self.watcher = QFileSystemWatcher()
         self.watcher.fileChanged.connect(self.on_editing_file_changed)
 
         self.__cut_items = []
+
+        # Expand-all runs in chunks from the event loop. See do_expand_node_all().
+        self.__expand_queue = deque()
+        self.__expand_handled = 0
+        self.__expand_progress: QProgressDialog = None
+        self.__expand_timer = QTimer(self)
+        self.__expand_timer.timeout.connect(self.__on_expand_timer)
+
         # self.__filter_index = -1
         # self.__filter_nodes = []
         self.__selected_node: ReqNode = None
@@ -2476,6 +5617,8 @@ class RequirementUI(QMainWindow, IReqObserver):
         self.__tree_requirements.setModel(self.__req_model)
         self.__tree_requirements.setAlternatingRowColors(True)
         self.__tree_requirements.setContextMenuPolicy(Qt.CustomContextMenu)
+        # Ctrl / Shift + Click to select multiple items for the bulk operations.
+        self.__tree_requirements.setSelectionMode(QAbstractItemView.ExtendedSelection)
 
         try:
             with open(os.path.join(self_path, 'res', 'tree_style.qss'), 'rt', encoding='utf-8') as f:
@@ -2512,11 +5655,20 @@ class RequirementUI(QMainWindow, IReqObserver):
 
         # Edit Menu
         edit_menu = self.menu_bar.addMenu('Edit')
+        self.undo_action = QAction('Undo', self)
+        self.redo_action = QAction('Redo', self)
+        self.undo_action.setShortcut(QKeySequence.Undo)
+        self.redo_action.setShortcut(QKeySequence.Redo)
         search_action = QAction('Find', self)
+        query_action = QAction('Query', self)
         add_top_action = QAction('Add New Top Item', self)
         rename_req_action = QAction('Rename Requirement', self)
 
+        edit_menu.addAction(self.undo_action)
+        edit_menu.addAction(self.redo_action)
+        edit_menu.addSeparator()
         edit_menu.addAction(search_action)
+        edit_menu.addAction(query_action)
         edit_menu.addSeparator()
         edit_menu.addAction(add_top_action)
         edit_menu.addAction(rename_req_action)
@@ -2542,7 +5694,11 @@ class RequirementUI(QMainWindow, IReqObserver):
         save_action.triggered.connect(self.handle_save)
         exit_action.triggered.connect(self.handle_exit)
 
+        self.undo_action.triggered.connect(self.handle_undo)
+        self.redo_action.triggered.connect(self.handle_redo)
+        edit_menu.aboutToShow.connect(self.__update_undo_actions)
         search_action.triggered.connect(self.handle_search)
+        query_action.triggered.connect(self.handle_query)
         rename_req_action.triggered.connect(self.handle_rename_req)
         add_top_action.triggered.connect(self.handle_add_top)
         about_action.triggered.connect(self.handle_about)
@@ -2593,9 +5749,18 @@ class RequirementUI(QMainWindow, IReqObserver):
     def handle_exit(self):
         self.close()
 
+    def handle_undo(self):
+        self.__after_undo_redo(self.undo_stack.undo())
+
+    def handle_redo(self):
+        self.__after_undo_redo(self.undo_stack.redo())
+
     def handle_search(self):
         self.pop_search()
 
+    def handle_query(self):
+        self.pop_query()
+
     def handle_add_top(self):
         self.on_requirement_tree_menu_add_top_item()
 
@@ -2616,6 +5781,11 @@ class RequirementUI(QMainWindow, IReqObserver):
     def on_req_closed(self, req_uri: str):
         self.watcher.removePath(req_uri)
 
+    def on_req_saved(self, req_uri: str):
+        # The req file is replaced by saving. Watch the new one.
+        if req_uri not in self.watcher.files():
+            self.watcher.addPath(req_uri)
+
     def on_req_exception(self, exception_name: str, **kwargs):
         if exception_name == 'conflict':
             QMessageBox.information(self, 'Conflict detected',
@@ -2623,6 +5793,14 @@ class RequirementUI(QMainWindow, IReqObserver):
                                     f'Avoiding data lost, editing req file is renamed to {kwargs.get("backup_file")}\n'
                                     'Please close this file and merge them by manual.')
             self.update_status('Conflict')
+        elif exception_name == 'save_fail':
+            QMessageBox.warning(self, 'Save fail',
+                                f'Cannot save req file: {kwargs.get("req_file")}\n'
+                                'Please check the disk and the file permission.')
+            self.update_status('Save fail')
+
+    def __on_ui_thread_call(self, func):
+        func()
 
     # --------------------- File observer path ---------------------
 
@@ -2639,6 +5817,8 @@ class RequirementUI(QMainWindow, IReqObserver):
     def keyPressEvent(self, event):
         if event.key() == Qt.Key_F and event.modifiers() == Qt.ControlModifier:
             self.pop_search()
+        elif event.key() == Qt.Key_F and event.modifiers() == (Qt.ControlModifier | Qt.ShiftModifier):
+            self.pop_query()
         elif event.key() == Qt.Key_S and event.modifiers() == Qt.ControlModifier:
             self.edit_board.on_button_save_content()
 
@@ -2651,7 +5831,10 @@ class RequirementUI(QMainWindow, IReqObserver):
         menu.addAction('Collapse All', partial(self.on_requirement_tree_menu_collapse_all, sel_index))
         menu.addSeparator()
 
-        if sel_index is not None and sel_index.isValid():
+        selected_nodes = self.__selected_nodes()
+        if sel_index is not None and sel_index.isValid() and len(selected_nodes) > 1:
+            self.__add_bulk_menu(menu, selected_nodes)
+        elif sel_index is not None and sel_index.isValid():
             # When all item expanded. You may not able to R-Click on an empty place.
             menu.addAction('Collapse Whole Tree', partial(self.on_requirement_tree_menu_collapse_all, None))
             menu.addSeparator()
@@ -2664,6 +5847,7 @@ class RequirementUI(QMainWindow, IReqObserver):
                 sub_menu = menu.addMenu("Batch Assign Req ID")
                 for id_prefix in id_prefixes:
                     sub_menu.addAction(id_prefix, partial(self.on_menu_assign_id_for_tree, id_prefix))
+            self.__add_set_field_menu(menu)
 
             menu.addSeparator()
             menu.addAction('Insert sibling up', self.on_requirement_tree_menu_add_sibling_up)
@@ -2696,6 +5880,29 @@ class RequirementUI(QMainWindow, IReqObserver):
             menu.addAction('Open Local Requirement File', self.on_menu_open_local_file)
         menu.exec(QCursor.pos())
 
+    def __add_bulk_menu(self, menu: QMenu, selected_nodes: List[ReqNode]):
+        count = len(selected_nodes)
+        id_prefixes = self.__req_data_agent.get_req_meta().get(STATIC_META_ID_PREFIX, [])
+        if len(id_prefixes) > 0:
+            sub_menu = menu.addMenu(f"Batch Assign Req ID ({count} items)")
+            for id_prefix in id_prefixes:
+                sub_menu.addAction(id_prefix, partial(self.on_menu_assign_id_for_tree, id_prefix))
+        self.__add_set_field_menu(menu)
+        menu.addSeparator()
+        menu.addAction(f'Move {count} items to...', self.on_requirement_tree_menu_move_items)
+        menu.addSeparator()
+        menu.addAction(f'Cut {count} items', self.on_requirement_tree_menu_cut_item)
+        menu.addSeparator()
+        menu.addAction(f'Delete {count} items (Caution!!!)', self.on_requirement_tree_menu_delete_item)
+
+    def __add_set_field_menu(self, menu: QMenu):
+        meta_data = self.__req_data_agent.get_req_meta()
+        meta_fields = [key for key in meta_data.keys() if key != STATIC_META_ID_PREFIX]
+        if len(meta_fields) > 0:
+            sub_menu = menu.addMenu('Set Field')
+            for meta_field in meta_fields:
+                sub_menu.addAction(meta_field, partial(self.on_requirement_tree_menu_set_field, meta_field))
+
     @Hookable
     def on_requirement_tree_selection_changed(self, selected: QItemSelection, deselected: QItemSelection):
         # print(f'Tree Selection Changed: {deselected} -> {selected}')
@@ -2724,7 +5931,9 @@ class RequirementUI(QMainWindow, IReqObserver):
         def assign_req_id_if_empty(node: ReqNode, context: dict):
             if node.get(STATIC_FIELD_ID, '').strip() == '':
                 req_id = self.__req_data_agent.new_req_id(id_prefix)
-                node.set(STATIC_FIELD_ID, req_id)
+                update_node = node.clone()
+                update_node.set(STATIC_FIELD_ID, req_id)
+                self.__req_model.update_node(update_node)
                 context[node.get_uuid()] = req_id
 
         reply = QMessageBox.question(self, "Assign Req ID",
@@ -2736,13 +5945,16 @@ class RequirementUI(QMainWindow, IReqObserver):
 
         if reply == QMessageBox.Yes:
             if self.__tree_item_selected():
-                result = self.__req_data_agent.req_map(self.__selected_node, assign_req_id_if_empty)
+                # Saved once, notified once and undone once for all nodes.
+                result = {}
+                with self.__req_model.batch('Assign Req ID'):
+                    for selected_node in self.__selected_nodes():
+                        result.update(self.__req_data_agent.req_map(selected_node, assign_req_id_if_empty))
 
                 msg_box = QMessageBox()
                 msg_box.setWindowTitle('Assign Req ID Report')
 
                 if len(result) > 0:
-                    self.__req_data_agent.save_req()
                     update_list = [f'{k} - {v}' for k, v in result.items()]
 
                     edit = QTextEdit()
@@ -2759,7 +5971,8 @@ class RequirementUI(QMainWindow, IReqObserver):
         if sel_index is not None and sel_index.isValid():
             self.do_expand_node_all(sel_index)
         else:
-            self.__tree_requirements.expandAll()
+            # expandAll() fetches and lays out the whole tree in one shot. It freezes the UI on a huge tree.
+            self.do_expand_node_all(QModelIndex())
 
     def on_requirement_tree_menu_collapse_all(self, sel_index):
         if sel_index is not None and sel_index.isValid():
@@ -2781,25 +5994,23 @@ class RequirementUI(QMainWindow, IReqObserver):
 
     def on_requirement_tree_menu_shift_item_up(self):
         if self.__tree_item_selected():
-            self.__req_model.begin_edit()
-            self.__req_data_agent.shift_node(self.__selected_node.get_uuid(), -1)
-            self.__req_model.end_edit()
+            self.__req_model.shift_node(self.__selected_node, -1)
 
     def on_requirement_tree_menu_shift_item_down(self):
         if self.__tree_item_selected():
-            self.__req_model.begin_edit()
-            self.__req_data_agent.shift_node(self.__selected_node.get_uuid(), 1)
-            self.__req_model.end_edit()
+            self.__req_model.shift_node(self.__selected_node, 1)
 
     def on_requirement_tree_menu_cut_item(self):
-        if self.__tree_item_selected():
-            self.__cut_items.append(self.__selected_node)
+        selected_nodes = self.__selected_nodes()
+        if len(selected_nodes) > 0:
+            # Pasted together later.
+            self.__cut_items.append(selected_nodes)
             self.on_requirement_tree_menu_delete_item()
 
     def on_requirement_tree_menu_paste_item(self, pos: str):
         if pos == 'top' or self.__tree_item_selected():
             if len(self.__cut_items) > 0:
-                paste_node = self.__cut_items.pop()
+                paste_nodes = self.__cut_items.pop()
 
                 if pos == 'top':
                     parent_node = self.__req_data_agent.get_req_root()
@@ -2809,52 +6020,86 @@ class RequirementUI(QMainWindow, IReqObserver):
                     parent_node = self.__selected_node.parent()
 
                 if pos in ['top', 'child']:
-                    self.__req_model.insert_node_children(parent_node, paste_node, -1)
+                    self.__req_model.insert_node_children(parent_node, paste_nodes, -1)
                 elif pos == 'up':
                     paste_pos = self.__selected_node.order()
-                    self.__req_model.insert_node_children(parent_node, paste_node, paste_pos)
+                    self.__req_model.insert_node_children(parent_node, paste_nodes, paste_pos)
                 elif pos == 'down':
                     paste_pos = self.__selected_node.order() + 1
-                    self.__req_model.insert_node_children(parent_node, paste_node, paste_pos)
+                    self.__req_model.insert_node_children(parent_node, paste_nodes, paste_pos)
 
                 # self.__req_data_agent.inform_node_child_updated(parent_node)
 
     def on_requirement_tree_menu_delete_item(self):
-        if self.__tree_item_selected():
-            # print(f'Tree Selection attempt delete -> {self.__selected_index}')
-
-            selected_node = self.__selected_node
-            node_order = self.__selected_node.order()
-            node_parent = self.__selected_node.parent()
-            if node_parent is not None:
-                # Because beginRemoveRows() will change the selected node
-
-                self.__req_model.beginRemoveRows(
-                    self.__req_model.parent(self.__selected_index), node_order, node_order)
-                self.__req_data_agent.remove_node(selected_node.get_uuid())
-                self.__req_model.endRemoveRows()
+        selected_nodes = [node for node in self.__selected_nodes() if node.parent() is not None]
+        if len(selected_nodes) > 0:
+            # One agent call, one saving and one model update for all selected items.
+            self.__req_model.remove_nodes(selected_nodes)
+            # The editing node may be removed.
+            self.__update_selected_index(self.__tree_requirements.currentIndex())
+
+    def on_requirement_tree_menu_move_items(self):
+        selected_nodes = self.__selected_nodes()
+        if len(selected_nodes) == 0:
+            return
+        req_id, ok = QInputDialog.getText(self, 'Move Items',
+                                          f'Move {len(selected_nodes)} items as the last children of Req ID:')
+        req_id = req_id.strip()
+        if not ok or req_id == '':
+            return
+        target_node = self.__req_data_agent.get_req_node_by_id(req_id)
+        if target_node is None:
+            QMessageBox.information(self, 'Move Items', f'Cannot find Req ID: {req_id}')
+        elif not self.__req_model.move_nodes(selected_nodes, target_node, -1):
+            QMessageBox.information(self, 'Move Items', 'Cannot move items into themselves.')
+        else:
+            self.toast_status(f'Moved {len(selected_nodes)} items to {req_id}.')
 
-                # print(f'Tree Selection deleted -> {self.__selected_index}')
+    def on_requirement_tree_menu_set_field(self, field: str):
+        selected_nodes = self.__selected_nodes()
+        if len(selected_nodes) == 0:
+            return
+        selections = self.__req_data_agent.get_req_meta().get(field, [])
+        title = f'Set {field} of {len(selected_nodes)} items'
+        if isinstance(selections, list) and len(selections) > 0:
+            value, ok = QInputDialog.getItem(self, title, f'{field}:', selections, 0, True)
+        else:
+            value, ok = QInputDialog.getText(self, title, f'{field}:')
+        if ok:
+            self.__req_model.update_nodes_field(selected_nodes, field, value)
+            if not self.edit_board.is_content_edited():
+                # Refresh the editing node.
+                self.__update_selected_index(self.__tree_requirements.currentIndex())
 
     def on_requirement_tree_menu_print_tree(self, dense: bool):
         if self.__selected_node is not None:
             selected_node = self.__selected_node
             file_name = (selected_node.get_title() + '.pdf') if selected_node is not None else 'export.pdf'
 
+            progress_dialog = QProgressDialog(f'Printing to {file_name}...', 'Cancel', 0, 0, self)
+            progress_dialog.setWindowTitle('Print to PDF')
+            progress_dialog.setMinimumDuration(0)
+            progress_dialog.canceled.connect(cancel_printing)
+
+            def handle_print_progress(printed: int, total: int):
+                progress_dialog.setMaximum(total)
+                progress_dialog.setValue(printed)
+
             def handle_print_finished(result):
+                progress_dialog.canceled.disconnect(cancel_printing)
+                progress_dialog.close()
+                if result == 'cancelled':
+                    return
                 msgBox = QMessageBox()
                 msgBox.setWindowTitle('Print to PDF')
-                msgBox.setText(f'Printed to [{file_name}] Done.')
+                msgBox.setText(f'Printed to [{file_name}] Done.' if result == 'finished' else
+                               f'Print to [{file_name}] fail.')
                 msgBox.exec_()
 
+            progress_dialog.show()
             print_req_nodes(selected_node, file_name, recursive=True,
                             root_path=self.__req_data_agent.get_req_path(),
-                            dense=dense, on_finished=handle_print_finished)
-
-            msgBox = QMessageBox()
-            msgBox.setWindowTitle('Print to PDF')
-            msgBox.setText(f'Async printing to {file_name}. \nPlease wait for printing finished.')
-            msgBox.exec_()
+                            dense=dense, on_finished=handle_print_finished, on_progress=handle_print_progress)
 
     def on_menu_rename_req(self):
         req_name, is_ok = QInputDialog.getText(
@@ -2865,7 +6110,7 @@ class RequirementUI(QMainWindow, IReqObserver):
             if node_root is not None:
                 edit_node = node_root.clone()
                 edit_node.set_title(req_name)
-                self.__req_data_agent.update_node(edit_node)
+                self.__req_model.update_node(edit_node)
                 # self.__req_data_agent.inform_node_data_updated(node_root)
 
     def on_menu_create_new_req(self) -> bool:
@@ -2885,13 +6130,13 @@ class RequirementUI(QMainWindow, IReqObserver):
         #             return
 
         file_path, is_ok = QFileDialog.getSaveFileName(
-            self, "Save As", "", "Requirement Files (*.req);;All Files (*)")
+            self, "Save As", "", f"{self.__req_data_agent.get_req_file_filter()};;All Files (*)")
         req_name = file_path.strip()
 
         if is_ok and req_name:
-            self.__req_model.beginRemoveRows(QModelIndex(), 0, 0)
+            self.__req_model.begin_reset()
             success = self.__req_data_agent.new_req(req_name, overwrite=True)
-            self.__req_model.endRemoveRows()
+            self.__req_model.end_reset()
 
             self.edit_board.edit_req(None)
             self.meta_board.reload_meta_data()
@@ -2906,8 +6151,9 @@ class RequirementUI(QMainWindow, IReqObserver):
         last_open_dir = settings.value("last_open", "")
 
         # 打开文件对话框，使用上次的目录路径作为默认路径
+        # Only the files that the req agent (see "req_agent" in config) can open.
         file_path, is_ok = QFileDialog.getOpenFileName(
-            self, 'Select File', last_open_dir, 'Requirement File (*.req);;All files (*.*)')
+            self, 'Select File', last_open_dir, f'{self.__req_data_agent.get_req_file_filter()};;All files (*.*)')
 
         # 如果成功选择了文件，更新last_open的值为当前文件的目录路径
         if is_ok and file_path:
@@ -2916,13 +6162,16 @@ class RequirementUI(QMainWindow, IReqObserver):
             # 保存到QSettings
             settings.setValue("last_open", last_open_dir)
 
-            self.__req_model.beginRemoveRows(QModelIndex(), 0, 0)
-            self.__req_data_agent.open_req(file_path)
-            self.__req_model.endRemoveRows()
+            self.__req_model.begin_reset()
+            success = self.__req_data_agent.open_req(file_path)
+            self.__req_model.end_reset()
 
             self.edit_board.edit_req(None)
             self.meta_board.reload_meta_data()
 
+            if not success:
+                QMessageBox.warning(self, 'Open fail', f'Cannot open req file: {file_path}')
+
     # -------------------------------- Public function --------------------------------
 
     def pop_search(self):
@@ -2931,8 +6180,17 @@ class RequirementUI(QMainWindow, IReqObserver):
             self.search_tree(text)
 
     def search_tree(self, text: str):
-        root_node = self.__req_data_agent.get_req_root()
-        filter_nodes = root_node.filter(partial(RequirementUI.__find_node_any_data, text))
+        filter_nodes = []
+        for _, node_uuid in self.__text_index.search(text):
+            node = self.__req_data_agent.get_req_node(node_uuid)
+            if node is not None:
+                filter_nodes.append(node)
+
+        if len(filter_nodes) == 0:
+            # The index matches by word. Fallback to the substring matching (e.g. a part of a word).
+            root_node = self.__req_data_agent.get_req_root()
+            if root_node is not None:
+                filter_nodes = root_node.filter(partial(RequirementUI.__find_node_any_data, text))
 
         default_index_window = self.sub_window_index['default']
         default_index_window.clear_index()
@@ -2941,11 +6199,33 @@ class RequirementUI(QMainWindow, IReqObserver):
             default_index_window.append_index(node.get_title(), node.get_uuid())
         default_index_window.show_right_bottom()
 
+    def pop_query(self):
+        text, ok = QInputDialog.getText(self, 'Query',
+                                        'Enter query (e.g. Status=Approved AND id:WHAT* AND last_change_time>2024-06-01):')
+        if ok:
+            self.query_tree(text)
+
+    def query_tree(self, text: str):
+        try:
+            node_uuids = self.__query_engine.query(text)
+        except ValueError as e:
+            QMessageBox.information(self, 'Query', f'Invalid query: {e}')
+            return
+
+        default_index_window = self.sub_window_index['default']
+        default_index_window.clear_index()
+
+        for node_uuid in node_uuids:
+            node = self.__req_data_agent.get_req_node(node_uuid)
+            if node is not None:
+                default_index_window.append_index(node.get_title(), node.get_uuid())
+        default_index_window.show_right_bottom()
+        self.toast_status(f'Query matched {len(node_uuids)} items.')
+
     def jump_by_id(self, node_id: str):
-        root_node = self.__req_data_agent.get_req_root()
-        find_node = root_node.filter(lambda x: x.get_uuid() == node_id)
-        if len(find_node) > 0:
-            self.jump_to_node(find_node[0])
+        find_node = self.__req_data_agent.get_req_node(node_id)
+        if find_node is not None:
+            self.jump_to_node(find_node)
 
     def jump_to_node(self, node: ReqNode):
         index = self.__req_model.index_of_node(node)
@@ -2986,11 +6266,64 @@ class RequirementUI(QMainWindow, IReqObserver):
         # 对话框关闭后，将QTreeView重新放回QDockWidget
         self.dock_tree_requirements.setWidget(self.__tree_requirements)
 
+    # The count of nodes that expand-all handles in one event loop round.
+    EXPAND_BATCH_SIZE = 200
+
     def do_expand_node_all(self, index):
-        if index.isValid():
-            self.__tree_requirements.expand(index)
-            for i in range(self.__tree_requirements.model().rowCount(index)):
-                self.do_expand_node_all(self.__tree_requirements.model().index(i, 0, index))
+        """
+        Expand the node (the whole tree if index is invalid) and all its descendants.
+        It's done in chunks from the event loop with a cancelable progress dialog. So the UI keeps responding.
+        """
+        self.cancel_expand_all()
+
+        root_node = self.__req_data_agent.get_req_root()
+        node = ReqModel.get_node_from_index(index) if index is not None and index.isValid() else root_node
+        if node is None:
+            return
+
+        total = sum(1 for _ in iterate_req_tree(node))
+        self.__expand_queue = deque([node])
+        self.__expand_handled = 0
+        self.__expand_progress = QProgressDialog('Expanding...', 'Cancel', 0, total, self)
+        self.__expand_progress.setWindowTitle('Expand All')
+        self.__expand_progress.setMinimumDuration(500)
+        self.__expand_progress.canceled.connect(self.cancel_expand_all)
+        self.__expand_timer.start(0)
+
+    def cancel_expand_all(self):
+        self.__expand_timer.stop()
+        self.__expand_queue.clear()
+        if self.__expand_progress is not None:
+            progress, self.__expand_progress = self.__expand_progress, None
+            progress.canceled.disconnect(self.cancel_expand_all)
+            progress.close()
+            progress.deleteLater()
+
+    def __on_expand_timer(self):
+        # Breadth first. So the upper levels show up first.
+        handled = 0
+        self.__tree_requirements.setUpdatesEnabled(False)
+        try:
+            while len(self.__expand_queue) > 0 and handled < RequirementUI.EXPAND_BATCH_SIZE:
+                node: ReqNode = self.__expand_queue.popleft()
+                handled += 1
+                if node.child_count() == 0:
+                    continue
+                self.__req_model.fetch_all_children(node)
+                if node.parent() is not None:
+                    self.__tree_requirements.expand(self.__req_model.index_of_node(node))
+                self.__expand_queue.extend(node.children())
+        except Exception as e:
+            print(f'Expand all fail: {e}')
+            self.__expand_queue.clear()
+        finally:
+            self.__tree_requirements.setUpdatesEnabled(True)
+
+        self.__expand_handled += handled
+        if self.__expand_progress is not None:
+            self.__expand_progress.setValue(self.__expand_handled)
+        if len(self.__expand_queue) == 0:
+            self.cancel_expand_all()
 
     def do_collapse_node_all(self, index):
         if index.isValid():
@@ -3012,6 +6345,24 @@ class RequirementUI(QMainWindow, IReqObserver):
                self.__selected_index.isValid() and \
                self.__selected_node is not None
 
+    def __selected_nodes(self) -> List[ReqNode]:
+        """
+        The selected nodes in tree order, without the ones whose ancestor is selected.
+        """
+        selected_indexes = self.__tree_requirements.selectionModel().selectedRows(0)
+        nodes = [ReqModel.get_node_from_index(index) for index in selected_indexes]
+        nodes = [node for node in nodes if node is not None]
+        if len(nodes) == 0 and self.__tree_item_selected():
+            nodes = [self.__selected_node]
+
+        def tree_order(node: ReqNode) -> list:
+            orders = []
+            while node.parent() is not None:
+                orders.append(node.order())
+                node = node.parent()
+            return orders[::-1]
+        return sorted(top_level_nodes(nodes), key=tree_order)
+
     def __update_selected_index(self, index: QModelIndex or None):
         if index is not None and index.isValid():
             req_node: ReqNode = index.internalPointer()
@@ -3026,15 +6377,58 @@ class RequirementUI(QMainWindow, IReqObserver):
     def __on_meta_data_updated(self):
         self.edit_board.on_meta_data_updated()
 
+    def __update_undo_actions(self):
+        undo_text = self.undo_stack.undo_text()
+        redo_text = self.undo_stack.redo_text()
+        self.undo_action.setText(f'Undo {undo_text}' if undo_text != '' else 'Undo')
+        self.redo_action.setText(f'Redo {redo_text}' if redo_text != '' else 'Redo')
+
+    def __after_undo_redo(self, command_name: str):
+        if command_name == '':
+            return
+        if command_name == 'Edit Meta':
+            self.meta_board.reload_meta_data()
+            self.__on_meta_data_updated()
+        # Show the restored data unless the user is editing.
+        if not self.edit_board.is_content_edited():
+            self.__update_selected_index(self.__tree_requirements.currentIndex())
+
 
 # ---------------------------------------------------------------------------------------------------------------------
 
+def create_req_agent() -> IReqAgent:
+    # Started as a script, this module is __main__. Let the agents and plugins that import FreeReq share it,
+    #   instead of loading a second copy whose ReqNode is a different class.
+    sys.modules.setdefault('FreeReq', sys.modules[__name__])
+
+    agent_name = easy_config.get('req_agent', 'json') if easy_config is not None else 'json'
+    if agent_name == 'sqlite':
+        try:
+            from extra.ReqSQLiteAgent import ReqSQLiteAgent
+            return ReqSQLiteAgent()
+        except Exception as e:
+            print(e)
+            print('Use ReqSingleJsonFileAgent instead.')
+        finally:
+            pass
+    return ReqSingleJsonFileAgent()
+
+
 def main():
     app = QApplication(sys.argv)
 
-    req_agent = ReqSingleJsonFileAgent()
+    req_agent = create_req_agent()
     req_agent.init()
 
+    if easy_config is not None and isinstance(req_agent, ReqSingleJsonFileAgent):
+        req_agent.enable_journal(easy_config.get('journal.enable', False),
+                                 easy_config.get('journal.compact_threshold', 1000),
+                                 easy_config.get('journal.fsync', True))
+        if easy_config.get('lazy_loading.enable', False):
+            req_agent.set_lazy_loading(easy_config.get('lazy_loading.depth', 1))
+        req_agent.set_json_codec(ReqJsonCodec(easy_config.get('json_codec.backend', 'auto'),
+                                              easy_config.get('json_codec.compact', False)))
+
     if easy_config is not None and plugin_manager is not None:
         plugins = easy_config.get('plugin', [])
         for plugin in plugins:
@@ -3044,6 +6438,19 @@ def main():
         plugin_manager.invoke_all('req_agent_prepared', req_agent)
 
     w = RequirementUI(req_agent)
+    if easy_config is not None:
+        w.undo_stack.set_memory_budget(
+            easy_config.get('undo.memory_mb', ReqUndoStack.DEFAULT_MEMORY_BUDGET // (1024 * 1024)) * 1024 * 1024)
+        w.undo_stack.set_merge_interval(
+            easy_config.get('undo.merge_ms', int(ReqUndoStack.DEFAULT_MERGE_INTERVAL * 1000)) / 1000)
+        w.edit_board.set_render_debounce(easy_config.get('markdown_render.debounce_ms',
+                                                         MarkdownRenderScheduler.DEFAULT_DEBOUNCE_MS))
+        w.edit_board.set_render_incremental_min_size(
+            easy_config.get('markdown_render.incremental_min_size',
+                            MarkdownRenderScheduler.DEFAULT_INCREMENTAL_MIN_SIZE))
+        markdown_render_cache.set_memory_cap(
+            easy_config.get('markdown_render.cache_mb', MarkdownRenderCache.DEFAULT_MEMORY_CAP // (1024 * 1024))
+            * 1024 * 1024)
 
     if not req_agent.open_req('FreeReq'):
         req_agent.new_req('FreeReq', True)
@@ -3053,9 +6460,163 @@ def main():
     sys.exit(app.exec_())
 
 
+# ----------------------------------------------------------------------------------------------------------------------
+
+def __render_markdown_page(md_text: str) -> str:
+    # For process pool. Must be a module level function.
+    return markdown2.markdown(md_text, extras=MARKDOWN_EXTRAS)
+
+
+def render_markdown_pages(markdowns: List[str], workers: int = 0) -> List[str]:
+    """
+    Convert markdown pages to html fragments (without HTML_TEMPLATE) with a process pool.
+    :param markdowns: The markdown pages.
+    :param workers: The process count. 0 to use the cpu count. 1 to convert in current process.
+    :return: The html fragments in the same order as markdowns.
+    """
+    workers = workers if workers > 0 else (os.cpu_count() or 1)
+    if workers <= 1 or len(markdowns) <= 1:
+        return [__render_markdown_page(md_text) for md_text in markdowns]
+    with ProcessPoolExecutor(max_workers=min(workers, len(markdowns))) as executor:
+        return list(executor.map(__render_markdown_page, markdowns,
+                                 chunksize=max(1, len(markdowns) // (workers * 4))))
+
+
+def export_req(req_file: str, output: str, export_format: str = '', node: str = '', recursive: bool = True,
+               dense: bool = False, workers: int = 0, embed_images: bool = False) -> bool:
+    """
+    Export req content to a single html, pdf or markdown file without the GUI.
+    :param req_file: The .req file path.
+    :param output: The output file path.
+    :param export_format: 'html', 'pdf' or 'md'. Empty to decide by the output file extension.
+    :param node: The uuid or req id of the node to export. Empty to export the whole req.
+    :param recursive: Export the children of node.
+    :param dense: For pdf. Print all content in one page instead of one page per req.
+    :param workers: The worker count for rendering (and the web view count for pdf). 0 to use the cpu count.
+    :param embed_images: For html. Embed the images into html file.
+    :return: True if success.
+    """
+    output = os.path.abspath(output)
+    if export_format == '':
+        export_format = os.path.splitext(output)[1].lower().lstrip('.')
+        export_format = {'htm': 'html', 'markdown': 'md'}.get(export_format, export_format)
+    if export_format not in ('html', 'pdf', 'md'):
+        print(f'Unsupported export format: {export_format}')
+        return False
+
+    req_agent = ReqSingleJsonFileAgent()
+    # Exporting never changes the req. A left journal is replayed in memory, not folded into the req file.
+    req_agent.set_read_only(True)
+    # Note that open_req() changes current path to the req path. So the relative image path works.
+    if not req_agent.open_req(os.path.abspath(req_file)):
+        print(f'Open req file fail: {req_file}')
+        return False
+
+    root_node = req_agent.get_req_root()
+    if node != '':
+        export_node = req_agent.get_req_node(node)
+        if export_node is None:
+            id_nodes = root_node.filter(lambda n: n.get(STATIC_FIELD_ID, '') == node)
+            export_node = id_nodes[0] if len(id_nodes) > 0 else None
+        if export_node is None:
+            print(f'Cannot find node: {node}')
+            return False
+        markdowns = collect_req_content(export_node, recursive)
+    else:
+        markdowns = collect_req_content(root_node.children(), recursive)
+    print(f'Export {len(markdowns)} pages to {output}')
+
+    if export_format == 'md':
+        with open(output, 'wt', encoding='utf-8') as f:
+            f.write('\n\n'.join(markdowns))
+        return True
+
+    if export_format == 'pdf' and dense:
+        markdowns = ['\n\n'.join(markdowns)]
+    fragments = render_markdown_pages(markdowns, workers)
+    css = MARK_DOWN_CSS_TABLE
+
+    if export_format == 'html':
+        html_text = HTML_TEMPLATE.format(css=css, content='\n'.join(fragments)).replace('strike>', 'del>')
+        if embed_images:
+            html_text = embed_html_images(html_text, req_agent.get_req_path())
+        with open(output, 'wt', encoding='utf-8') as f:
+            f.write(html_text)
+        return True
+
+    return __export_pdf(output, markdowns, fragments, css, req_agent.get_req_path(), workers)
+
+
+def __export_pdf(output: str, markdowns: List[str], fragments: List[str], css: str,
+                 root_path: str, workers: int) -> bool:
+    # No display on the CI server.
+    if platform.system() == 'Linux' and not os.environ.get('DISPLAY') and not os.environ.get('WAYLAND_DISPLAY'):
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+
+    if not has_web_engine_view():
+        print('Export pdf needs QtWebEngine.')
+        return False
+
+    # The pages are rendered by process pool already. Let WebViewPrinter pick them from cache.
+    pages = [HTML_TEMPLATE.format(css=css, content=fragment) for fragment in fragments]
+    stats = markdown_render_cache.get_stats()
+    markdown_render_cache.set_memory_cap(max(stats['memory_cap'], sum(sys.getsizeof(page) for page in pages)))
+    for md_text, page in zip(markdowns, pages):
+        markdown_render_cache.put(markdown_render_cache.make_key(md_text, css, MARKDOWN_EXTRAS), page)
+
+    result = []
+
+    def on_print_done(print_result: str):
+        result.append(print_result)
+        app.quit()
+
+    def on_print_progress(printed: int, total: int):
+        print(f'Printed {printed}/{total}')
+
+    printer = WebViewPrinter(output, markdowns, root_path, on_print_done,
+                             workers if workers > 0 else WebViewPrinter.DEFAULT_POOL_SIZE, on_print_progress)
+    printer.print()
+    if len(result) == 0:
+        app.exec_()
+    return len(result) > 0 and result[0] == 'finished'
+
+
+def export_main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog='FreeReq.py export',
+                                     description='Export req content to html, pdf or markdown without the GUI.')
+    parser.add_argument('req_file', help='The .req file.')
+    parser.add_argument('-o', '--output', required=True, help='The output file.')
+    parser.add_argument('-f', '--format', default=None, choices=['html', 'pdf', 'md'],
+                        help='The export format. Decided by the output file extension if not specified.')
+    parser.add_argument('-n', '--node', default='',
+                        help='The uuid or req id of the node to export. Export the whole req if not specified.')
+    parser.add_argument('--no-recursive', action='store_true', help='Do not export the children of the node.')
+    parser.add_argument('--dense', action='store_true', help='PDF: Print all content in one page.')
+    parser.add_argument('--embed-images', action='store_true', help='HTML: Embed the images into html file.')
+    parser.add_argument('-j', '--workers', type=int, default=0,
+                        help='The worker count for rendering. Default is the cpu count.')
+    args = parser.parse_args(argv)
+
+    try:
+        ok = export_req(args.req_file, args.output, args.format or '', args.node, not args.no_recursive,
+                        args.dense, args.workers, args.embed_images)
+    except Exception as e:
+        print(e)
+        print(traceback.format_exc())
+        ok = False
+    finally:
+        pass
+    print('Export done.' if ok else 'Export fail.')
+    return 0 if ok else 1
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 
 if __name__ == "__main__":
+    # Headless export: python FreeReq.py export <req file> -o <output file> [options]
+    if len(sys.argv) > 1 and sys.argv[1] == 'export':
+        sys.exit(export_main(sys.argv[2:]))
     try:
         main()
     except Exception as e:
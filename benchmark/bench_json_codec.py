@@ -0,0 +1,76 @@
+"""
+Compare the load (loads) and save (dumps) time of the JSON codecs on generated req trees.
+
+Usage: python -m benchmark.bench_json_codec [--sizes 1000 10000 100000] [--repeat 3] [--output result.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+with contextlib.redirect_stdout(sys.stderr):
+    # FreeReq prints the optional component status on importing. Keep stdout for the result.
+    from FreeReq import ReqJsonCodec
+from benchmark.req_generator import generate_req_dict
+
+
+def best_time(func, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def benchmark_codecs(sizes: [int], repeat: int) -> [dict]:
+    results = []
+    for size in sizes:
+        req_dict = generate_req_dict(size)
+        reference = json.dumps(req_dict, indent=4, ensure_ascii=False).encode('utf-8')
+        for backend in ReqJsonCodec.BACKENDS:
+            for compact in (False, True):
+                codec = ReqJsonCodec(backend, compact)
+                if codec.backend() != backend:
+                    # Not installed
+                    continue
+                data = codec.dumps(req_dict)
+                results.append({
+                    'nodes': size,
+                    'backend': backend,
+                    'format': 'compact' if compact else 'pretty',
+                    'bytes': len(data),
+                    'save_seconds': best_time(lambda: codec.dumps(req_dict), repeat),
+                    'load_seconds': best_time(lambda: codec.loads(data), repeat),
+                    'identical_to_stdlib': data == reference if not compact else None,
+                })
+                print(f'{size:>8} nodes | {backend:<6} | {results[-1]["format"]:<7} | '
+                      f'save {results[-1]["save_seconds"]:.4f}s | load {results[-1]["load_seconds"]:.4f}s | '
+                      f'{len(data) / 1024 / 1024:.2f}MB', file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FreeReq JSON codec benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', type=str, default='', help='Write the result json to file. Default stdout.')
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(sys.stderr):
+        results = benchmark_codecs(args.sizes, args.repeat)
+    result_text = json.dumps({'benchmark': 'json_codec', 'results': results}, indent=4)
+    if args.output != '':
+        with open(args.output, 'wt', encoding='utf-8') as f:
+            f.write(result_text)
+    else:
+        print(result_text)
+
+
+if __name__ == '__main__':
+    main()
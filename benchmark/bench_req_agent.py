@@ -0,0 +1,202 @@
+"""
+Benchmark the core paths of ReqSingleJsonFileAgent headlessly on generated req files.
+The result is printed (or written to --output) as json, so it can be compared between versions.
+
+Usage: python -m benchmark.bench_req_agent [--sizes 1000 10000 100000] [--ops 20] [--memory] [--output result.json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import contextlib
+import platform
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+with contextlib.redirect_stdout(sys.stderr):
+    # FreeReq prints the optional component status on importing. Keep stdout for the result.
+    from FreeReq import ReqSingleJsonFileAgent, ReqJsonCodec, ReqNode, STATIC_FIELD_CONTENT
+from benchmark.req_generator import generate_req_dict, write_req_file, parse_meta_fields, WORDS
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+finally:
+    pass
+
+
+class Stage:
+    """
+    Time a benchmark stage, and trace its peak memory if required.
+    """
+    def __init__(self, trace_memory: bool):
+        self.trace_memory = trace_memory
+        self.seconds = 0.0
+        self.peak_memory = None
+
+    def __enter__(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.seconds = time.perf_counter() - self.start
+        if self.trace_memory:
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return False
+
+
+def find_node_any_data(text: str, node: ReqNode) -> bool:
+    # The same as RequirementUI search_tree()
+    for v in node.data().values():
+        if isinstance(v, str) and text in v:
+            return True
+    return False
+
+
+def create_agent(work_dir: str, args) -> ReqSingleJsonFileAgent:
+    agent = ReqSingleJsonFileAgent(work_dir)
+    agent.init()
+    agent.set_json_codec(ReqJsonCodec(args.codec, args.compact))
+    if args.journal:
+        agent.enable_journal(True)
+    if args.lazy_depth >= 0:
+        agent.set_lazy_loading(args.lazy_depth)
+    return agent
+
+
+def benchmark_size(node_count: int, args) -> [dict]:
+    rand = random.Random(args.seed)
+    results = []
+
+    def record(operation: str, count: int, stage: Stage):
+        results.append({
+            'nodes': node_count,
+            'operation': operation,
+            'count': count,
+            'seconds': stage.seconds,
+            'ops_per_second': count / stage.seconds if stage.seconds > 0 else None,
+            'peak_memory_bytes': stage.peak_memory,
+        })
+        print(f'{node_count:>8} nodes | {operation:<12} x{count:<5} | {stage.seconds:.4f}s', file=sys.stderr)
+
+    meta_fields = parse_meta_fields(args.meta_fields) if args.meta_fields is not None else None
+    req_dict = generate_req_dict(node_count, args.fan_out, args.max_depth, args.content_size,
+                                 meta_fields, args.id_prefixes, args.seed)
+    id_prefixes = req_dict['req_meta']['meta_group']
+
+    work_dir = tempfile.mkdtemp(prefix='freereq_bench_')
+    req_file = os.path.join(work_dir, 'Benchmark.req')
+    write_req_file(req_file, req_dict)
+    del req_dict
+
+    try:
+        agent = create_agent(work_dir, args)
+        with Stage(args.memory) as stage:
+            agent.open_req(req_file)
+        record('open_req', 1, stage)
+        results[-1]['file_bytes'] = os.path.getsize(req_file)
+
+        with Stage(args.memory) as stage:
+            agent.save_req()
+            # Saving is asynchronous. Wait for it.
+            agent.check_req_consistency()
+        record('save_req', 1, stage)
+
+        root = agent.get_req_root()
+        all_nodes = root.filter(lambda n: n is not root)
+
+        with Stage(args.memory) as stage:
+            for i in range(args.ops):
+                parent = rand.choice(all_nodes)
+                agent.insert_node(parent.get_uuid(), 0, ReqNode(f'Benchmark Insert {i}'))
+            agent.check_req_consistency()
+        record('insert_node', args.ops, stage)
+
+        with Stage(args.memory) as stage:
+            for i in range(args.ops):
+                node = rand.choice(all_nodes).clone()
+                node.set(STATIC_FIELD_CONTENT, f'Benchmark Update {i}')
+                agent.update_node(node)
+            agent.check_req_consistency()
+        record('update_node', args.ops, stage)
+
+        leaves = [n for n in all_nodes if n.child_count() == 0]
+        rand.shuffle(leaves)
+        remove_count = min(args.ops, len(leaves))
+        with Stage(args.memory) as stage:
+            for node in leaves[:remove_count]:
+                agent.remove_node(node.get_uuid())
+            agent.check_req_consistency()
+        record('remove_node', remove_count, stage)
+
+        id_count = args.ops * 100
+        with Stage(args.memory) as stage:
+            for i in range(id_count):
+                agent.new_req_id(id_prefixes[i % len(id_prefixes)])
+        record('new_req_id', id_count, stage)
+
+        texts = [rand.choice(WORDS) + ' ' + rand.choice(WORDS) for _ in range(args.searches)]
+        with Stage(args.memory) as stage:
+            for text in texts:
+                agent.get_req_root().filter(lambda n: find_node_any_data(text, n))
+        record('search', len(texts), stage)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FreeReq core path benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='Node counts')
+    parser.add_argument('--ops', type=int, default=20, help='Operation count of insert/update/remove')
+    parser.add_argument('--searches', type=int, default=5, help='Search count')
+    parser.add_argument('--fan-out', type=int, default=10)
+    parser.add_argument('--max-depth', type=int, default=0)
+    parser.add_argument('--content-size', type=int, default=256)
+    parser.add_argument('--meta-fields', type=str, nargs='*', default=None)
+    parser.add_argument('--id-prefixes', type=str, nargs='*', default=None)
+    parser.add_argument('--codec', type=str, default='auto', help='JSON backend: auto, orjson, ujson, json')
+    parser.add_argument('--compact', action='store_true', help='Save in compact json format')
+    parser.add_argument('--journal', action='store_true', help='Enable write-ahead journal')
+    parser.add_argument('--lazy-depth', type=int, default=-1, help='Lazy loading depth. -1 to disable')
+    parser.add_argument('--memory', action='store_true', help='Trace peak memory of each stage (slower)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default='', help='Write the result json to file. Default stdout.')
+    args = parser.parse_args()
+
+    # The agent prints for each notification. Keep the output clean.
+    results = []
+    with open(os.devnull, 'wt') as devnull, contextlib.redirect_stdout(devnull):
+        for size in args.sizes:
+            results.extend(benchmark_size(size, args))
+
+    report = {
+        'benchmark': 'req_agent',
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'json_backend': ReqJsonCodec(args.codec).backend(),
+        'parameters': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': results,
+        # ru_maxrss is KB on Linux and bytes on macOS.
+        'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource is not None else None,
+    }
+    report_text = json.dumps(report, indent=4)
+    if args.output != '':
+        with open(args.output, 'wt', encoding='utf-8') as f:
+            f.write(report_text)
+    else:
+        print(report_text)
+
+
+if __name__ == '__main__':
+    main()
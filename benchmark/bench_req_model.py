@@ -0,0 +1,180 @@
+"""
+Benchmark the paint path of ReqModel (the requirement tree with meta columns) headlessly on generated req files.
+Each repaint queries the visible grid, about --rows x columns cells, by data() and paints the tree view viewport.
+
+The "uncached" result queries the grid by the same logic as data() without the column and row display cache,
+    so the effect of the cache can be compared in one run.
+
+Usage: python -m benchmark.bench_req_model [--sizes 1000 10000 50000] [--rows 30] [--repaints 200] [--output result.json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import contextlib
+import platform
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if 'QT_QPA_PLATFORM' not in os.environ:
+    os.environ['QT_QPA_PLATFORM'] = 'offscreen'
+
+with contextlib.redirect_stdout(sys.stderr):
+    # FreeReq prints the optional component status on importing. Keep stdout for the result.
+    from FreeReq import ReqSingleJsonFileAgent, ReqModel, STATIC_FIELD_ID, STATIC_META_ID_PREFIX
+from benchmark.req_generator import generate_req_dict, write_req_file, parse_meta_fields
+
+from PyQt5.QtCore import Qt, QModelIndex
+from PyQt5.QtWidgets import QApplication, QTreeView
+
+
+def uncached_display(agent: ReqSingleJsonFileAgent, index: QModelIndex):
+    # The data() of ReqModel without cache: build the column titles and the node data dict for each cell.
+    req_node = index.internalPointer()
+    column_index = index.column()
+    if column_index == 0:
+        return req_node.get_title()
+    elif column_index == 1:
+        return req_node.get(STATIC_FIELD_ID, '')
+    meta_title = list(agent.get_req_meta().keys())
+    if STATIC_META_ID_PREFIX in meta_title:
+        meta_title.remove(STATIC_META_ID_PREFIX)
+    meta_title.insert(0, 'Req ID')
+    meta_title.insert(0, 'Tree')
+    meta_data_key = meta_title[column_index] if column_index < len(meta_title) else ''
+    return req_node.data().get(meta_data_key, '')
+
+
+def visible_grid(model: ReqModel, rows: int) -> [QModelIndex]:
+    # The first rows in the expanded tree, in display order.
+    indexes = []
+    stack = [QModelIndex()]
+    while len(stack) > 0 and len(indexes) < rows:
+        parent = stack.pop()
+        if model.canFetchMore(parent):
+            model.fetchMore(parent)
+        children = [model.index(row, 0, parent) for row in range(model.rowCount(parent))]
+        if parent.isValid():
+            indexes.append(parent)
+        stack.extend(reversed(children))
+    column_count = model.columnCount()
+    return [index.sibling(index.row(), column) for index in indexes[:rows] for column in range(column_count)]
+
+
+def benchmark_size(node_count: int, args) -> [dict]:
+    results = []
+
+    def record(operation: str, seconds: float, cells: int):
+        results.append({
+            'nodes': node_count,
+            'operation': operation,
+            'repaints': args.repaints,
+            'cells': cells,
+            'seconds': seconds,
+            'ms_per_repaint': seconds * 1000 / args.repaints,
+        })
+        print(f'{node_count:>8} nodes | {operation:<18} x{args.repaints:<5} | {seconds:.4f}s | '
+              f'{results[-1]["ms_per_repaint"]:.3f}ms per repaint', file=sys.stderr)
+
+    meta_fields = parse_meta_fields(args.meta_fields) if args.meta_fields is not None else None
+    req_dict = generate_req_dict(node_count, args.fan_out, 0, 0, meta_fields, None, args.seed)
+
+    work_dir = tempfile.mkdtemp(prefix='freereq_bench_')
+    req_file = os.path.join(work_dir, 'Benchmark.req')
+    write_req_file(req_file, req_dict)
+    del req_dict
+
+    try:
+        agent = ReqSingleJsonFileAgent(work_dir)
+        agent.init()
+        agent.open_req(req_file)
+
+        model = ReqModel(agent)
+        agent.add_observer(model)
+        model.show_meta(True)
+        grid = visible_grid(model, args.rows)
+
+        start = time.perf_counter()
+        for _ in range(args.repaints):
+            for index in grid:
+                uncached_display(agent, index)
+        record('data_uncached', time.perf_counter() - start, len(grid))
+
+        start = time.perf_counter()
+        for _ in range(args.repaints):
+            model.clear_display_cache()
+            for index in grid:
+                model.data(index, Qt.DisplayRole)
+        record('data_cold', time.perf_counter() - start, len(grid))
+
+        start = time.perf_counter()
+        for _ in range(args.repaints):
+            for index in grid:
+                model.data(index, Qt.DisplayRole)
+        record('data_warm', time.perf_counter() - start, len(grid))
+
+        view = QTreeView()
+        view.setModel(model)
+        view.resize(1280, 30 + args.rows * view.fontMetrics().height() * 3 // 2)
+        view.expandToDepth(1)
+        view.show()
+        QApplication.processEvents()
+
+        start = time.perf_counter()
+        for _ in range(args.repaints):
+            model.clear_display_cache()
+            view.viewport().repaint()
+        record('view_repaint_cold', time.perf_counter() - start, len(grid))
+
+        start = time.perf_counter()
+        for _ in range(args.repaints):
+            view.viewport().repaint()
+        record('view_repaint_warm', time.perf_counter() - start, len(grid))
+
+        view.close()
+        agent.remove_observer(model)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FreeReq tree model paint benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000], help='Node counts')
+    parser.add_argument('--rows', type=int, default=30, help='Visible row count')
+    parser.add_argument('--repaints', type=int, default=200, help='Repaint count')
+    parser.add_argument('--fan-out', type=int, default=10)
+    parser.add_argument('--meta-fields', type=str, nargs='*', default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default='', help='Write the result json to file. Default stdout.')
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv[:1])
+
+    # The agent prints for each notification. Keep the output clean.
+    results = []
+    with open(os.devnull, 'wt') as devnull, contextlib.redirect_stdout(devnull):
+        for size in args.sizes:
+            results.extend(benchmark_size(size, args))
+
+    report = {
+        'benchmark': 'req_model',
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'qt_platform': app.platformName(),
+        'parameters': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': results,
+    }
+    report_text = json.dumps(report, indent=4)
+    if args.output != '':
+        with open(args.output, 'wt', encoding='utf-8') as f:
+            f.write(report_text)
+    else:
+        print(report_text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+import json
+import uuid
+import random
+import datetime
+from typing import Dict, List
+
+
+# Same as the meta of FreeReq.req
+DEFAULT_META_FIELDS = {
+    'Owner': [],
+    'Version': [],
+    'Status': ['Draft', 'Submitted', 'Reviewing', 'Reserved', 'Approved', 'Deferred', 'Rejected'],
+    'Priority': ['Must / Vital', 'Should / Necessary', 'Could / Nice to Have', 'To Be Defined'],
+    'Implementation': ['Not Implemented', 'Planing', 'Designing', 'Implementing', 'Verifying',
+                       'Full Implemented', 'Partial Implemented'],
+}
+
+DEFAULT_ID_PREFIXES = ['WHY', 'WHAT', 'HOW']
+
+WORDS = ['system', 'shall', 'user', 'request', 'support', 'data', 'report', 'export', 'config', 'module',
+         'interface', 'timeout', 'response', 'within', 'error', 'message', 'log', 'record', 'update', 'display',
+         '需求', '用户', '系统', '支持', '数据', '接口']
+
+
+def generate_req_dict(node_count: int, fan_out: int = 10, max_depth: int = 0, content_size: int = 256,
+                      meta_fields: Dict[str, List[str]] = None, id_prefixes: List[str] = None,
+                      seed: int = 0) -> dict:
+    """
+    Generate a req json dict (the same structure as .req file) with realistic node data.
+    :param node_count: The node count, not including the root node.
+    :param fan_out: The max child count of a node.
+    :param max_depth: The max depth of nodes. The tree is filled level by level. 0 for no limit.
+                        If the node_count cannot be reached in max_depth, the tree will be smaller.
+    :param content_size: The average content length in characters. The content is markdown text.
+    :param meta_fields: The meta fields and their selections. Empty selection means free text.
+                        None to use the meta of FreeReq.req.
+    :param id_prefixes: The req ID prefixes. The top level node uses the first one, the next level uses the second...
+    :param seed: The random seed. The same parameters and seed generate the same data.
+    :return: The req json dict.
+    """
+    rand = random.Random(seed)
+    meta_fields = DEFAULT_META_FIELDS if meta_fields is None else meta_fields
+    id_prefixes = DEFAULT_ID_PREFIXES if id_prefixes is None else id_prefixes
+    base_time = datetime.datetime(2024, 1, 1)
+    id_numbers = {}
+
+    def new_node(depth: int) -> dict:
+        prefix = id_prefixes[min(depth, len(id_prefixes) - 1)] if len(id_prefixes) > 0 else ''
+        req_id = ''
+        if prefix != '':
+            id_numbers[prefix] = id_numbers.get(prefix, 0) + 1
+            req_id = f'{prefix}{id_numbers[prefix]:05d}'
+        node = {
+            'id': req_id,
+            'uuid': uuid.UUID(int=rand.getrandbits(128)).hex,
+            'title': ' '.join(rand.choice(WORDS) for _ in range(rand.randint(2, 6))).capitalize(),
+            'content': generate_content(rand, content_size),
+        }
+        for field, selections in meta_fields.items():
+            if len(selections) > 0:
+                node[field] = rand.choice(selections + [''])
+            else:
+                node[field] = rand.choice(['', 'Alice', 'Bob', 'V1.0', 'V2.0'])
+        change_time = base_time + datetime.timedelta(seconds=rand.randint(0, 365 * 24 * 3600))
+        node['last_editor'] = rand.choice(['Alice', 'Bob', 'Carol'])
+        node['last_change_time'] = change_time.strftime('%Y-%m-%d %H:%M:%S')
+        node['child'] = []
+        return node
+
+    root = {'id': '', 'uuid': uuid.UUID(int=rand.getrandbits(128)).hex, 'title': 'Generated Requirement',
+            'content': '', 'child': []}
+    level = [root]
+    depth = 0
+    count = 0
+    while count < node_count and len(level) > 0 and (max_depth <= 0 or depth < max_depth):
+        next_level = []
+        for parent in level:
+            for _ in range(fan_out):
+                if count >= node_count:
+                    break
+                node = new_node(depth)
+                parent['child'].append(node)
+                next_level.append(node)
+                count += 1
+        level = next_level
+        depth += 1
+
+    req_meta = dict(meta_fields)
+    req_meta['meta_group'] = list(id_prefixes)
+    return {'req_meta': req_meta, 'req_data': root}
+
+
+def generate_content(rand: random.Random, content_size: int) -> str:
+    if content_size <= 0:
+        return ''
+    target = rand.randint(content_size // 2, content_size * 3 // 2)
+    lines = []
+    length = 0
+    while length < target:
+        kind = rand.random()
+        words = ' '.join(rand.choice(WORDS) for _ in range(rand.randint(4, 12)))
+        if kind < 0.15:
+            line = '## ' + words
+        elif kind < 0.45:
+            line = '- ' + words
+        elif kind < 0.55:
+            line = f'| {rand.choice(WORDS)} | {rand.randint(0, 1000)} |'
+        else:
+            line = words + '.'
+        lines.append(line)
+        length += len(line) + 1
+    return '\n'.join(lines)
+
+
+def write_req_file(file_path: str, req_dict: dict):
+    with open(file_path, 'wt', encoding='utf-8') as f:
+        f.write(json.dumps(req_dict, indent=4, ensure_ascii=False))
+
+
+def parse_meta_fields(texts: List[str]) -> Dict[str, List[str]]:
+    """
+    :param texts: Each one is "Name" (free text field) or "Name:Selection1,Selection2".
+    """
+    meta_fields = {}
+    for text in texts:
+        name, _, selections = text.partition(':')
+        meta_fields[name] = [s for s in selections.split(',') if s != '']
+    return meta_fields
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Generate a synthetic .req file')
+    parser.add_argument('--nodes', type=int, default=10000, help='Node count')
+    parser.add_argument('--fan-out', type=int, default=10, help='Max child count of a node')
+    parser.add_argument('--max-depth', type=int, default=0, help='Max depth of tree. 0 for no limit')
+    parser.add_argument('--content-size', type=int, default=256, help='Average content length')
+    parser.add_argument('--meta-fields', type=str, nargs='*', default=None,
+                        help='Meta fields as "Name" or "Name:Selection1,Selection2". Default the FreeReq.req meta')
+    parser.add_argument('--id-prefixes', type=str, nargs='*', default=None,
+                        help='Req ID prefix of each level. Default WHY WHAT HOW')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default='Generated.req')
+    args = parser.parse_args()
+
+    meta_fields = parse_meta_fields(args.meta_fields) if args.meta_fields is not None else None
+    req_dict = generate_req_dict(args.nodes, args.fan_out, args.max_depth, args.content_size,
+                                 meta_fields, args.id_prefixes, args.seed)
+    write_req_file(args.output, req_dict)
+    print(f'Generated: {args.output}')
+
+
+if __name__ == '__main__':
+    main()
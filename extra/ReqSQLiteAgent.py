@@ -0,0 +1,672 @@
+"""
+ReqSQLiteAgent - The implementation of IReqAgent that stores requirement in a SQLite database.
+
+Each ReqNode is a row in table req_node with its parent uuid and sibling order. The custom (meta) fields of a node
+    are stored in the side table req_node_meta. The req meta data is stored in table req_info.
+
+Only the root and the top level nodes are loaded when opening a requirement. The children of a node are fetched
+    from database when they are accessed. Each node operation is a small transaction that only touches the
+    affected rows, so saving a large requirement base does not need to re-write the whole document.
+
+The .req json file can be imported / exported losslessly by import_req_json() / export_req_json().
+"""
+
+import os
+import json
+import uuid
+import sqlite3
+import traceback
+import contextlib
+from typing import List, Union
+
+from FreeReq import IReqAgent, ReqNode, self_path, STATIC_FIELDS, STATIC_FIELD_ID, STATIC_FIELD_UUID, \
+    STATIC_FIELD_TITLE, STATIC_FIELD_CHILD, STATIC_FIELD_CONTENT, STATIC_FIELD_LAST_EDITOR, \
+    STATIC_FIELD_LAST_CHANGE_TIME, STATIC_META_ID_PREFIX
+
+
+REQ_SQLITE_EXT = '.reqdb'
+
+# The static fields that have their own column in table req_node. Other fields go to req_node_meta.
+NODE_COLUMN_FIELDS = [STATIC_FIELD_ID, STATIC_FIELD_TITLE, STATIC_FIELD_CONTENT,
+                      STATIC_FIELD_LAST_EDITOR, STATIC_FIELD_LAST_CHANGE_TIME]
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS req_info (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS req_node (
+    uuid TEXT PRIMARY KEY,
+    parent_uuid TEXT,
+    sibling_order INTEGER NOT NULL DEFAULT 0,
+    id TEXT,
+    title TEXT,
+    content TEXT,
+    last_editor TEXT,
+    last_change_time TEXT,
+    field_order TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_req_node_parent ON req_node(parent_uuid, sibling_order);
+CREATE INDEX IF NOT EXISTS idx_req_node_id ON req_node(id);
+CREATE TABLE IF NOT EXISTS req_node_meta (
+    uuid TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (uuid, key)
+);
+"""
+
+NODE_SELECT_SQL = 'SELECT uuid, id, title, content, last_editor, last_change_time, field_order, ' \
+                  '(SELECT COUNT(*) FROM req_node c WHERE c.parent_uuid = n.uuid) FROM req_node n'
+
+SUBTREE_UUID_SQL = """
+WITH RECURSIVE subtree(uuid) AS (
+    SELECT ?
+    UNION ALL
+    SELECT n.uuid FROM req_node n JOIN subtree s ON n.parent_uuid = s.uuid
+)
+SELECT uuid FROM subtree
+"""
+
+ANCESTOR_UUID_SQL = """
+WITH RECURSIVE ancestor(uuid, parent_uuid, depth) AS (
+    SELECT uuid, parent_uuid, 0 FROM req_node WHERE uuid = ?
+    UNION ALL
+    SELECT n.uuid, n.parent_uuid, a.depth + 1 FROM req_node n JOIN ancestor a ON n.uuid = a.parent_uuid
+)
+SELECT uuid FROM ancestor ORDER BY depth DESC
+"""
+
+
+class ReqSQLiteAgent(IReqAgent):
+    def __init__(self, req_path: str = self_path):
+        super(ReqSQLiteAgent, self).__init__()
+        self.__req_path = req_path
+        self.__req_file_name = ''
+        self.__req_meta_dict = {}
+        self.__req_node_root: ReqNode = None
+        self.__connection: sqlite3.Connection = None
+
+        # Only the loaded nodes are in index
+        self.__req_id_max = {}
+        self.__uuid_node_index = {}
+
+    def init(self) -> bool:
+        return True
+
+    def req_full_path(self) -> str:
+        return os.path.join(self.__req_path, self.__req_file_name)
+
+    # ----------------------- Req management -----------------------
+
+    def list_req(self) -> [str]:
+        req_names = []
+        for f in os.scandir(self.__req_path):
+            if f.is_file() and f.name.lower().endswith(REQ_SQLITE_EXT):
+                req_names.append(f.name[:-len(REQ_SQLITE_EXT)])
+        return req_names
+
+    def new_req(self, req_name: str, overwrite: bool = False) -> bool:
+        self.__do_close()
+        req_file = self.__req_file_path(req_name)
+        if os.path.exists(req_file):
+            if not overwrite:
+                return False
+            os.remove(req_file)
+        try:
+            connection = ReqSQLiteAgent.__connect(req_file)
+            with connection:
+                root_node = ReqNode(ReqSQLiteAgent.__strip_ext(os.path.basename(req_file)))
+                ReqSQLiteAgent.__insert_node_rows(connection, '', 0, root_node)
+            connection.close()
+        except Exception as e:
+            print(str(e))
+            print(traceback.format_exc())
+            return False
+        finally:
+            pass
+        return self.open_req(req_file)
+
+    def open_req(self, req_name: str) -> bool:
+        self.__do_close()
+
+        req_file = self.__req_file_path(req_name)
+        if not os.path.isfile(req_file):
+            print(f'Requirement database not found: {req_file}')
+            return False
+
+        path_part = os.path.dirname(req_file)
+        file_part = os.path.basename(req_file)
+
+        if path_part != '':
+            self.__req_path = path_part
+            os.chdir(self.__req_path)
+            print(f'Change current path to: ${self.__req_path}')
+
+        return self.__do_load(file_part)
+
+    def save_req(self) -> bool:
+        """
+        All node operations are persisted immediately. This function writes the loaded nodes back, for the case that
+            nodes are changed without update_node() (e.g. batch assign Req ID).
+        """
+        if self.__connection is None:
+            return False
+        try:
+            with self.__transaction():
+                for node in list(self.__uuid_node_index.values()):
+                    ReqSQLiteAgent.__update_node_row(self.__connection, node)
+        except Exception as e:
+            print(str(e))
+            print(traceback.format_exc())
+            return False
+        finally:
+            pass
+        self.ob_notifier.notify_req_saved(self.req_full_path())
+        return True
+
+    def delete_req(self, req_name: str) -> bool:
+        return False
+
+    def check_req_consistency(self) -> bool:
+        # The database handles the concurrent access.
+        return True
+
+    def get_req_consistency_token(self) -> str:
+        if self.__connection is None:
+            return ''
+        # data_version changes on the commits of other connections, total_changes on the commits of this one.
+        data_version = self.__connection.execute('PRAGMA data_version').fetchone()[0]
+        return f'{data_version}-{self.__connection.total_changes}'
+
+    def get_req_file_filter(self) -> str:
+        return f'Requirement Database (*{REQ_SQLITE_EXT})'
+
+    # --------------------- After select_op_req() ---------------------
+
+    def get_req_name(self) -> str:
+        return self.__req_node_root.get_title() if self.__req_node_root is not None else ''
+
+    def get_req_path(self) -> str:
+        return self.__req_path
+
+    def get_req_meta(self) -> dict:
+        return self.__req_meta_dict
+
+    def set_req_meta(self, req_meta: dict) -> bool:
+        try:
+            with self.__transaction():
+                self.__connection.execute('INSERT OR REPLACE INTO req_info (key, value) VALUES (?, ?)',
+                                          ('req_meta', json.dumps(req_meta, ensure_ascii=False)))
+        except Exception as e:
+            print(str(e))
+            print(traceback.format_exc())
+            self.ob_notifier.notify_req_exception('save_fail', req_file=self.req_full_path())
+            return False
+        finally:
+            pass
+        self.__req_meta_dict = req_meta
+        self.ob_notifier.notify_meta_data_changed(self.get_req_name())
+        self.__calculate_req_id_max()
+        self.ob_notifier.notify_req_saved(self.req_full_path())
+        return True
+
+    def get_req_root(self) -> ReqNode:
+        return self.__req_node_root
+
+    def get_req_node(self, req_uuid: str) -> ReqNode:
+        node = self.__uuid_node_index.get(req_uuid, None)
+        if node is None and self.__connection is not None:
+            # Not loaded yet. Load the path from root to this node.
+            ancestors = [row[0] for row in self.__connection.execute(ANCESTOR_UUID_SQL, (req_uuid,))]
+            for ancestor_uuid in ancestors[:-1]:
+                ancestor = self.__uuid_node_index.get(ancestor_uuid, None)
+                if ancestor is None:
+                    break
+                ancestor.children()
+            node = self.__uuid_node_index.get(req_uuid, None)
+        return node
+
+    def get_req_node_by_id(self, req_id: str) -> ReqNode or None:
+        if self.__connection is None or req_id == '':
+            return None
+        row = self.__connection.execute('SELECT uuid FROM req_node WHERE id = ? LIMIT 1', (req_id, )).fetchone()
+        return self.get_req_node(row[0]) if row is not None else None
+
+    # ----------------------- Override: Node  Operation -----------------------
+
+    def insert_node(self, parent_uuid: str, insert_pos: int, insert_nodes: Union[ReqNode, List[ReqNode]]):
+        insert_nodes = [insert_nodes] if isinstance(insert_nodes, ReqNode) else insert_nodes
+        parent_node = self.get_req_node(parent_uuid)
+        if parent_node is None:
+            print('Warning: Cannot find parent node.')
+            return
+
+        parent_node.insert_children(insert_nodes, insert_pos)
+        first_order = insert_nodes[0].order() if len(insert_nodes) > 0 else 0
+
+        try:
+            with self.__transaction():
+                self.__connection.execute(
+                    'UPDATE req_node SET sibling_order = sibling_order + ? WHERE parent_uuid = ? AND sibling_order >= ?',
+                    (len(insert_nodes), parent_uuid, first_order))
+                for offset, node in enumerate(insert_nodes):
+                    ReqSQLiteAgent.__insert_node_rows(self.__connection, parent_uuid, first_order + offset, node)
+        except Exception as e:
+            print(str(e))
+            print(traceback.format_exc())
+            # The rows are rolled back. Keep the tree the same as the database.
+            for node in insert_nodes:
+                parent_node.remove_child(node)
+            self.ob_notifier.notify_req_exception('save_fail', req_file=self.req_full_path())
+            return
+        finally:
+            pass
+
+        for node in insert_nodes:
+            node.for_each(self.__index_node)
+        self.ob_notifier.notify_req_saved(self.req_full_path())
+        self.ob_notifier.notify_node_structure_changed(self.get_req_name(), parent_node, insert_nodes, 'add')
+
+    def remove_node(self, node_uuid: str):
+        remove_node = self.get_req_node(node_uuid)
+        if remove_node is None:
+            print('Cannot find remove node.')
+            return
+        parent_node = remove_node.parent()
+        if parent_node is None:
+            return
+
+        # The removed node may be pasted later. Load the whole sub tree before its rows deleted.
+        remove_node.for_each(lambda node: None)
+        remove_order = remove_node.order()
+        parent_node.remove_child(remove_node)
+
+        try:
+            with self.__transaction():
+                uuids = [(row[0],) for row in self.__connection.execute(SUBTREE_UUID_SQL, (node_uuid,))]
+                self.__connection.executemany('DELETE FROM req_node_meta WHERE uuid = ?', uuids)
+                self.__connection.executemany('DELETE FROM req_node WHERE uuid = ?', uuids)
+                self.__connection.execute(
+                    'UPDATE req_node SET sibling_order = sibling_order - 1 WHERE parent_uuid = ? AND sibling_order > ?',
+                    (parent_node.get_uuid(), remove_order))
+        except Exception as e:
+            print(str(e))
+            print(traceback.format_exc())
+            # The rows are rolled back. Put the node back.
+            parent_node.insert_children([remove_node], remove_order)
+            self.ob_notifier.notify_req_exception('save_fail', req_file=self.req_full_path())
+            return
+        finally:
+            pass
+
+        remove_node.for_each(self.__unindex_node)
+        self.ob_notifier.notify_req_saved(self.req_full_path())
+        self.ob_notifier.notify_node_structure_changed(self.get_req_name(), parent_node, [remove_node], 'remove')
+
+    def update_node(self, node: ReqNode):
+        update_node = self.get_req_node(node.get_uuid())
+        if update_node is None:
+            print('Warning: Cannot find update node.')
+            return
+        if update_node is not node:
+            update_node.copy_data(node)
+        else:
+            print("Warning: You'd better using a node copy to update target node.")
+
+        try:
+            with self.__transaction():
+                ReqSQLiteAgent.__update_node_row(self.__connection, update_node)
+        except Exception as e:
+            print(str(e))
+            print(traceback.format_exc())
+            # The node may be changed in place. Reload its data from the rolled back row.
+            rows = self.__read_node_rows('uuid = ?', (update_node.get_uuid(), ))
+            if len(rows) > 0:
+                update_node.copy_data(ReqNode.create_from_dict(rows[0][0]))
+            self.ob_notifier.notify_req_exception('save_fail', req_file=self.req_full_path())
+            return
+        finally:
+            pass
+
+        self.__index_node(update_node)
+        self.ob_notifier.notify_req_saved(self.req_full_path())
+        self.ob_notifier.notify_node_data_changed(self.get_req_name(), update_node)
+
+    def shift_node(self, node_uuid: str, shift_offset: int):
+        shift_node = self.get_req_node(node_uuid)
+        if shift_node is None or shift_node.parent() is None:
+            return
+        children = shift_node.parent().children()
+
+        current_index = shift_node.order()
+        new_index = shift_node.parent().shift_child(shift_node, shift_offset)
+        if new_index == current_index:
+            return
+
+        low, high = min(current_index, new_index), max(current_index, new_index)
+        try:
+            with self.__transaction():
+                self.__connection.executemany('UPDATE req_node SET sibling_order = ? WHERE uuid = ?',
+                                              [(order, children[order].get_uuid()) for order in range(low, high + 1)])
+        except Exception as e:
+            print(str(e))
+            print(traceback.format_exc())
+            # The rows are rolled back. Shift the node back.
+            shift_node.parent().shift_child(shift_node, current_index - new_index)
+            self.ob_notifier.notify_req_exception('save_fail', req_file=self.req_full_path())
+        finally:
+            pass
+
+    # ------------------------------- Batch ------------------------------
+
+    def on_batch_begin(self):
+        # One transaction for the whole batch. Each operation is a savepoint in it. See __transaction().
+        if self.__connection is not None and not self.__connection.in_transaction:
+            self.__connection.execute('BEGIN')
+
+    def on_batch_commit(self):
+        if self.__connection is None:
+            return
+        try:
+            self.__connection.commit()
+        except Exception as e:
+            print(str(e))
+            print(traceback.format_exc())
+            self.ob_notifier.notify_req_exception('save_fail', req_file=self.req_full_path())
+        finally:
+            pass
+
+    # -------------------------- Other Functions -------------------------
+
+    def new_req_id(self, id_prefix: str, digit_count: int = 5) -> str:
+        id_prefixes = self.__req_meta_dict.get(STATIC_META_ID_PREFIX, [])
+        if id_prefix in id_prefixes:
+            if id_prefix in self.__req_id_max.keys():
+                self.__req_id_max[id_prefix] += 1
+            else:
+                self.__req_id_max[id_prefix] = 1
+            format_str = '%%s%%0%dd' % digit_count
+            return format_str % (id_prefix, self.__req_id_max[id_prefix])
+        else:
+            # Unknown prefix
+            return id_prefix
+
+    # --------------------------- Import / Export --------------------------
+
+    def import_req_json(self, json_file: str, req_name: str = '', overwrite: bool = False) -> bool:
+        """
+        Create a requirement database from a .req json file and open it.
+        :param json_file: The .req json file path.
+        :param req_name: The database name. Use the json file name if it's empty.
+        :param overwrite: Overwrite the existing database.
+        :return: True if success.
+        """
+        if req_name == '':
+            req_name = os.path.splitext(json_file)[0]
+        req_file = self.__req_file_path(req_name)
+
+        self.__do_close()
+        if os.path.exists(req_file):
+            if not overwrite:
+                print(f'Requirement database already exists: {req_file}')
+                return False
+            os.remove(req_file)
+
+        try:
+            with open(json_file, 'rt', encoding='utf-8') as f:
+                json_dict = json.load(f)
+            connection = ReqSQLiteAgent.__connect(req_file)
+            with connection:
+                connection.execute('INSERT OR REPLACE INTO req_info (key, value) VALUES (?, ?)',
+                                   ('req_meta', json.dumps(json_dict.get('req_meta', {}), ensure_ascii=False)))
+                ReqSQLiteAgent.__insert_dict_rows(connection, json_dict.get('req_data', {}))
+            connection.close()
+        except Exception as e:
+            print(str(e))
+            print(traceback.format_exc())
+            return False
+        finally:
+            pass
+        return self.open_req(req_file)
+
+    def export_req_json(self, json_file: str) -> bool:
+        """
+        Export the opened requirement to a .req json file. It reads the rows directly, no ReqNode will be loaded.
+        :param json_file: The .req json file path.
+        :return: True if success.
+        """
+        if self.__connection is None:
+            return False
+        try:
+            children_dicts = {}
+            for row in self.__connection.execute(
+                    'SELECT uuid, parent_uuid, id, title, content, last_editor, last_change_time, field_order '
+                    'FROM req_node ORDER BY parent_uuid, sibling_order'):
+                children_dicts.setdefault(row[1] or '', []).append((row[0], list(row[2:])))
+
+            node_meta = {}
+            for _uuid, key, value in self.__connection.execute('SELECT uuid, key, value FROM req_node_meta'):
+                node_meta.setdefault(_uuid, {})[key] = json.loads(value)
+
+            def build_dict(_uuid: str, column_values: list) -> dict:
+                data = ReqSQLiteAgent.__row_to_data(_uuid, column_values, node_meta.get(_uuid, {}))
+                data[STATIC_FIELD_CHILD] = [build_dict(*child) for child in children_dicts.get(_uuid, [])]
+                return data
+
+            root_rows = children_dicts.get('', [])
+            json_dict = {
+                'req_meta': self.__req_meta_dict,
+                'req_data': build_dict(*root_rows[0]) if len(root_rows) > 0 else {}
+            }
+
+            json_text = json.dumps(json_dict, indent=4, ensure_ascii=False)
+            with open(json_file, 'wt', encoding='utf-8') as f:
+                f.write(json_text)
+        except Exception as e:
+            print(str(e))
+            print(traceback.format_exc())
+            return False
+        finally:
+            pass
+        return True
+
+    # -------------------------------------------------------------------------------
+
+    def __req_file_path(self, req_name: str) -> str:
+        req_file = req_name if req_name.lower().endswith(REQ_SQLITE_EXT) else req_name + REQ_SQLITE_EXT
+        if os.path.dirname(req_file) == '':
+            req_file = os.path.join(self.__req_path, req_file)
+        return req_file
+
+    def __do_load(self, req_file: str) -> bool:
+        self.__req_file_name = req_file
+        try:
+            self.__connection = ReqSQLiteAgent.__connect(self.req_full_path())
+
+            row = self.__connection.execute("SELECT value FROM req_info WHERE key = 'req_meta'").fetchone()
+            self.__req_meta_dict = json.loads(row[0]) if row is not None else {}
+
+            root_nodes = self.__load_nodes('parent_uuid IS NULL', ())
+            if len(root_nodes) == 0:
+                raise ValueError('No root node in requirement database.')
+            self.__req_node_root = root_nodes[0]
+            # Load the top level
+            self.__req_node_root.children()
+
+            self.__calculate_req_id_max()
+        except Exception as e:
+            print(str(e))
+            print(traceback.format_exc())
+            self.__req_meta_dict = {}
+            self.__req_node_root = ReqNode('New Requirement')
+            return False
+        finally:
+            pass
+
+        self.ob_notifier.notify_req_loaded(self.req_full_path())
+        return True
+
+    def __do_close(self):
+        if self.__connection is not None:
+            editing_file = self.req_full_path()
+
+            self.__connection.close()
+            self.__connection = None
+
+            self.__req_file_name = ''
+            self.__req_meta_dict = {}
+            self.__req_node_root = None
+
+            self.__req_id_max = {}
+            self.__uuid_node_index = {}
+
+            self.ob_notifier.notify_req_closed(editing_file)
+
+    def __load_children(self, parent_node: ReqNode) -> List[ReqNode]:
+        return self.__load_nodes('parent_uuid = ? ORDER BY sibling_order', (parent_node.get_uuid(),))
+
+    def __load_nodes(self, condition: str, params: tuple) -> List[ReqNode]:
+        nodes = []
+        for data, child_count in self.__read_node_rows(condition, params):
+            node = ReqNode.create_from_dict(data)
+            if child_count > 0:
+                node.set_children_loader(self.__load_children, child_count)
+            self.__uuid_node_index[node.get_uuid()] = node
+            nodes.append(node)
+        return nodes
+
+    def __read_node_rows(self, condition: str, params: tuple) -> List[tuple]:
+        """
+        :return: [(node data without children, child count)]
+        """
+        rows = self.__connection.execute(f'{NODE_SELECT_SQL} WHERE {condition}', params).fetchall()
+
+        node_meta = {}
+        if len(rows) > 0:
+            uuids = [row[0] for row in rows]
+            place_holders = ', '.join(['?'] * len(uuids))
+            for _uuid, key, value in self.__connection.execute(
+                    f'SELECT uuid, key, value FROM req_node_meta WHERE uuid IN ({place_holders})', uuids):
+                node_meta.setdefault(_uuid, {})[key] = json.loads(value)
+
+        return [(ReqSQLiteAgent.__row_to_data(row[0], list(row[1:7]), node_meta.get(row[0], {})), row[7])
+                for row in rows]
+
+    def __index_node(self, node: ReqNode):
+        self.__uuid_node_index[node.get_uuid()] = node
+        req_id = node.get(STATIC_FIELD_ID, '') or ''
+        id_prefixes = self.__req_meta_dict.get(STATIC_META_ID_PREFIX, [])
+        for prefix, id_num in IReqAgent.calculate_max_req_id(id_prefixes, [req_id.strip()]).items():
+            self.__req_id_max[prefix] = max(id_num, self.__req_id_max.get(prefix, 0))
+
+    def __unindex_node(self, node: ReqNode):
+        if self.__uuid_node_index.get(node.get_uuid(), None) is node:
+            del self.__uuid_node_index[node.get_uuid()]
+
+    def __calculate_req_id_max(self):
+        req_ids = [row[0].strip() for row in self.__connection.execute(
+            "SELECT id FROM req_node WHERE id IS NOT NULL AND id != ''")]
+        id_prefixes = self.__req_meta_dict.get(STATIC_META_ID_PREFIX, [])
+        self.__req_id_max = IReqAgent.calculate_max_req_id(id_prefixes, req_ids)
+
+    # ----------------------------------- Rows -----------------------------------
+
+    @contextlib.contextmanager
+    def __transaction(self):
+        """
+        Commit the statements on exit or roll back them on exception.
+            In batch, only roll back the failed operation. The batch is committed by on_batch_commit().
+        """
+        if not self.in_batch():
+            with self.__connection:
+                yield self.__connection
+            return
+        self.__connection.execute('SAVEPOINT req_operation')
+        try:
+            yield self.__connection
+        except Exception:
+            self.__connection.execute('ROLLBACK TO req_operation')
+            raise
+        finally:
+            self.__connection.execute('RELEASE req_operation')
+
+    @staticmethod
+    def __connect(req_file: str) -> sqlite3.Connection:
+        connection = sqlite3.connect(req_file)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.executescript(SCHEMA_SQL)
+        return connection
+
+    @staticmethod
+    def __row_to_data(_uuid: str, column_values: list, meta: dict) -> dict:
+        """
+        :param column_values: [id, title, content, last_editor, last_change_time, field_order]
+        """
+        columns = dict(zip(NODE_COLUMN_FIELDS, column_values[:len(NODE_COLUMN_FIELDS)]))
+        field_order = column_values[len(NODE_COLUMN_FIELDS)]
+        field_order = json.loads(field_order) if field_order else \
+            [k for k in STATIC_FIELDS if k != STATIC_FIELD_CHILD] + list(meta.keys())
+
+        data = {}
+        for key in field_order:
+            if key == STATIC_FIELD_UUID:
+                data[key] = _uuid
+            elif key in columns:
+                if columns[key] is not None:
+                    data[key] = columns[key]
+            elif key in meta:
+                data[key] = meta[key]
+        return data
+
+    @staticmethod
+    def __data_to_row(data: dict) -> tuple:
+        columns = tuple(data.get(key, None) for key in NODE_COLUMN_FIELDS)
+        field_order = json.dumps([k for k in data.keys() if k != STATIC_FIELD_CHILD], ensure_ascii=False)
+        meta = [(k, json.dumps(v, ensure_ascii=False)) for k, v in data.items()
+                if k not in NODE_COLUMN_FIELDS and k != STATIC_FIELD_UUID and k != STATIC_FIELD_CHILD]
+        return columns + (field_order, ), meta
+
+    @staticmethod
+    def __insert_data_row(connection: sqlite3.Connection, parent_uuid: str, order: int, data: dict):
+        _uuid = data.get(STATIC_FIELD_UUID, '')
+        columns, meta = ReqSQLiteAgent.__data_to_row(data)
+        connection.execute('INSERT OR REPLACE INTO req_node (uuid, parent_uuid, sibling_order, id, title, content, '
+                           'last_editor, last_change_time, field_order) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                           (_uuid, parent_uuid if parent_uuid != '' else None, order) + columns)
+        connection.executemany('INSERT OR REPLACE INTO req_node_meta (uuid, key, value) VALUES (?, ?, ?)',
+                               [(_uuid, k, v) for k, v in meta])
+
+    @staticmethod
+    def __insert_node_rows(connection: sqlite3.Connection, parent_uuid: str, order: int, node: ReqNode):
+        ReqSQLiteAgent.__insert_data_row(connection, parent_uuid, order, node.data())
+        for child_order, child in enumerate(node.children()):
+            ReqSQLiteAgent.__insert_node_rows(connection, node.get_uuid(), child_order, child)
+
+    @staticmethod
+    def __insert_dict_rows(connection: sqlite3.Connection, root_dict: dict):
+        # Iterative to support deep requirement tree.
+        stack = [('', 0, root_dict)]
+        while len(stack) > 0:
+            parent_uuid, order, data = stack.pop()
+            if not data.get(STATIC_FIELD_UUID, ''):
+                # Because of old issue, the uuid may be missing. Fix it on import.
+                data[STATIC_FIELD_UUID] = str(uuid.uuid4().hex)
+            ReqSQLiteAgent.__insert_data_row(connection, parent_uuid, order, data)
+            for child_order, child_dict in enumerate(data.get(STATIC_FIELD_CHILD, [])):
+                stack.append((data.get(STATIC_FIELD_UUID, ''), child_order, child_dict))
+
+    @staticmethod
+    def __update_node_row(connection: sqlite3.Connection, node: ReqNode):
+        _uuid = node.get_uuid()
+        columns, meta = ReqSQLiteAgent.__data_to_row(node.data())
+        connection.execute('UPDATE req_node SET id = ?, title = ?, content = ?, last_editor = ?, last_change_time = ?, '
+                           'field_order = ? WHERE uuid = ?', columns + (_uuid, ))
+        connection.execute('DELETE FROM req_node_meta WHERE uuid = ?', (_uuid, ))
+        connection.executemany('INSERT INTO req_node_meta (uuid, key, value) VALUES (?, ?, ?)',
+                               [(_uuid, k, v) for k, v in meta])
+
+    @staticmethod
+    def __strip_ext(file_name: str) -> str:
+        return file_name[:-len(REQ_SQLITE_EXT)] if file_name.lower().endswith(REQ_SQLITE_EXT) else file_name
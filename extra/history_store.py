@@ -0,0 +1,397 @@
+"""
+HistoryStore - The version history of a file, stored as compressed snapshots and deltas.
+
+Each saved content is a version. A version is stored as a delta against a snapshot (the keyframe) instead of a copy:
+    - The snapshots and deltas are zlib compressed objects named by the sha256 of their content. The same content is
+      stored only once.
+    - The delta of a version is against the keyframe directly (not the previous version), so restoring any version
+      reads one snapshot and one delta.
+    - When the delta grows big (compared to the compressed keyframe), the version becomes a new keyframe.
+
+The old versions are thinned out by time buckets. By default: every version in the last hour, the latest version of
+    each hour in the last day, the latest version of each day in the last month. The latest version is always kept.
+
+Layout of the store directory:
+    index.json              - The version list.
+    objects/ab/ab12...      - The snapshot and delta objects.
+"""
+
+import os
+import json
+import time
+import zlib
+import hashlib
+import threading
+import traceback
+from typing import Dict, List, Tuple
+
+
+# (Max age in seconds, bucket size in seconds). The newest version of each bucket is kept. Bucket size 0 keeps all.
+# The versions older than the last rule are dropped.
+DEFAULT_RETENTION = ((3600, 0), (24 * 3600, 3600), (30 * 24 * 3600, 24 * 3600))
+
+# A version is saved as a new keyframe if its compressed delta is bigger than this ratio of the compressed keyframe.
+KEYFRAME_RATIO = 0.5
+
+# The content is split into lines for delta. The longer lines (e.g. compact json) are split after ',' further.
+MAX_LINE_PIECE = 256
+
+# The positions of a piece that are tried when looking for the longest match in keyframe.
+MAX_MATCH_CANDIDATES = 8
+
+# A match shorter than this (in pieces) and this (in bytes) is stored as literal. The copy op is not cheaper.
+MIN_MATCH_PIECES = 2
+MIN_MATCH_BYTES = 16
+
+
+def history_dir_of(file_path: str) -> str:
+    """
+    The default store directory of a file: history/<file name> beside the file.
+    """
+    file_path = os.path.abspath(file_path)
+    return os.path.join(os.path.dirname(file_path), 'history', os.path.basename(file_path))
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def split_pieces(data: bytes) -> List[bytes]:
+    """
+    :return: The pieces that b''.join() to data.
+    """
+    pieces = []
+    for line in data.splitlines(keepends=True):
+        if len(line) <= MAX_LINE_PIECE:
+            pieces.append(line)
+        else:
+            parts = line.split(b',')
+            pieces.extend(part + b',' for part in parts[:-1])
+            if parts[-1] != b'':
+                pieces.append(parts[-1])
+    return pieces
+
+
+def index_pieces(pieces: List[bytes]) -> Dict[bytes, List[int]]:
+    """
+    :return: piece -> The first MAX_MATCH_CANDIDATES positions of this piece.
+    """
+    piece_index = {}
+    for pos, piece in enumerate(pieces):
+        positions = piece_index.setdefault(piece, [])
+        if len(positions) < MAX_MATCH_CANDIDATES:
+            positions.append(pos)
+    return piece_index
+
+
+def match_length(base_pieces: List[bytes], start: int, pieces: List[bytes], pos: int, limit: int) -> int:
+    # Compare by slices of growing size. Most of the content is not changed, so the runs are long.
+    length = 0
+    step = 1
+    while step > 0 and length < limit:
+        step = min(step, limit - length)
+        if base_pieces[start + length:start + length + step] == pieces[pos + length:pos + length + step]:
+            length += step
+            step *= 2
+        else:
+            step //= 2
+    return length
+
+
+def make_delta(base_pieces: List[bytes], base_index: Dict[bytes, List[int]], data: bytes) -> list:
+    """
+    Build the delta from base to data in linear time, greedy by the longest match among a few candidates.
+    :return: The op list. [start, count] copies the pieces from base. A str is a literal (bytes decoded by latin-1).
+    """
+    pieces = split_pieces(data)
+    piece_count = len(pieces)
+    base_count = len(base_pieces)
+
+    ops = []
+    literal = []
+    # The run of the previous copy probably continues after a changed piece. Try there first.
+    next_base = 0
+    pos = 0
+    while pos < piece_count:
+        piece = pieces[pos]
+        best_start, best_length = -1, 0
+        candidates = [next_base, next_base + len(literal)] + base_index.get(piece, [])
+        for start in candidates:
+            length = match_length(base_pieces, start, pieces, pos, min(base_count - start, piece_count - pos))
+            if length > best_length:
+                best_start, best_length = start, length
+
+        if best_length >= MIN_MATCH_PIECES or (best_length == 1 and len(piece) >= MIN_MATCH_BYTES):
+            if len(literal) > 0:
+                ops.append(b''.join(literal).decode('latin-1'))
+                literal = []
+            ops.append([best_start, best_length])
+            next_base = best_start + best_length
+            pos += best_length
+        else:
+            literal.append(piece)
+            pos += 1
+    if len(literal) > 0:
+        ops.append(b''.join(literal).decode('latin-1'))
+    return ops
+
+
+def apply_delta(base_pieces: List[bytes], ops: list) -> bytes:
+    return b''.join(op.encode('latin-1') if isinstance(op, str) else b''.join(base_pieces[op[0]:op[0] + op[1]])
+                    for op in ops)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+class HistoryStore:
+    def __init__(self, store_dir: str, retention: Tuple[Tuple[int, int], ...] = DEFAULT_RETENTION):
+        self.__store_dir = store_dir
+        self.__retention = retention
+        self.__lock = threading.Lock()
+
+        # Version entry: {'version': int, 'time': float, 'hash': content sha256, 'size': content size,
+        #                 'snapshot': keyframe object id, 'delta': delta object id or '' if it's the keyframe itself}
+        self.__versions: List[dict] = []
+        self.__next_version = 1
+
+        # The keyframe of the latest version. The new version is diffed against it.
+        #   (object id, pieces, piece index)
+        self.__keyframe_cache: Tuple[str, List[bytes], Dict[bytes, List[int]]] or None = None
+
+        self.__load_index()
+
+    # ------------------------------------- Method -------------------------------------
+
+    def versions(self) -> List[dict]:
+        """
+        :return: [{'version': int, 'time': float, 'size': int}] from the oldest to the latest.
+        """
+        with self.__lock:
+            return [{'version': entry['version'], 'time': entry['time'], 'size': entry['size']}
+                    for entry in self.__versions]
+
+    def latest_version(self) -> int:
+        """
+        :return: The latest version number. 0 if empty.
+        """
+        with self.__lock:
+            return self.__versions[-1]['version'] if len(self.__versions) > 0 else 0
+
+    def commit(self, data: bytes, timestamp: float = None) -> int:
+        """
+        Add a version. Nothing is added if the content is the same as the latest version.
+        :return: The version number of this content.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        content_hash = hashlib.sha256(data).hexdigest()
+
+        with self.__lock:
+            if len(self.__versions) > 0 and self.__versions[-1]['hash'] == content_hash:
+                return self.__versions[-1]['version']
+
+            entry = {'version': self.__next_version, 'time': timestamp, 'hash': content_hash, 'size': len(data)}
+            keyframe = self.__latest_keyframe()
+            delta_object = None
+            if keyframe is not None:
+                snapshot_id, base_pieces, base_index = keyframe
+                delta_object = zlib.compress(json.dumps(make_delta(base_pieces, base_index, data)).encode('utf-8'))
+                if len(delta_object) > self.__object_size(snapshot_id) * KEYFRAME_RATIO:
+                    delta_object = None
+
+            if delta_object is not None:
+                entry['snapshot'] = keyframe[0]
+                entry['delta'] = self.__write_object(delta_object)
+            else:
+                entry['snapshot'] = self.__write_object(zlib.compress(data))
+                entry['delta'] = ''
+                pieces = split_pieces(data)
+                self.__keyframe_cache = (entry['snapshot'], pieces, index_pieces(pieces))
+
+            self.__versions.append(entry)
+            self.__next_version += 1
+            dropped_objects = self.__prune(timestamp)
+            self.__save_index()
+            self.__remove_objects(dropped_objects)
+            return entry['version']
+
+    def commit_file(self, file_path: str) -> int:
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        return self.commit(data)
+
+    def restore(self, version: int) -> bytes or None:
+        """
+        :return: The content of the version. None if the version is not found or broken.
+        """
+        with self.__lock:
+            entry = next((entry for entry in self.__versions if entry['version'] == version), None)
+            if entry is None:
+                print(f'HistoryStore: Version {version} not found.')
+                return None
+            try:
+                if entry['delta'] == '':
+                    data = self.__read_object(entry['snapshot'])
+                else:
+                    ops = json.loads(self.__read_object(entry['delta']).decode('utf-8'))
+                    if self.__keyframe_cache is not None and self.__keyframe_cache[0] == entry['snapshot']:
+                        base_pieces = self.__keyframe_cache[1]
+                    else:
+                        base_pieces = split_pieces(self.__read_object(entry['snapshot']))
+                    data = apply_delta(base_pieces, ops)
+            except Exception as e:
+                print(str(e))
+                print(traceback.format_exc())
+                return None
+            finally:
+                pass
+            if hashlib.sha256(data).hexdigest() != entry['hash']:
+                print(f'HistoryStore: Version {version} is broken.')
+                return None
+            return data
+
+    def restore_to_file(self, version: int, file_path: str) -> bool:
+        data = self.restore(version)
+        if data is None:
+            return False
+        with open(file_path, 'wb') as f:
+            f.write(data)
+        return True
+
+    def prune(self, now: float = None):
+        """
+        Drop the versions by retention. It's done on each commit.
+        """
+        with self.__lock:
+            dropped_objects = self.__prune(time.time() if now is None else now)
+            self.__save_index()
+            self.__remove_objects(dropped_objects)
+
+    # ------------------------------------- Private ------------------------------------
+
+    def __prune(self, now: float) -> List[str]:
+        """
+        Drop the versions by retention.
+        :return: The objects that no kept version refers to. Remove them after the index is saved,
+                    so the saved index never refers to a removed object.
+        """
+        keep_versions = []
+        seen_buckets = set()
+        for pos, entry in enumerate(reversed(self.__versions)):
+            age = now - entry['time']
+            rule = next((rule for rule in enumerate(self.__retention) if age < rule[1][0]), None)
+            if rule is None:
+                keep = False
+            else:
+                rule_index, (_, bucket_size) = rule
+                bucket = (rule_index, int(entry['time'] // bucket_size)) if bucket_size > 0 else None
+                keep = bucket is None or bucket not in seen_buckets
+                seen_buckets.add(bucket)
+            # The latest version is always kept.
+            if keep or pos == 0:
+                keep_versions.append(entry)
+        if len(keep_versions) == len(self.__versions):
+            return []
+        keep_versions.reverse()
+
+        referred = {entry['snapshot'] for entry in keep_versions} | {entry['delta'] for entry in keep_versions}
+        dropped_objects = []
+        for entry in self.__versions:
+            for object_id in (entry['snapshot'], entry['delta']):
+                if object_id != '' and object_id not in referred:
+                    referred.add(object_id)
+                    dropped_objects.append(object_id)
+        self.__versions = keep_versions
+        return dropped_objects
+
+    def __latest_keyframe(self) -> Tuple[str, List[bytes], Dict[bytes, List[int]]] or None:
+        if len(self.__versions) == 0:
+            return None
+        snapshot_id = self.__versions[-1]['snapshot']
+        if self.__keyframe_cache is None or self.__keyframe_cache[0] != snapshot_id:
+            try:
+                pieces = split_pieces(self.__read_object(snapshot_id))
+            except Exception as e:
+                print(str(e))
+                print('HistoryStore: Keyframe is not readable. Save a new one.')
+                return None
+            finally:
+                pass
+            self.__keyframe_cache = (snapshot_id, pieces, index_pieces(pieces))
+        return self.__keyframe_cache
+
+    # -------------------------------------- Object ------------------------------------
+
+    def __object_path(self, object_id: str) -> str:
+        return os.path.join(self.__store_dir, 'objects', object_id[:2], object_id)
+
+    def __write_object(self, compressed_data: bytes) -> str:
+        object_id = hashlib.sha256(compressed_data).hexdigest()
+        object_path = self.__object_path(object_id)
+        if not os.path.isfile(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            HistoryStore.__write_file_atomic(object_path, compressed_data)
+        return object_id
+
+    def __read_object(self, object_id: str) -> bytes:
+        with open(self.__object_path(object_id), 'rb') as f:
+            return zlib.decompress(f.read())
+
+    def __object_size(self, object_id: str) -> int:
+        return os.path.getsize(self.__object_path(object_id))
+
+    def __remove_objects(self, object_ids: List[str]):
+        for object_id in object_ids:
+            try:
+                os.remove(self.__object_path(object_id))
+            except OSError as e:
+                print(str(e))
+            finally:
+                pass
+
+    # -------------------------------------- Index -------------------------------------
+
+    def __index_path(self) -> str:
+        return os.path.join(self.__store_dir, 'index.json')
+
+    def __load_index(self):
+        if not os.path.isfile(self.__index_path()):
+            return
+        try:
+            with open(self.__index_path(), 'rt', encoding='utf-8') as f:
+                index = json.load(f)
+            self.__versions = index.get('versions', [])
+            self.__next_version = index.get('next_version', len(self.__versions) + 1)
+        except Exception as e:
+            print(str(e))
+            print(f'HistoryStore: Index broken. Start a new history in {self.__store_dir}')
+        finally:
+            pass
+
+    def __save_index(self):
+        os.makedirs(self.__store_dir, exist_ok=True)
+        index_text = json.dumps({'next_version': self.__next_version, 'versions': self.__versions}, indent=4)
+        HistoryStore.__write_file_atomic(self.__index_path(), index_text.encode('utf-8'))
+
+    @staticmethod
+    def __write_file_atomic(file_path: str, data: bytes):
+        # Sync the file and the rename. The objects must be on disk before the index that refers to them.
+        temp_path = file_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, file_path)
+        HistoryStore.__fsync_dir(os.path.dirname(os.path.abspath(file_path)))
+
+    @staticmethod
+    def __fsync_dir(dir_path: str):
+        # Not supported on Windows.
+        if hasattr(os, 'O_DIRECTORY'):
+            try:
+                fd = os.open(dir_path, os.O_RDONLY | os.O_DIRECTORY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except Exception as e:
+                print(f'HistoryStore: Sync dir fail: {str(e)}')
+            finally:
+                pass
@@ -129,8 +129,9 @@ def search_req_nodes(text: str, top_k: int) -> List[ReqNode]:
     nodes = []
     result = emb_index.search(text, top_k)
     for distance, index in result:
-        filter_nodes = req_agent.get_req_root().filter(lambda x: x.get_uuid() == index)
-        nodes.extend(filter_nodes)
+        node = req_agent.get_req_node(index)
+        if node is not None:
+            nodes.append(node)
     return nodes
 
 
@@ -143,9 +144,9 @@ def on_embedding_search():
         default_index_window.clear_index()
 
         for distance, index in result:
-            filter_nodes = req_agent.get_req_root().filter(lambda x: x.get_uuid() == index)
-            if len(filter_nodes) > 0:
-                default_index_window.append_index(filter_nodes[0].get_title(), filter_nodes[0].get_uuid())
+            node = req_agent.get_req_node(index)
+            if node is not None:
+                default_index_window.append_index(node.get_title(), node.get_uuid())
                 default_index_window.show_right_bottom()
 
 
@@ -6,7 +6,7 @@ from PyQt5.QtCore import QTimer
 from PyQt5.QtGui import QFont
 from PyQt5.QtWidgets import QPushButton, QApplication, QMainWindow, QTextEdit
 from FreeReq import IReqAgent, RequirementUI, IReqObserver
-from extra.file_backup import backup_file
+from extra.history_store import HistoryStore, history_dir_of
 
 # ----------------------------------------------------------------------------------------------------------------------
 
@@ -19,10 +19,30 @@ req_agent: IReqAgent = None
 class ReqHistory(IReqObserver):
     def __init__(self):
         super(ReqHistory, self).__init__()
+        # req file path -> Its history. The versions are kept in history/<req file name> beside the req file.
+        self.__history_stores: Dict[str, HistoryStore] = {}
+
+    def history_of(self, req_uri: str) -> HistoryStore:
+        req_uri = os.path.abspath(req_uri)
+        if req_uri not in self.__history_stores:
+            self.__history_stores[req_uri] = HistoryStore(history_dir_of(req_uri))
+        return self.__history_stores[req_uri]
+
+    def restore_version(self, req_uri: str, version: int, file_path: str) -> bool:
+        """
+        Write the version of req to file_path. Restore to a new file and open it, the editing req is not touched.
+        """
+        return self.history_of(req_uri).restore_to_file(version, file_path)
 
     def on_req_saved(self, req_uri: str):
         if os.path.isfile(req_uri):
-            backup_file(req_uri, 30)
+            try:
+                self.history_of(req_uri).commit_file(req_uri)
+            except Exception as e:
+                print(str(e))
+                print(f'ReqHistory: Save history of {req_uri} fail.')
+            finally:
+                pass
         else:
             print(f'ReqHistory: {req_uri} is not a local file.')
 
@@ -104,10 +124,15 @@ def plugin_capacities() -> List[str]:
 
 # ----------------------------------------------------------------------------------------------------------------------
 
+req_history: ReqHistory = None
+
+
 def req_agent_prepared(req: IReqAgent):
     global req_agent
+    global req_history
     req_agent = req
-    req_agent.add_observer(ReqHistory())
+    req_history = ReqHistory()
+    req_agent.add_observer(req_history)
 
 
 def after_ui_created(req_ui: RequirementUI):
@@ -0,0 +1,28 @@
+import os
+import sys
+import shutil
+
+import pytest
+
+# Run the Qt widgets headless.
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_PATH)
+
+
+@pytest.fixture(scope='session')
+def qt_app():
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    yield app
+
+
+@pytest.fixture
+def req_file(tmp_path):
+    # A copy of the example req. The agent changes the current path to the req path.
+    cwd = os.getcwd()
+    req_file = str(tmp_path / 'FreeReq.req')
+    shutil.copy(os.path.join(REPO_PATH, 'FreeReq.req'), req_file)
+    yield req_file
+    os.chdir(cwd)
@@ -0,0 +1,40 @@
+import os
+
+from FreeReq import ReqSingleJsonFileAgent, REQ_JOURNAL_SUFFIX, export_req
+
+
+def read_bytes(file_path: str) -> bytes:
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+
+def test_export_keeps_req_and_journal(req_file, tmp_path):
+    # Leave a journal as if the editor crashed before folding it into the req file.
+    agent = ReqSingleJsonFileAgent(os.path.dirname(req_file))
+    agent.init()
+    agent.enable_journal(True)
+    agent.open_req(req_file)
+    update_node = agent.get_req_root().child(0).clone()
+    update_node.set_title('Title in journal only')
+    agent.update_node(update_node)
+
+    journal_file = req_file + REQ_JOURNAL_SUFFIX
+    req_data = read_bytes(req_file)
+    journal_data = read_bytes(journal_file)
+
+    output = str(tmp_path / 'export.md')
+    assert export_req(req_file, output)
+
+    # The journal is replayed for exporting, but nothing is written back.
+    with open(output, 'rt', encoding='utf-8') as f:
+        assert 'Title in journal only' in f.read()
+    assert read_bytes(req_file) == req_data
+    assert read_bytes(journal_file) == journal_data
+
+
+def test_export_keeps_empty_journal(req_file, tmp_path):
+    journal_file = req_file + REQ_JOURNAL_SUFFIX
+    with open(journal_file, 'wt', encoding='utf-8'):
+        pass
+    assert export_req(req_file, str(tmp_path / 'export.md'))
+    assert os.path.exists(journal_file)
@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from extra.history_store import HistoryStore
+
+
+DAY = 24 * 3600
+
+
+def make_content(version: int) -> bytes:
+    return ''.join(f'line {i} of version {version}\n' for i in range(200)).encode('utf-8')
+
+
+def test_commit_and_restore(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    versions = [store.commit(make_content(i)) for i in range(5)]
+    assert versions == [1, 2, 3, 4, 5]
+    # Reopen from disk.
+    store = HistoryStore(str(tmp_path))
+    for i, version in enumerate(versions):
+        assert store.restore(version) == make_content(i)
+
+
+def test_crash_before_index_saved_keeps_objects(tmp_path, monkeypatch):
+    now = 100 * DAY
+    store = HistoryStore(str(tmp_path))
+    # Each in its own day. Only the latest survives the pruning 60 days later.
+    for i in range(3):
+        store.commit(make_content(i), timestamp=now + i * DAY)
+
+    # Crash on saving the index of the next commit, which prunes the old versions.
+    real_replace = os.replace
+
+    def crash_on_index(src, dst):
+        if os.path.basename(dst) == 'index.json':
+            raise OSError('Crash')
+        real_replace(src, dst)
+
+    monkeypatch.setattr(os, 'replace', crash_on_index)
+    with pytest.raises(OSError):
+        store.commit(make_content(3), timestamp=now + 60 * DAY)
+    monkeypatch.setattr(os, 'replace', real_replace)
+
+    # The saved index is the old one. All its versions are still restorable.
+    store = HistoryStore(str(tmp_path))
+    assert [entry['version'] for entry in store.versions()] == [1, 2, 3]
+    for i in range(3):
+        assert store.restore(i + 1) == make_content(i)
+
+
+def test_prune_removes_unreferred_objects(tmp_path):
+    now = 100 * DAY
+    store = HistoryStore(str(tmp_path))
+    for i in range(3):
+        store.commit(make_content(i * 1000), timestamp=now + i * DAY)
+    store.prune(now + 60 * DAY)
+
+    assert [entry['version'] for entry in store.versions()] == [3]
+    assert store.restore(3) == make_content(2000)
+    object_files = [name for _, _, names in os.walk(tmp_path / 'objects') for name in names]
+    assert len(object_files) <= 2
@@ -0,0 +1,19 @@
+from FreeReq import HtmlImageEmbedder
+
+PNG_DATA = b'\x89PNG\r\n\x1a\n' + b'\x00' * 16
+
+
+def test_embed_src_not_data_src(tmp_path):
+    (tmp_path / 'b.png').write_bytes(PNG_DATA)
+    html_text = '<p><img data-src="a.png" src="b.png"></p>'
+    embedded = HtmlImageEmbedder().embed(html_text, str(tmp_path))
+    assert 'data-src="a.png"' in embedded
+    assert 'src="data:image/png;base64,' in embedded
+    assert 'b.png' not in embedded
+
+
+def test_embed_quoted_and_unquoted_src(tmp_path):
+    (tmp_path / 'b.png').write_bytes(PNG_DATA)
+    html_text = "<img src='b.png'><IMG alt=x SRC=b.png>"
+    embedded = HtmlImageEmbedder().embed(html_text, str(tmp_path))
+    assert embedded.count('data:image/png;base64,') == 2
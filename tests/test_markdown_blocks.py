@@ -0,0 +1,39 @@
+import re
+
+import pytest
+
+from FreeReq import HTML_TEMPLATE, MARK_DOWN_CSS_TABLE, split_markdown_blocks, render_markdown_blocks, \
+    render_markdown
+
+MARKDOWN_CASES = {
+    'html table': 'intro\n\n<table>\n<tr><td>a</td></tr>\n\n<tr><td>b</td></tr>\n</table>\n\nafter',
+    'html details': '<details>\n<summary>More</summary>\n\ninner *text*\n\n</details>\n\ntext',
+    'html div': '<div>\n\nhello\n\n</div>',
+    'blockquote': '> para 1\n>\n> para 2\n\n> para 3\n\nout',
+    'list': '- a\n\n  continued\n\n- b\n\n1. x\n\n2. y\n\nparagraph',
+    'nested list': '* a\n\n    * b\n\n        deep\n\ntext',
+    'list with fence': '- a\n\n  ```\n  code\n\n  more\n  ```\n\n- b',
+    'indented code': 'para\n\n    code 1\n\n    code 2\n\nafter',
+    'mixed': '# Header\n\ntext\n\n```\ncode\n\nmore\n```\n\n| a | b |\n|---|---|\n| 1 | 2 |\n\n---\n\nend',
+}
+
+
+def normalize(html_text: str) -> str:
+    # The blocks are rendered separately. The whitespace between tags differs.
+    return re.sub(r'>\s+<', '><', html_text).strip()
+
+
+@pytest.mark.parametrize('md_text', MARKDOWN_CASES.values(), ids=MARKDOWN_CASES.keys())
+def test_block_render_equals_full_render(md_text):
+    md_blocks = split_markdown_blocks(md_text)
+    if md_blocks is None:
+        # Fall back to the full render.
+        return
+    fragments = [html_text for _, html_text in render_markdown_blocks(md_blocks)]
+    block_html = HTML_TEMPLATE.format(css=MARK_DOWN_CSS_TABLE, content=''.join(fragments))
+    assert normalize(block_html) == normalize(render_markdown(md_text))
+
+
+@pytest.mark.parametrize('case', ['html table', 'html details', 'html div'])
+def test_html_block_falls_back(case):
+    assert split_markdown_blocks(MARKDOWN_CASES[case]) is None
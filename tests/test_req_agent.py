@@ -0,0 +1,118 @@
+import os
+import queue
+import threading
+
+import pytest
+
+from FreeReq import ReqSingleJsonFileAgent, ObserverNotifier, STATIC_FIELD_ID
+
+
+class ThreadRecorder:
+    def __init__(self):
+        self.calls = []
+
+    def on_req_saved(self, req_uri: str):
+        self.calls.append(('req_saved', threading.current_thread()))
+
+    def on_req_exception(self, exception_name: str, **kwargs):
+        self.calls.append((exception_name, threading.current_thread()))
+
+
+def test_notify_from_other_thread_is_dispatched():
+    pending = queue.Queue()
+    recorder = ThreadRecorder()
+    notifier = ObserverNotifier()
+    notifier.add_observer(recorder)
+    notifier.set_dispatcher(pending.put)
+
+    # The notification in the dispatcher thread is delivered directly.
+    notifier.notify_req_saved('a.req')
+    assert recorder.calls == [('req_saved', threading.current_thread())]
+
+    worker = threading.Thread(target=notifier.notify_req_saved, args=('a.req', ))
+    worker.start()
+    worker.join()
+    assert len(recorder.calls) == 1
+
+    pending.get_nowait()()
+    assert recorder.calls[-1] == ('req_saved', threading.current_thread())
+
+
+def test_save_notifications_in_owner_thread(req_file):
+    pending = queue.Queue()
+    recorder = ThreadRecorder()
+    agent = ReqSingleJsonFileAgent(os.path.dirname(req_file))
+    agent.init()
+    agent.set_notify_dispatcher(pending.put)
+    agent.add_observer(recorder)
+    agent.open_req(req_file)
+
+    # Change the req file outside, so the saving thread switches to a conflict file.
+    with open(req_file, 'at', encoding='utf-8') as f:
+        f.write('\n')
+    update_node = agent.get_req_root().child(0).clone()
+    update_node.set_title('Title changed')
+    agent.update_node(update_node)
+    # Wait for the saving thread.
+    agent.check_req_consistency()
+    assert agent.req_full_path().endswith('.conflict')
+
+    while not pending.empty():
+        pending.get_nowait()()
+    assert [name for name, _ in recorder.calls] == ['conflict', 'req_saved']
+    assert all(thread is threading.current_thread() for _, thread in recorder.calls)
+
+
+def test_update_node_in_place_changes_req_id(req_file):
+    agent = ReqSingleJsonFileAgent(os.path.dirname(req_file))
+    agent.init()
+    agent.open_req(req_file)
+    req_id_index = agent._ReqSingleJsonFileAgent__req_id_node_index
+
+    node = agent.get_req_root().child(0)
+    old_req_id = node.get(STATIC_FIELD_ID)
+    assert req_id_index[old_req_id] is node
+
+    node.set(STATIC_FIELD_ID, old_req_id + '_NEW')
+    agent.update_node(node)
+    assert old_req_id not in req_id_index
+    assert req_id_index[old_req_id + '_NEW'] is node
+
+    # Then remove the node. No index is left for both the old and new Req ID.
+    agent.remove_node(node.get_uuid())
+    assert old_req_id not in req_id_index
+    assert old_req_id + '_NEW' not in req_id_index
+
+
+@pytest.mark.parametrize('fsync', [True, False])
+def test_journal_fsync(req_file, monkeypatch, fsync):
+    synced = []
+    monkeypatch.setattr(os, 'fsync', lambda fd: synced.append(fd))
+
+    agent = ReqSingleJsonFileAgent(os.path.dirname(req_file))
+    agent.init()
+    agent.enable_journal(True, fsync=fsync)
+    agent.open_req(req_file)
+    update_node = agent.get_req_root().child(0).clone()
+    update_node.set_title('Title in journal')
+    agent.update_node(update_node)
+    assert len(synced) == (1 if fsync else 0)
+
+
+@pytest.mark.parametrize('lazy_depth', [-1, 1])
+def test_get_req_node_by_id(req_file, lazy_depth):
+    agent = ReqSingleJsonFileAgent(os.path.dirname(req_file))
+    agent.init()
+    agent.set_lazy_loading(lazy_depth)
+    agent.open_req(req_file)
+
+    # A deep node. It's not built yet in lazy loading mode.
+    node = agent.get_req_node_by_id('WHAT00019')
+    assert node is not None and node.get_title() == 'Single Document Print'
+    assert agent.get_req_node_by_id('what00019') is None
+    assert agent.get_req_node_by_id('WHAT00019"') is None
+    assert agent.get_req_node_by_id('') is None
+
+    agent.remove_node(agent.get_req_node_by_id('WHAT00018').get_uuid())
+    assert agent.get_req_node_by_id('WHAT00018') is None
+    assert agent.get_req_node_by_id('WHAT00020') is None
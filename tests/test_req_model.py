@@ -0,0 +1,97 @@
+import os
+
+import pytest
+from PyQt5.QtCore import QModelIndex
+from PyQt5.QtTest import QAbstractItemModelTester
+
+from FreeReq import ReqSingleJsonFileAgent, ReqModel, ReqNode, ReqUndoStack
+
+
+@pytest.fixture
+def req_model(qt_app, req_file):
+    agent = ReqSingleJsonFileAgent(os.path.dirname(req_file))
+    agent.init()
+    agent.open_req(req_file)
+    model = ReqModel(agent)
+    agent.add_observer(model)
+    row_errors = []
+    watch_row_count(model, row_errors)
+    # Fails the test on the first inconsistency between the signals and the rows.
+    tester = QAbstractItemModelTester(model, QAbstractItemModelTester.FailureReportingMode.Fatal)
+    yield agent, model
+    del tester
+    assert row_errors == []
+
+
+def watch_row_count(model: ReqModel, row_errors: list):
+    # The tester fetches more rows in its rowsInserted handler, which hides the rows missing from rowCount().
+    #   Check the row count before it.
+    old_counts = []
+
+    def about_to_insert(parent, first, last):
+        old_counts.append(model.rowCount(parent))
+
+    def inserted(parent, first, last):
+        expected = old_counts.pop() + last - first + 1
+        if model.rowCount(parent) != expected:
+            row_errors.append(f'Inserted rows not counted: {model.rowCount(parent)} != {expected}')
+
+    def about_to_move(src_parent, first, last, dest_parent, dest_row):
+        old_counts.append(model.rowCount(dest_parent))
+
+    def moved(src_parent, first, last, dest_parent, dest_row):
+        expected = old_counts.pop() + (last - first + 1 if src_parent != dest_parent else 0)
+        if model.rowCount(dest_parent) != expected:
+            row_errors.append(f'Moved rows not counted: {model.rowCount(dest_parent)} != {expected}')
+
+    model.rowsAboutToBeInserted.connect(about_to_insert)
+    model.rowsInserted.connect(inserted)
+    model.rowsAboutToBeMoved.connect(about_to_move)
+    model.rowsMoved.connect(moved)
+
+
+def collapsed_leaf(agent: ReqSingleJsonFileAgent) -> ReqNode:
+    # A node without children. The view never fetched it.
+    return next(node for node in agent.get_req_root().child(0).children() if node.child_count() == 0)
+
+
+def assert_rows_match(model: ReqModel, node: ReqNode):
+    index = model.index_of_node(node) if node.parent() is not None else QModelIndex()
+    assert model.rowCount(index) == node.child_count()
+
+
+def test_insert_into_leaf(req_model):
+    agent, model = req_model
+    leaf = collapsed_leaf(agent)
+    model.insert_node_children(leaf, ReqNode('child'), -1)
+    assert_rows_match(model, leaf)
+    model.insert_node_children(leaf, ReqNode('child 2'), 0)
+    assert_rows_match(model, leaf)
+    assert [node.get_title() for node in leaf.children()] == ['child 2', 'child']
+
+
+def test_move_into_leaf(req_model):
+    agent, model = req_model
+    leaf = collapsed_leaf(agent)
+    moving = agent.get_req_root().child(1)
+    assert model.move_nodes([moving], leaf, -1)
+    assert_rows_match(model, leaf)
+    assert moving.parent() is leaf
+
+
+def test_undo_replay_into_leaf(req_model):
+    agent, model = req_model
+    undo_stack = ReqUndoStack(agent, model)
+    agent.add_observer(undo_stack)
+    model.set_undo_stack(undo_stack)
+
+    leaf = collapsed_leaf(agent)
+    child = ReqNode('child')
+    model.insert_node_children(leaf, child, -1)
+    model.remove_nodes([leaf])
+    assert undo_stack.undo() == 'Remove'
+    assert undo_stack.undo() == 'Insert'
+    assert_rows_match(model, leaf)
+    assert undo_stack.redo() == 'Insert'
+    assert_rows_match(model, leaf)
+    assert leaf.children() == [child]
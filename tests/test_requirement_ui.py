@@ -0,0 +1,87 @@
+import os
+
+import pytest
+from PyQt5.QtCore import QItemSelectionModel
+
+import FreeReq
+from FreeReq import ReqSingleJsonFileAgent, RequirementUI
+from extra.ReqSQLiteAgent import ReqSQLiteAgent
+
+
+@pytest.fixture
+def req_ui(qt_app, req_file):
+    agent = ReqSingleJsonFileAgent(os.path.dirname(req_file))
+    agent.init()
+    ui = RequirementUI(agent)
+    agent.open_req(req_file)
+    yield ui, agent
+    ui.close()
+
+
+def select_node(ui: RequirementUI, node):
+    index = ui._RequirementUI__req_model.index_of_node(node)
+    ui._RequirementUI__tree_requirements.selectionModel().select(
+        index, QItemSelectionModel.ClearAndSelect | QItemSelectionModel.Rows)
+
+
+@pytest.mark.parametrize('input_text, moved', [
+    ('WHY00018', True),
+    (' WHY00018 ', True),
+    ('why00018', False),
+    ('WHY00018"', False),
+    ('"', False),
+])
+def test_move_items_to_req_id(req_ui, monkeypatch, input_text, moved):
+    ui, agent = req_ui
+    messages = []
+    monkeypatch.setattr(FreeReq.QInputDialog, 'getText', lambda *args, **kwargs: (input_text, True))
+    monkeypatch.setattr(FreeReq.QMessageBox, 'information', lambda parent, title, text: messages.append(text))
+
+    node = agent.get_req_node_by_id('WHAT00019')
+    select_node(ui, node)
+    ui.on_requirement_tree_menu_move_items()
+
+    target = agent.get_req_node_by_id('WHY00018')
+    assert (node.parent() is target) == moved
+    assert len(messages) == (0 if moved else 1)
+
+
+class MemorySettings:
+    def __init__(self, *args):
+        self.values = {}
+
+    def value(self, key: str, default=None):
+        return self.values.get(key, default)
+
+    def setValue(self, key: str, value):
+        self.values[key] = value
+
+
+@pytest.mark.parametrize('agent_class, file_ext, other_ext', [
+    (ReqSingleJsonFileAgent, '.req', '.reqdb'),
+    (ReqSQLiteAgent, '.reqdb', '.req'),
+])
+def test_open_file_by_agent(qt_app, req_file, monkeypatch, agent_class, file_ext, other_ext):
+    agent = agent_class(os.path.dirname(req_file))
+    agent.init()
+    ui = RequirementUI(agent)
+
+    # A file of another agent, picked by "All files".
+    other_file = os.path.splitext(req_file)[0] + other_ext
+    filters = []
+    warnings = []
+
+    def get_open_file_name(parent, caption, directory, file_filter):
+        filters.append(file_filter)
+        return other_file, True
+
+    monkeypatch.setattr(FreeReq, 'QSettings', MemorySettings)
+    monkeypatch.setattr(FreeReq.QFileDialog, 'getOpenFileName', get_open_file_name)
+    monkeypatch.setattr(FreeReq.QMessageBox, 'warning', lambda parent, title, text: warnings.append(text))
+
+    ui.on_menu_open_local_file()
+    # Only the files that this agent opens are listed.
+    assert f'*{file_ext})' in filters[0] and f'*{other_ext})' not in filters[0]
+    # The file cannot be opened. Tell the user instead of leaving an empty tree silently.
+    assert len(warnings) == 1
+    ui.close()
@@ -0,0 +1,215 @@
+import os
+import sys
+import sqlite3
+import importlib.util
+
+import pytest
+
+import extra
+import FreeReq
+from FreeReq import ReqSingleJsonFileAgent, ReqNode
+from extra.ReqSQLiteAgent import ReqSQLiteAgent, REQ_SQLITE_EXT
+
+
+class NotifyRecorder:
+    def __init__(self):
+        self.calls = []
+
+    def on_req_saved(self, req_uri: str):
+        self.calls.append('req_saved')
+
+    def on_req_exception(self, exception_name: str, **kwargs):
+        self.calls.append(exception_name)
+
+    def on_node_structure_changed(self, req_name: str, parent_node, child_nodes, operation: str):
+        self.calls.append(operation)
+
+    def on_node_data_changed(self, req_name: str, node):
+        self.calls.append('data_changed')
+
+
+@pytest.fixture
+def sqlite_agent(req_file):
+    agent = ReqSQLiteAgent(os.path.dirname(req_file))
+    agent.init()
+    assert agent.import_req_json(req_file)
+    yield agent
+
+
+def db_file_of(req_file: str) -> str:
+    return os.path.splitext(req_file)[0] + REQ_SQLITE_EXT
+
+
+def reopen(req_file: str) -> ReqSQLiteAgent:
+    reopened = ReqSQLiteAgent(os.path.dirname(req_file))
+    reopened.init()
+    assert reopened.open_req(db_file_of(req_file))
+    return reopened
+
+
+def tree_of(node: ReqNode) -> tuple:
+    # Loads the whole tree.
+    return node.get_title(), [tree_of(child) for child in node.children()]
+
+
+def add_fail_trigger(req_file: str, sql: str):
+    connection = sqlite3.connect(db_file_of(req_file))
+    with connection:
+        connection.execute(sql)
+    connection.close()
+
+
+def read_bytes(file_path: str) -> bytes:
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+
+def test_import_export_round_trip(req_file, tmp_path):
+    # Save by the json agent first, so the req file is in the format (line ending) of this platform.
+    json_agent = ReqSingleJsonFileAgent(os.path.dirname(req_file))
+    json_agent.init()
+    json_agent.open_req(req_file)
+    assert json_agent.save_req()
+    json_agent.check_req_consistency()
+
+    agent = ReqSQLiteAgent(os.path.dirname(req_file))
+    agent.init()
+    assert agent.import_req_json(req_file)
+    export_file = str(tmp_path / 'export.req')
+    assert agent.export_req_json(export_file)
+    assert read_bytes(export_file) == read_bytes(req_file)
+
+
+def test_lazy_children(sqlite_agent):
+    root_node = sqlite_agent.get_req_root()
+    assert root_node.is_children_loaded()
+    top_node = root_node.child(0)
+    assert not top_node.is_children_loaded()
+
+    # The child count is known before loading.
+    child_count = top_node.child_count()
+    assert child_count > 0
+    assert not top_node.is_children_loaded()
+    assert len(top_node.children()) == child_count
+    assert top_node.is_children_loaded()
+
+    # A deep node is loaded with its ancestors on access.
+    deep_node = sqlite_agent.get_req_node_by_id('WHAT00019')
+    assert deep_node is not None and deep_node.get_title() == 'Single Document Print'
+
+
+def test_operations_kept_after_reopen(sqlite_agent, req_file):
+    parent_node = sqlite_agent.get_req_node_by_id('WHAT00018')
+    first_child = parent_node.child(0)
+
+    sqlite_agent.insert_node(parent_node.get_uuid(), 1, ReqNode('Inserted 1'))
+    sqlite_agent.insert_node(parent_node.get_uuid(), 0, [ReqNode('Inserted 2'), ReqNode('Inserted 3')])
+    sqlite_agent.remove_node(first_child.get_uuid())
+    sqlite_agent.shift_node(parent_node.child(0).get_uuid(), 2)
+    sqlite_agent.shift_node(parent_node.child(4).get_uuid(), -3)
+    expected = tree_of(sqlite_agent.get_req_root())
+
+    reopened = reopen(req_file)
+    assert tree_of(reopened.get_req_root()) == expected
+    assert [child.get_title() for child in reopened.get_req_node_by_id('WHAT00018').children()] == \
+           [child.get_title() for child in parent_node.children()]
+
+
+def test_failed_operation_in_batch_rolled_back(req_file):
+    agent = ReqSQLiteAgent(os.path.dirname(req_file))
+    agent.init()
+    assert agent.import_req_json(req_file)
+    add_fail_trigger(req_file, "CREATE TRIGGER fail_insert BEFORE INSERT ON req_node WHEN NEW.title = 'Fail' "
+                               "BEGIN SELECT RAISE(ABORT, 'Fail'); END")
+    recorder = NotifyRecorder()
+    agent.add_observer(recorder)
+
+    parent_node = agent.get_req_node_by_id('WHAT00018')
+    child_count = parent_node.child_count()
+    with agent.batch():
+        agent.insert_node(parent_node.get_uuid(), 0, ReqNode('Inserted 1'))
+        agent.insert_node(parent_node.get_uuid(), 1, [ReqNode('Inserted 2'), ReqNode('Fail')])
+        agent.insert_node(parent_node.get_uuid(), 1, ReqNode('Inserted 3'))
+
+    titles = [child.get_title() for child in parent_node.children()]
+    assert titles[:2] == ['Inserted 1', 'Inserted 3']
+    assert len(titles) == child_count + 2
+    assert recorder.calls.count('save_fail') == 1
+    assert recorder.calls.count('req_saved') == 1
+
+    reopened = reopen(req_file)
+    assert tree_of(reopened.get_req_root()) == tree_of(agent.get_req_root())
+
+
+def test_failed_update_and_remove_rolled_back(sqlite_agent, req_file):
+    add_fail_trigger(req_file, "CREATE TRIGGER fail_update BEFORE UPDATE ON req_node WHEN NEW.title = 'Fail' "
+                               "BEGIN SELECT RAISE(ABORT, 'Fail'); END")
+    add_fail_trigger(req_file, "CREATE TRIGGER fail_delete BEFORE DELETE ON req_node WHEN OLD.id = 'WHAT00020' "
+                               "BEGIN SELECT RAISE(ABORT, 'Fail'); END")
+    recorder = NotifyRecorder()
+    sqlite_agent.add_observer(recorder)
+
+    # Changed in place. The data is reloaded from database.
+    node = sqlite_agent.get_req_node_by_id('WHAT00019')
+    node.set_title('Fail')
+    sqlite_agent.update_node(node)
+    assert node.get_title() == 'Single Document Print'
+
+    update_node = sqlite_agent.get_req_node_by_id('WHAT00021').clone()
+    update_node.set_title('Fail')
+    sqlite_agent.update_node(update_node)
+    assert sqlite_agent.get_req_node_by_id('WHAT00021').get_title() == 'Batch Documents Print'
+
+    remove_node = sqlite_agent.get_req_node_by_id('WHAT00020')
+    parent_node = remove_node.parent()
+    order = remove_node.order()
+    sqlite_agent.remove_node(remove_node.get_uuid())
+    assert remove_node.parent() is parent_node and remove_node.order() == order
+
+    assert recorder.calls == ['save_fail'] * 3
+
+    reopened = reopen(req_file)
+    assert tree_of(reopened.get_req_root()) == tree_of(sqlite_agent.get_req_root())
+
+
+def test_agent_shares_main_module(qt_app, req_file, monkeypatch):
+    # Started as "python FreeReq.py", the module is __main__ rather than FreeReq.
+    spec = importlib.util.spec_from_file_location('FreeReqMain', FreeReq.__file__)
+    main_module = importlib.util.module_from_spec(spec)
+    monkeypatch.setitem(sys.modules, 'FreeReqMain', main_module)
+    spec.loader.exec_module(main_module)
+
+    monkeypatch.delitem(sys.modules, 'FreeReq')
+    monkeypatch.delitem(sys.modules, 'extra.ReqSQLiteAgent')
+    monkeypatch.setattr(extra, 'ReqSQLiteAgent', sys.modules['extra'].ReqSQLiteAgent)
+
+    class SQLiteConfig:
+        @staticmethod
+        def get(key: str, default=None):
+            return 'sqlite' if key == 'req_agent' else default
+
+    monkeypatch.setattr(main_module, 'easy_config', SQLiteConfig())
+    agent = main_module.create_req_agent()
+    assert sys.modules['FreeReq'] is main_module
+    assert type(agent).__name__ == 'ReqSQLiteAgent'
+
+    agent.init()
+    ui = main_module.RequirementUI(agent)
+    model = ui._RequirementUI__req_model
+    assert agent.import_req_json(req_file)
+    assert isinstance(agent.get_req_root(), main_module.ReqNode)
+    assert len(list(main_module.iterate_req_tree(agent.get_req_root()))) > 1
+
+    parent_node = agent.get_req_node_by_id('WHAT00018')
+    parent_index = model.index_of_node(parent_node)
+    while model.canFetchMore(parent_index):
+        model.fetchMore(parent_index)
+    row_count = model.rowCount(parent_index)
+    assert row_count == parent_node.child_count()
+    agent.insert_node(parent_node.get_uuid(), 0, main_module.ReqNode('Inserted'))
+    assert model.rowCount(parent_index) == row_count + 1
+
+    ui.search_tree('Inserted')
+    index_list = ui.sub_window_index['default'].index_list
+    assert [index_list.item(row, 0).text() for row in range(index_list.rowCount())] == ['Inserted']
+    ui.close()